@@ -0,0 +1,201 @@
+# backend/admission.py - Per-user rate limits and load shedding in front of the LLM stage
+"""
+Answering a question holds an OpenAI request for seconds, so without a
+limit one student hammering "regenerate", or a whole class asking at once,
+uses up the upstream concurrency and every request slows past its timeout.
+Two limits apply to answering a question:
+
+- Each user has a token bucket: CHAT_RATE_PER_MINUTE questions per minute
+  on average, with bursts of up to CHAT_RATE_BURST. Over the limit the
+  request gets 429 with Retry-After right away.
+- At most LLM_MAX_CONCURRENCY completions run at once. Further requests
+  wait in a FIFO queue of at most LLM_MAX_QUEUE, for at most
+  LLM_MAX_QUEUE_WAIT_SECONDS; beyond that they get 503 with Retry-After.
+  The slot is taken around the completion stage only (rag.py), inside
+  the single-flight leader: callers coalesced onto an identical question
+  in flight wait for its answer without a slot of their own.
+
+Overload therefore shows up as fast rejections while admitted requests
+keep their usual latency. The limits are per process: with several
+gunicorn workers (serve.py), the service-wide limit is the worker count
+times LLM_MAX_CONCURRENCY, and a user can reach a multiple of their rate.
+
+    CHAT_RATE_PER_MINUTE [20]    CHAT_RATE_BURST [5]
+    LLM_MAX_CONCURRENCY [16]     LLM_MAX_QUEUE [64]   LLM_MAX_QUEUE_WAIT_SECONDS [10]
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", 20))
+RATE_BURST = float(os.getenv("CHAT_RATE_BURST", 5))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 64))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", 10))
+# Buckets kept in memory; the least recently seen users are forgotten first
+MAX_TRACKED_USERS = int(os.getenv("CHAT_RATE_MAX_USERS", 100000))
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    "tutortron_admission_rejected_total",
+    "Requests turned away before reaching the model, by reason (rate_limited, queue_full, queue_timeout)",
+    ["reason"]
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "tutortron_admission_wait_seconds",
+    "Time admitted requests waited for an LLM slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+
+class Rejected(Exception):
+    """A request turned away; ``status`` is the HTTP status to answer with"""
+    status = 503
+
+    def __init__(self, message, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+        ADMISSION_REJECTED.labels(reason).inc()
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimited(Rejected):
+    status = 429
+
+
+class Overloaded(Rejected):
+    status = 503
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_TRACKED_USERS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, cost: float = 1.0):
+        """Take ``cost`` tokens from ``key``'s bucket or raise RateLimited"""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                rejected = None
+            else:
+                rejected = (cost - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if rejected is not None:
+            raise RateLimited("Too many questions; please wait before asking again", rejected, "rate_limited")
+
+    def refund(self, key, cost: float = 1.0):
+        """Give back tokens taken for a request that was turned away later"""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(self.burst, tokens + cost), updated)
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` holders at once; a bounded FIFO queue waits for a slot.
+
+    A released slot passes straight to the longest waiting request, so
+    waits stay in arrival order and bursts can't starve earlier requests.
+    """
+
+    def __init__(self, limit: int, max_queue: int, max_wait: float):
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.in_flight = 0
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._hold_seconds = 1.0
+
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self, queued: int) -> float:
+        return self._hold_seconds * (queued + 1) / self.limit
+
+    def check(self):
+        """Raise Overloaded if the queue is full, i.e. a request arriving now would be turned away"""
+        queued = len(self._waiters)
+        if queued >= self.max_queue and self.in_flight >= self.limit:
+            raise Overloaded("The AI tutor is busy; please try again shortly",
+                             self._retry_after(queued), "queue_full")
+
+    def acquire(self, patient: bool = False):
+        """Take a slot, waiting in the queue; raises Overloaded when the queue is full or the wait too long.
+
+        A ``patient`` caller (background work with its own concurrency cap)
+        is never turned away and waits as long as it takes.
+        """
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue and not patient:
+                raise Overloaded("The AI tutor is busy; please try again shortly",
+                                 self._retry_after(len(self._waiters)), "queue_full")
+            granted = threading.Event()
+            self._waiters.append(granted)
+        start = time.monotonic()
+        if not granted.wait(None if patient else self.max_wait):
+            with self._lock:
+                if not granted.is_set():
+                    self._waiters.remove(granted)
+                    raise Overloaded("The AI tutor is busy; please try again shortly",
+                                     self._retry_after(len(self._waiters)), "queue_timeout")
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+
+    def release(self, held_seconds: float = None):
+        with self._lock:
+            if held_seconds is not None:
+                self._hold_seconds += 0.1 * (held_seconds - self._hold_seconds)
+            if self._waiters:
+                self._waiters.popleft().set()  # the slot passes on; in_flight is unchanged
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, patient: bool = False):
+        self.acquire(patient)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+user_buckets = TokenBuckets(RATE_PER_MINUTE / 60.0, RATE_BURST)
+llm_limiter = ConcurrencyLimiter(MAX_CONCURRENCY, MAX_QUEUE, MAX_QUEUE_WAIT_SECONDS)
+
+
+REGISTRY.gauge(
+    "tutortron_admission_queue_depth",
+    "Requests waiting for an LLM slot",
+    callback=llm_limiter.queue_depth
+)
+REGISTRY.gauge(
+    "tutortron_llm_in_flight",
+    "Questions holding an LLM slot",
+    callback=lambda: llm_limiter.in_flight
+)
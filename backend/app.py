@@ -1,107 +1,152 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
+import json
 import tempfile
-from rag import upload_pdf, query_ai_ta, init_qdrant
+import time
+from rag import (
+    upload_pdf, query_ai_ta, query_ai_ta_batch, init_vector_store, is_ai_configured,
+    clear_documents as clear_all_documents, get_coalescing_stats, warm_up as warm_up_models
+)
 import logging
 from chat_storage import chat_storage
+from chat_export import export_chunks
+from chat_cache import chat_cache, make_etag
+import moderation
+from instrumentation import timed
+import metrics
+from backends import normalize_search_params
+from clients import get_connection_stats
+from health import health_monitor, Throttled
+from admission import Rejected, llm_limiter, user_buckets
+from log_config import configure_logging, start_request, get_request_id, detail_logger
 from datetime import datetime
 import re
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
 # Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+MAX_BATCH_QUESTIONS = 1000
+MAX_BATCH_CONCURRENCY = 16
+MAX_PAGE_SIZE = 500
+MAX_SEARCH_RESULTS = 100
+
+# Every route lives on this blueprint; create_app() builds an app around it
+api = Blueprint('api', __name__)
+
+@api.before_app_request
+def bind_request_id():
+    # Log records of this request carry its id; the Next.js proxy passes its own
+    start_request(request.headers.get('X-Request-ID'))
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+@api.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_IN_FLIGHT.labels(g.metrics_route).inc()
 
-# Create upload folder if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+@api.after_app_request
+def record_request_metrics(response):
+    if 'metrics_route' in g:
+        metrics.HTTP_REQUESTS.labels(g.metrics_route, request.method, str(response.status_code)).inc()
+        metrics.HTTP_SECONDS.labels(g.metrics_route, request.method).observe(time.perf_counter() - g.request_started)
+    response.headers['X-Request-ID'] = get_request_id()
+    return response
+
+@api.teardown_app_request
+def finish_request_metrics(exc):
+    if 'metrics_route' in g:
+        metrics.HTTP_IN_FLIGHT.labels(g.metrics_route).dec()
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Content moderation function - MOVED TO TOP
+# Content moderation (rules in moderation_rules.json, see moderation.py)
+@timed("moderation")
 def check_content_flags(content):
     """Check if content should be flagged"""
-    flagged_keywords = [
-        'hack', 'cheat', 'illegal', 'drugs', 'violence', 
-        'harassment', 'spam', 'scam', 'fraud'
-    ]
-    
-    content_lower = content.lower()
-    
-    # Check for flagged keywords
-    for keyword in flagged_keywords:
-        if keyword in content_lower:
-            return True, f"Contains inappropriate keyword: {keyword}"
-    
-    # Check for excessive caps (possible shouting)
-    if len(content) > 20:
-        caps_ratio = sum(1 for c in content if c.isupper()) / len(content)
-        if caps_ratio > 0.7:
-            return True, "Excessive use of capital letters"
-    
-    # Check for repetitive content
-    words = content.split()
-    if len(words) > 5:
-        word_counts = {}
-        for word in words:
-            word_counts[word] = word_counts.get(word, 0) + 1
-            if word_counts[word] > 5:
-                return True, f"Excessive repetition of word: {word}"
-    
-    return False, None
+    return moderation.check_content(content)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint - UPDATED"""
+def _check_vector_store():
+    init_vector_store().list_collections()
+
+# Dependencies the readiness probe reports on; see health.py
+health_monitor.add_check('database', chat_storage.ping)
+health_monitor.add_check('vector_store', _check_vector_store)
+health_monitor.add_warm_up('moderation', moderation.get_engine)
+health_monitor.add_warm_up('reranker', warm_up_models)
+
+@api.route('/livez', methods=['GET'])
+def liveness():
+    """Liveness probe: answers as long as the process serves requests"""
+    return jsonify({"status": "alive"})
+
+@api.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: the background checker's latest results, 503 while not ready"""
+    ready, report = health_monitor.readiness()
+    report["ai_configured"] = is_ai_configured()
+    return jsonify(report), 200 if ready else 503
+
+def _diagnose():
+    """Deep diagnostics: queries the vector store and the chat database"""
+    openai_key = os.getenv("OPENAI_API_KEY")
+    report = {
+        "status": "healthy",
+        "message": "RAG backend is running with chat storage",
+        "openai_configured": bool(openai_key and openai_key != "your_openai_api_key_here"),
+        "ai_configured": is_ai_configured(),
+    }
+    problems = []
+    try:
+        report["collections"] = len(init_vector_store().list_collections())
+        report["qdrant_connected"] = True
+    except Exception as e:
+        report["qdrant_connected"] = False
+        problems.append(f"vector store: {e}")
     try:
-        # Test Qdrant connection
-        qdrant_client = init_qdrant()
-        collections = qdrant_client.get_collections()
-        
-        # Test database connection
         stats = chat_storage.get_chat_statistics()
-        
-        # Check OpenAI API key
-        openai_key = os.getenv("OPENAI_API_KEY")
-        has_openai = bool(openai_key and openai_key != "your_openai_api_key_here")
-        
-        return jsonify({
-            "status": "healthy", 
-            "message": "RAG backend is running with chat storage",
-            "qdrant_connected": True,
-            "database_connected": True,
-            "openai_configured": has_openai,
-            "collections": len(collections.collections),
-            "total_chats": stats.get('total_chats', 0),
-            "total_messages": stats.get('total_messages', 0)
-        })
+        report["database_connected"] = True
+        report["total_chats"] = stats.get('total_chats', 0)
+        report["total_messages"] = stats.get('total_messages', 0)
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            "status": "unhealthy",
-            "message": f"Service issues: {str(e)}"
-        }), 500
+        report["database_connected"] = False
+        problems.append(f"database: {e}")
+    report["coalesced_requests"] = get_coalescing_stats()['coalesced']
+    report["upstream_connections"] = get_connection_stats()
+    report["chat_cache"] = chat_cache.stats()
+    if problems:
+        report["status"] = "unhealthy"
+        report["message"] = f"Service issues: {'; '.join(problems)}"
+        logger.error(f"Health check failed: {report['message']}")
+    return report
+
+# However often /health is polled, the diagnostics run once per interval
+_diagnostics = Throttled(_diagnose)
+
+@api.route('/health', methods=['GET'])
+def health_check():
+    """Deep diagnostics for people and dashboards; probes should use /livez and /readyz"""
+    report, age = _diagnostics.get()
+    body = {**report, "checked_seconds_ago": round(age, 1), "checks": health_monitor.results()}
+    return jsonify(body), 200 if report["status"] == "healthy" else 503
+
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: latency histograms, request counters, cache ratios and in-flight gauges"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
 
-@app.route('/upload', methods=['POST'])
+@api.route('/upload', methods=['POST'])
 def upload_file():
     """Upload and process PDF files"""
     try:
-        logger.info(f"Upload request received")
-        logger.info(f"Request files: {list(request.files.keys())}")
-        logger.info(f"Content-Type: {request.content_type}")
+        logger.info("Upload request received (%s)", request.content_type)
         
         if 'file' not in request.files:
             logger.error("No file in request.files")
@@ -117,23 +162,22 @@ def upload_file():
             logger.error(f"Invalid file type: {file.filename}")
             return jsonify({"error": "Only PDF files are allowed"}), 400
         
-        # Check if we have OpenAI API key
-        if not os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY") == "your_openai_api_key_here":
+        # Check the model backends are configured
+        if not is_ai_configured():
             logger.error("OpenAI API key not configured")
             return jsonify({"error": "OpenAI API key not configured"}), 500
         
         # Save file temporarily
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         
-        logger.info(f"File saved: {filepath}")
-        logger.info(f"File size: {os.path.getsize(filepath)} bytes")
+        logger.info("File saved: %s", filepath)
         
         # Process the PDF with RAG
         try:
             upload_pdf(filepath)
-            logger.info(f"Successfully processed: {filename}")
+            logger.info("Successfully processed: %s", filename)
             
             # Clean up the uploaded file
             os.remove(filepath)
@@ -155,8 +199,19 @@ def upload_file():
         logger.error(f"Upload error: {str(e)}")
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
+def _rate_limit_key(user_id):
+    """Rate limits are per user; anonymous requests are limited per client address"""
+    return user_id if user_id != 'anonymous' else f"ip:{request.remote_addr}"
+
+def _rejected_response(rejected):
+    """429/503 with Retry-After for a request admission control turned away"""
+    response = jsonify({"error": str(rejected), "retryAfter": rejected.retry_after_header})
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = rejected.retry_after_header
+    return response
+
 # SINGLE CHAT ROUTE - FIXED VERSION
-@app.route('/chat', methods=['POST'])
+@api.route('/chat', methods=['POST'])
 def chat():
     """Handle chat messages and return AI responses - WITH CHAT STORAGE"""
     try:
@@ -182,12 +237,18 @@ def chat():
         threshold = data.get('threshold', 0.25)
         top_k = data.get('top_k', 8)
         verbose = data.get('verbose', True)
+        try:
+            search_params = normalize_search_params(data.get('search_params'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        logger.info(f"Processing chat message from user {user_id}: {user_message[:100]}...")
-        logger.info(f"Using threshold: {threshold}, top_k: {top_k}, verbose: {verbose}")
+        logger.info("Processing chat message from user %s", user_id)
+        detail = detail_logger(logger) if verbose else None
+        if detail:
+            detail("Message: %.100s... (threshold %s, top_k %s)", user_message, threshold, top_k)
         
-        # Check if we have OpenAI API key
-        if not os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY") == "your_openai_api_key_here":
+        # Check the model backends are configured
+        if not is_ai_configured():
             logger.error("OpenAI API key not configured")
             return jsonify({"error": "OpenAI API key not configured"}), 500
         
@@ -218,10 +279,14 @@ def chat():
                 "aiMessageId": ai_message_id
             })
         
-        # Save user message to database (not flagged)
-        user_message_id = None
-        if chat_id:
-            user_message_id = chat_storage.add_message(chat_id, 'user', user_message)
+        # Per-user rate limit; the LLM concurrency limit applies inside the
+        # pipeline, to the completion only (see admission.py)
+        rate_key = _rate_limit_key(user_id)
+        try:
+            user_buckets.take(rate_key)
+        except Rejected as e:
+            logger.warning(f"⚠️  Turned away chat request from user {user_id}: {e.reason}")
+            return _rejected_response(e)
         
         # Query the RAG system
         try:
@@ -229,49 +294,107 @@ def chat():
                 user_message, 
                 threshold=threshold, 
                 top_k=top_k,
-                verbose=verbose
+                verbose=verbose,
+                search_params=search_params
             )
-            
-            # Save AI response to database
-            ai_message_id = None
-            if chat_id:
-                ai_message_id = chat_storage.add_message(chat_id, 'assistant', ai_response)
-            
-            logger.info(f"Generated AI response for user {user_id}")
-            
-            return jsonify({
-                "success": True,
-                "response": ai_response,
-                "isFlagged": False,
-                "userId": user_id,
-                "sessionId": session_id,
-                "userMessageId": user_message_id,
-                "aiMessageId": ai_message_id
-            })
-            
+        except Rejected as e:
+            # Shedding is our fault, not the user's: don't charge them for it
+            user_buckets.refund(rate_key)
+            logger.warning(f"⚠️  Turned away chat request from user {user_id}: {e.reason}")
+            return _rejected_response(e)
         except Exception as e:
             logger.error(f"Error generating AI response: {str(e)}")
             return jsonify({
                 "error": f"Error generating response: {str(e)}"
             }), 500
+        
+        # Save both messages once there is an answer, so a turned-away
+        # request stores nothing and can simply be retried
+        user_message_id = None
+        ai_message_id = None
+        if chat_id:
+            user_message_id = chat_storage.add_message(chat_id, 'user', user_message)
+            ai_message_id = chat_storage.add_message(chat_id, 'assistant', ai_response)
+        
+        logger.info("Generated AI response for user %s", user_id)
+        
+        return jsonify({
+            "success": True,
+            "response": ai_response,
+            "isFlagged": False,
+            "userId": user_id,
+            "sessionId": session_id,
+            "userMessageId": user_message_id,
+            "aiMessageId": ai_message_id
+        })
             
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         return jsonify({"error": f"Chat failed: {str(e)}"}), 500
 
-@app.route('/clear-documents', methods=['POST'])
+@api.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of questions, streaming NDJSON results as they finish"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'questions' not in data:
+            return jsonify({"error": "No questions provided"}), 400
+        
+        questions = data['questions']
+        if not isinstance(questions, list) or not questions:
+            return jsonify({"error": "Questions must be a non-empty list"}), 400
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            return jsonify({"error": f"At most {MAX_BATCH_QUESTIONS} questions per batch"}), 400
+        if not all(isinstance(q, str) and q.strip() for q in questions):
+            return jsonify({"error": "Every question must be a non-empty string"}), 400
+        
+        threshold = data.get('threshold', 0.25)
+        top_k = data.get('top_k', 8)
+        try:
+            concurrency = max(1, min(int(data.get('concurrency', 4)), MAX_BATCH_CONCURRENCY))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Concurrency must be an integer"}), 400
+        try:
+            search_params = normalize_search_params(data.get('search_params'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Check the model backends are configured
+        if not is_ai_configured():
+            logger.error("OpenAI API key not configured")
+            return jsonify({"error": "OpenAI API key not configured"}), 500
+        
+        # Batch completions share the LLM slots with chat requests: don't start one into a full queue
+        try:
+            llm_limiter.check()
+        except Rejected as e:
+            return _rejected_response(e)
+        
+        logger.info("Processing batch of %d questions with concurrency %d", len(questions), concurrency)
+        
+        def generate():
+            for result in query_ai_ta_batch(
+                [q.strip() for q in questions],
+                threshold=threshold,
+                top_k=top_k,
+                max_workers=concurrency,
+                search_params=search_params
+            ):
+                yield json.dumps(result) + "\n"
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        logger.error(f"Batch chat error: {str(e)}")
+        return jsonify({"error": f"Batch chat failed: {str(e)}"}), 500
+
+@api.route('/clear-documents', methods=['POST'])
 def clear_documents():
     """Clear all documents from the vector database"""
     try:
-        from rag import COLLECTION_NAME
-        qdrant_client = init_qdrant()
-        
         # Delete and recreate collection
-        qdrant_client.delete_collection(COLLECTION_NAME)
-        qdrant_client.recreate_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config={"size": 1536, "distance": "Cosine"}
-        )
+        clear_all_documents()
         
         logger.info("Documents cleared successfully")
         
@@ -286,15 +409,44 @@ def clear_documents():
 
 # ===== CHAT API ENDPOINTS =====
 
-@app.route('/api/chats', methods=['GET'])
+def _json_body(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def _etag_response(body, etag):
+    """A JSON response with its ETag, or an empty 304 if the client already has this version"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Browsers may keep the body but must revalidate before using it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@api.route('/api/chats', methods=['GET'])
 def get_user_chats():
-    """Get all chats for a user"""
+    """Get a page of chats for a user; pass nextCursor back as ?cursor= for the next page"""
     try:
         user_id = request.args.get('userId')
         if not user_id:
             return jsonify({"error": "User ID required"}), 400
         
-        chats = chat_storage.get_user_chats(user_id)
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        cursor = request.args.get('cursor')
+        key = ('chats', user_id, limit, cursor)
+        cached = chat_cache.get('chat_lists', key)
+        if cached:
+            return _etag_response(*cached)
+        
+        token = chat_cache.token()
+        try:
+            page = chat_storage.get_user_chats_page(user_id, limit, cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        chats = page['chats']
         
         # Convert to frontend format
         formatted_chats = []
@@ -309,18 +461,21 @@ def get_user_chats():
                 'flagReason': chat['flag_reason']
             })
         
-        return jsonify({
+        body = _json_body({
             "success": True,
-            "chats": formatted_chats
+            "chats": formatted_chats,
+            "nextCursor": page['next_cursor']
         })
+        etag = chat_cache.put(key, body, token, user_id=user_id, chat_ids=[chat['id'] for chat in chats])
+        return _etag_response(body, etag)
         
     except Exception as e:
         logger.error(f"Error getting user chats: {str(e)}")
         return jsonify({"error": f"Failed to get chats: {str(e)}"}), 500
 
-@app.route('/api/chats/<chat_id>', methods=['GET'])
+@api.route('/api/chats/<chat_id>', methods=['GET'])
 def get_chat_by_id(chat_id):
-    """Get a specific chat with messages"""
+    """Get a specific chat with messages (only the newest ?limit= messages if given)"""
     try:
         user_id = request.args.get('userId')
         
@@ -328,7 +483,16 @@ def get_chat_by_id(chat_id):
         is_admin = request.args.get('isAdmin') == 'true'
         check_user_id = None if is_admin else user_id
         
-        chat = chat_storage.get_chat_with_messages(chat_id, check_user_id)
+        message_limit = request.args.get('limit', type=int)
+        if message_limit is not None:
+            message_limit = min(max(message_limit, 1), MAX_PAGE_SIZE)
+        key = ('chat', chat_id, check_user_id, message_limit)
+        cached = chat_cache.get('chat_transcripts', key)
+        if cached:
+            return _etag_response(*cached)
+        
+        token = chat_cache.token()
+        chat = chat_storage.get_chat_with_messages(chat_id, check_user_id, message_limit)
         
         if not chat:
             return jsonify({"error": "Chat not found"}), 404
@@ -343,17 +507,21 @@ def get_chat_by_id(chat_id):
             'isFlagged': chat['is_flagged'],
             'flagReason': chat['flag_reason']
         }
+        if message_limit is not None:
+            formatted_chat['messagesCursor'] = chat['messages_cursor']
         
-        return jsonify({
+        body = _json_body({
             "success": True,
             "chat": formatted_chat
         })
+        etag = chat_cache.put(key, body, token, chat_id=chat_id, user_id=chat['user_id'])
+        return _etag_response(body, etag)
         
     except Exception as e:
         logger.error(f"Error getting chat: {str(e)}")
         return jsonify({"error": f"Failed to get chat: {str(e)}"}), 500
 
-@app.route('/api/chats', methods=['POST'])
+@api.route('/api/chats', methods=['POST'])
 def create_chat():
     """Create a new chat"""
     try:
@@ -382,7 +550,49 @@ def create_chat():
         logger.error(f"Error creating chat: {str(e)}")
         return jsonify({"error": f"Failed to create chat: {str(e)}"}), 500
 
-@app.route('/api/chats/<chat_id>/messages', methods=['POST'])
+@api.route('/api/chats/<chat_id>/messages', methods=['GET'])
+def get_chat_messages(chat_id):
+    """Page through a chat's messages.
+    
+    ?before=<cursor> returns the newest ?limit= messages older than the
+    cursor (nextCursor continues further back); ?since=<message id> or
+    ?sinceTimestamp= returns only messages newer than what the client has.
+    """
+    try:
+        user_id = request.args.get('userId')
+        is_admin = request.args.get('isAdmin') == 'true'
+        check_user_id = None if is_admin else user_id
+        limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
+        since_id = request.args.get('since')
+        since_timestamp = request.args.get('sinceTimestamp')
+        
+        try:
+            if since_id or since_timestamp:
+                page = chat_storage.get_chat_messages_since(
+                    chat_id, check_user_id, since_id, since_timestamp, limit)
+            else:
+                page = chat_storage.get_chat_messages_page(
+                    chat_id, check_user_id, limit, request.args.get('before'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if page is None:
+            return jsonify({"error": "Chat not found"}), 404
+        
+        response = {"success": True, "messages": page['messages']}
+        if 'next_cursor' in page:
+            response["nextCursor"] = page['next_cursor']
+        else:
+            response["hasMore"] = page['has_more']
+        # Not cached, but an unchanged page still costs no payload
+        body = _json_body(response)
+        return _etag_response(body, make_etag(body))
+        
+    except Exception as e:
+        logger.error(f"Error getting messages: {str(e)}")
+        return jsonify({"error": f"Failed to get messages: {str(e)}"}), 500
+
+@api.route('/api/chats/<chat_id>/messages', methods=['POST'])
 def add_message_to_chat(chat_id):
     """Add a message to a chat"""
     try:
@@ -418,11 +628,13 @@ def add_message_to_chat(chat_id):
             "flagReason": flag_reason
         })
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error adding message: {str(e)}")
         return jsonify({"error": f"Failed to add message: {str(e)}"}), 500
 
-@app.route('/api/chats/<chat_id>', methods=['PUT'])
+@api.route('/api/chats/<chat_id>', methods=['PUT'])
 def update_chat(chat_id):
     """Update chat (e.g., title)"""
     try:
@@ -447,7 +659,7 @@ def update_chat(chat_id):
         logger.error(f"Error updating chat: {str(e)}")
         return jsonify({"error": f"Failed to update chat: {str(e)}"}), 500
 
-@app.route('/api/chats/<chat_id>', methods=['DELETE'])
+@api.route('/api/chats/<chat_id>', methods=['DELETE'])
 def delete_chat(chat_id):
     """Delete a chat"""
     try:
@@ -469,25 +681,95 @@ def delete_chat(chat_id):
 
 # ===== ADMIN API ENDPOINTS =====
 
-@app.route('/api/admin/chats', methods=['GET'])
+@api.route('/api/admin/chats', methods=['GET'])
 def admin_get_all_chats():
-    """Get all chats for admin monitoring"""
+    """Get a page of all chats for admin monitoring.
+    
+    Pages with ?cursor= (the previous response's nextCursor); a non-zero
+    ?offset= still works but deep offsets are slow.
+    """
     try:
-        limit = int(request.args.get('limit', 100))
-        offset = int(request.args.get('offset', 0))
-        
-        chats = chat_storage.get_all_chats_for_admin(limit, offset)
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), MAX_PAGE_SIZE)
+            offset = int(request.args.get('offset', 0))
+            if offset > 0:
+                chats = chat_storage.get_all_chats_for_admin(limit, offset)
+                next_cursor = None
+            else:
+                page = chat_storage.get_admin_chats_page(limit, request.args.get('cursor'))
+                chats, next_cursor = page['chats'], page['next_cursor']
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         return jsonify({
             "success": True,
-            "chats": chats
+            "chats": chats,
+            "nextCursor": next_cursor
         })
         
     except Exception as e:
         logger.error(f"Error getting admin chats: {str(e)}")
         return jsonify({"error": f"Failed to get chats: {str(e)}"}), 500
 
-@app.route('/api/admin/flagged-content', methods=['GET'])
+def _search_response(user_id):
+    query = request.args.get('q', '')
+    cursor = request.args.get('cursor')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_SEARCH_RESULTS)
+        # Messages of archived chats are not indexed until the chat is restored;
+        # their titles still match
+        page = chat_storage.search_messages(query, user_id, limit, cursor)
+        # Title matches only accompany the first page
+        chats = [] if cursor else chat_storage.search_chats(query, user_id, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "success": True,
+        "results": page['results'],
+        "chats": chats,
+        "nextCursor": page['next_cursor']
+    })
+
+@api.route('/api/search', methods=['GET'])
+def search_user_chats():
+    """Full-text search over a user's own messages and chat titles (?q=, ?limit=, ?cursor=)"""
+    try:
+        user_id = request.args.get('userId')
+        if not user_id:
+            return jsonify({"error": "User ID required"}), 400
+        return _search_response(user_id)
+    except Exception as e:
+        logger.error(f"Error searching chats: {str(e)}")
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
+
+@api.route('/api/admin/search', methods=['GET'])
+def admin_search_chats():
+    """Full-text search over all messages and chat titles, optionally for one ?userId="""
+    try:
+        return _search_response(request.args.get('userId') or None)
+    except Exception as e:
+        logger.error(f"Error searching chats: {str(e)}")
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
+
+@api.route('/api/admin/export', methods=['GET'])
+def admin_export_chats():
+    """Stream all users and chats with their messages as NDJSON (?userId= for one user, ?compress=gzip)"""
+    try:
+        user_id = request.args.get('userId') or None
+        compress = request.args.get('compress') == 'gzip'
+        filename = 'chats.ndjson.gz' if compress else 'chats.ndjson'
+        logger.info(f"Exporting chats{f' for user {user_id}' if user_id else ''}")
+        return Response(
+            stream_with_context(export_chunks(chat_storage, user_id, compress)),
+            mimetype='application/gzip' if compress else 'application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    except Exception as e:
+        logger.error(f"Error exporting chats: {str(e)}")
+        return jsonify({"error": f"Export failed: {str(e)}"}), 500
+
+@api.route('/api/admin/flagged-content', methods=['GET'])
 def admin_get_flagged_content():
     """Get flagged chats and messages for admin review"""
     try:
@@ -505,7 +787,7 @@ def admin_get_flagged_content():
         logger.error(f"Error getting flagged content: {str(e)}")
         return jsonify({"error": f"Failed to get flagged content: {str(e)}"}), 500
 
-@app.route('/api/admin/statistics', methods=['GET'])
+@api.route('/api/admin/statistics', methods=['GET'])
 def admin_get_statistics():
     """Get chat statistics for admin dashboard"""
     try:
@@ -520,7 +802,7 @@ def admin_get_statistics():
         logger.error(f"Error getting statistics: {str(e)}")
         return jsonify({"error": f"Failed to get statistics: {str(e)}"}), 500
 
-@app.route('/api/admin/flag-message', methods=['POST'])
+@api.route('/api/admin/flag-message', methods=['POST'])
 def admin_flag_message():
     """Flag a message for review"""
     try:
@@ -545,7 +827,7 @@ def admin_flag_message():
         logger.error(f"Error flagging message: {str(e)}")
         return jsonify({"error": f"Failed to flag message: {str(e)}"}), 500
 
-@app.route('/api/admin/flag-chat', methods=['POST'])
+@api.route('/api/admin/flag-chat', methods=['POST'])
 def admin_flag_chat():
     """Flag a chat for review"""
     try:
@@ -570,17 +852,40 @@ def admin_flag_chat():
         logger.error(f"Error flagging chat: {str(e)}")
         return jsonify({"error": f"Failed to flag chat: {str(e)}"}), 500
 
-@app.errorhandler(413)
+@api.app_errorhandler(413)
 def too_large(e):
     return jsonify({"error": "File too large. Maximum size is 16MB."}), 413
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_server_error(e):
     logger.error(f"Internal server error: {str(e)}")
     return jsonify({"error": "Internal server error"}), 500
 
-if __name__ == '__main__':
-    logger.info("Starting RAG backend server...")
+def create_app(config=None):
+    """Build the Flask app around the API blueprint.
+    
+    Models, storage and clients live in the modules imported above, so a
+    preforking server (serve.py) loads them once in the parent process.
+    """
+    configure_logging()
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for all routes
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    if config:
+        app.config.update(config)
+    
+    # Create upload folder if it doesn't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    
+    # Cached chat responses are dropped whenever storage changes the chat
+    chat_storage.add_change_listener(chat_cache.invalidate)
+    
+    app.register_blueprint(api)
+    return app
+
+def check_environment():
+    """Log whether the API key, vector store and chat database are usable"""
     logger.info("Checking environment...")
     
     # Check environment variables
@@ -590,12 +895,12 @@ if __name__ == '__main__':
     else:
         logger.info("✓ OpenAI API key configured")
     
-    # Test Qdrant connection
+    # Test vector store connection
     try:
-        init_qdrant()
-        logger.info("✓ Qdrant connection successful")
+        init_vector_store()
+        logger.info("✓ Vector store connection successful")
     except Exception as e:
-        logger.error(f"❌ Qdrant connection failed: {e}")
+        logger.error(f"❌ Vector store connection failed: {e}")
     
     # Test database connection
     try:
@@ -603,5 +908,12 @@ if __name__ == '__main__':
         logger.info(f"✓ Database connection successful - {stats['total_chats']} chats, {stats['total_messages']} messages")
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
-    
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+
+app = create_app()
+
+if __name__ == '__main__':
+    # Development server; run `python serve.py` in production
+    logger.info("Starting RAG backend server...")
+    check_environment()
+    health_monitor.start()
+    app.run(debug=True, host='0.0.0.0', port=5001)
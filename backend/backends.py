@@ -0,0 +1,520 @@
+# backend/backends.py - Pluggable embedding, completion, vector-store and rerank backends
+"""
+Small interfaces for the external services used by the RAG pipeline, with
+real implementations (OpenAI, Qdrant, CrossEncoder) and deterministic local
+stand-ins that need no network, API key or model download.
+
+Backends are chosen by environment variables:
+
+    EMBEDDING_BACKEND      openai (default) | hash
+    COMPLETION_BACKEND     openai (default) | canned
+    VECTOR_STORE_BACKEND   qdrant (default) | memory
+    RERANKER_BACKEND       none (default) | cross-encoder | overlap
+
+The real backends get their clients, timeouts and retry policies from
+``clients`` (connection pooling, gRPC for Qdrant, jittered retries).
+
+The stand-ins accept an injected latency (``*_LATENCY_MS`` plus
+``*_JITTER_MS``) so throughput and latency of our own code can be measured
+against realistic upstream response times.
+"""
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 1536
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_COMPLETION_MODEL = "gpt-4o"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _env_ms(name, default=0.0):
+    """Read a millisecond setting from the environment as seconds"""
+    return float(os.getenv(name, default)) / 1000.0
+
+
+class LatencyInjector:
+    """Sleep for a fixed latency plus seeded random jitter to simulate a remote call"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.latency <= 0 and self.jitter <= 0:
+            return
+        with self._lock:
+            extra = self._rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+        time.sleep(self.latency + extra)
+
+
+class SearchHit:
+    """A scored search result; mirrors the attributes of Qdrant's ScoredPoint"""
+    __slots__ = ("id", "score", "payload")
+
+    def __init__(self, id, score: float, payload: Dict):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+    def __repr__(self):
+        return f"SearchHit(id={self.id!r}, score={self.score:.4f})"
+
+
+# ===== EMBEDDINGS =====
+
+class Embedder:
+    """Turns texts into vectors"""
+    dimension = EMBEDDING_DIMENSION
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+def _call(retry, fn, *args, **kwargs):
+    if retry is None:
+        return fn(*args, **kwargs)
+    return retry.call(fn, *args, **kwargs)
+
+
+class OpenAIEmbedder(Embedder):
+    def __init__(self, client, model: str = DEFAULT_EMBEDDING_MODEL, timeout: float = None, retry=None):
+        self.client = client
+        self.model = model
+        self.timeout = timeout
+        self.retry = retry
+
+    def embed(self, texts):
+        response = _call(self.retry, self.client.embeddings.create,
+                         model=self.model, input=list(texts), timeout=self.timeout)
+        return [r.embedding for r in response.data]
+
+
+class HashEmbedder(Embedder):
+    """Deterministic bag-of-words embedding using the hashing trick.
+
+    Texts sharing words get similar vectors, so retrieval over a synthetic
+    corpus still behaves like retrieval rather than random noise.
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, latency: LatencyInjector = None):
+        self.dimension = dimension
+        self.latency = latency or LatencyInjector()
+
+    def _embed_one(self, text):
+        vector = [0.0] * self.dimension
+        tokens = _TOKEN_RE.findall(text.lower()) or [text]
+        for token in tokens:
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+            vector[h % self.dimension] += 1.0 if h >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed(self, texts):
+        self.latency.wait()
+        return [self._embed_one(text) for text in texts]
+
+
+# ===== COMPLETIONS =====
+
+class Completer:
+    """Produces a chat completion for a list of messages"""
+
+    def complete(self, messages: List[Dict], temperature: float = 0.3, max_tokens: int = 1000) -> str:
+        raise NotImplementedError
+
+
+class OpenAICompleter(Completer):
+    def __init__(self, client, model: str = DEFAULT_COMPLETION_MODEL, timeout: float = None, retry=None):
+        self.client = client
+        self.model = model
+        self.timeout = timeout
+        self.retry = retry
+
+    def complete(self, messages, temperature=0.3, max_tokens=1000):
+        response = _call(
+            self.retry,
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=self.timeout
+        )
+        return response.choices[0].message.content
+
+
+class CannedCompleter(Completer):
+    """Returns a fixed answer, or a deterministic one derived from the prompt"""
+
+    def __init__(self, response: str = None, latency: LatencyInjector = None):
+        self.response = response
+        self.latency = latency or LatencyInjector()
+
+    def complete(self, messages, temperature=0.3, max_tokens=1000):
+        self.latency.wait()
+        if self.response is not None:
+            return self.response
+        prompt = messages[-1]["content"] if messages else ""
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+        return f"Canned answer {digest} for a {len(prompt)}-character prompt."
+
+
+# ===== VECTOR STORES =====
+
+class VectorStore:
+    """Stores vectors with payloads and finds the nearest ones by cosine similarity"""
+
+    def ensure_collection(self, name: str, dimension: int):
+        raise NotImplementedError
+
+    def recreate_collection(self, name: str, dimension: int):
+        raise NotImplementedError
+
+    def delete_collection(self, name: str):
+        raise NotImplementedError
+
+    def list_collections(self) -> List[str]:
+        raise NotImplementedError
+
+    def upsert(self, name: str, ids: List, vectors: List[List[float]], payloads: List[Dict]):
+        raise NotImplementedError
+
+    def search(self, name: str, vector: List[float], limit: int, params: Dict = None) -> List[SearchHit]:
+        """Nearest neighbours; ``params`` holds normalized search parameters (see normalize_search_params)"""
+        raise NotImplementedError
+
+    def search_batch(self, name: str, vectors: List[List[float]], limit: int, params: Dict = None) -> List[List[SearchHit]]:
+        return [self.search(name, vector, limit, params) for vector in vectors]
+
+    def scroll(self, name: str, limit: int) -> List[SearchHit]:
+        raise NotImplementedError
+
+
+class QdrantStore(VectorStore):
+    def __init__(self, client, retry=None, timeout: int = None):
+        self.client = client
+        self.retry = retry
+        self.timeout = timeout
+
+    def ensure_collection(self, name, dimension):
+        if name not in self.list_collections():
+            self.recreate_collection(name, dimension)
+            logger.info(f"✓ Created collection: {name}")
+        else:
+            logger.info(f"✓ Collection {name} already exists")
+
+    def recreate_collection(self, name, dimension):
+        from qdrant_client.models import Distance, VectorParams
+        self.client.recreate_collection(
+            collection_name=name,
+            vectors_config=VectorParams(size=dimension, distance=Distance.COSINE)
+        )
+
+    def delete_collection(self, name):
+        self.client.delete_collection(name)
+
+    def list_collections(self):
+        return [col.name for col in self.client.get_collections().collections]
+
+    def upsert(self, name, ids, vectors, payloads):
+        from qdrant_client.models import PointStruct
+        points = [
+            PointStruct(id=point_id, vector=vector, payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        # Point ids are deterministic, so a retried upsert is idempotent
+        _call(self.retry, self.client.upsert, collection_name=name, points=points)
+
+    @staticmethod
+    def _search_params(params):
+        if not params:
+            return None
+        from qdrant_client.models import SearchParams, QuantizationSearchParams
+        quantization = None
+        if params.get("oversampling"):
+            quantization = QuantizationSearchParams(rescore=True, oversampling=params["oversampling"])
+        return SearchParams(
+            hnsw_ef=params.get("hnsw_ef"),
+            exact=params.get("exact", False),
+            quantization=quantization
+        )
+
+    def search(self, name, vector, limit, params=None):
+        return _call(
+            self.retry,
+            self.client.search,
+            collection_name=name,
+            query_vector=vector,
+            limit=limit,
+            with_payload=True,
+            search_params=self._search_params(params),
+            timeout=self.timeout
+        )
+
+    def search_batch(self, name, vectors, limit, params=None):
+        from qdrant_client.models import SearchRequest
+        search_params = self._search_params(params)
+        requests = [
+            SearchRequest(vector=vector, limit=limit, with_payload=True, params=search_params)
+            for vector in vectors
+        ]
+        return _call(self.retry, self.client.search_batch,
+                     collection_name=name, requests=requests, timeout=self.timeout)
+
+    def scroll(self, name, limit):
+        points, _ = self.client.scroll(collection_name=name, limit=limit, with_payload=True)
+        return points
+
+
+class InMemoryStore(VectorStore):
+    """Brute-force cosine search over vectors held in memory (numpy matrix per collection).
+
+    Search is always exact, so search parameters are accepted and ignored.
+    """
+
+    def __init__(self, latency: LatencyInjector = None):
+        self.latency = latency or LatencyInjector()
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _collection(self, name):
+        return self._collections.setdefault(name, {"points": {}, "ids": [], "matrix": None})
+
+    def ensure_collection(self, name, dimension):
+        with self._lock:
+            self._collection(name)
+
+    def recreate_collection(self, name, dimension):
+        with self._lock:
+            self._collections.pop(name, None)
+            self._collection(name)
+
+    def delete_collection(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def list_collections(self):
+        with self._lock:
+            return list(self._collections)
+
+    def upsert(self, name, ids, vectors, payloads):
+        import numpy as np
+        self.latency.wait()
+        with self._lock:
+            collection = self._collection(name)
+            for point_id, vector, payload in zip(ids, vectors, payloads):
+                v = np.asarray(vector, dtype=np.float32)
+                collection["points"][point_id] = (v / (np.linalg.norm(v) or 1.0), dict(payload))
+            collection["matrix"] = None  # rebuilt on next search
+
+    def _snapshot(self, name):
+        import numpy as np
+        with self._lock:
+            collection = self._collections.get(name)
+            if not collection or not collection["points"]:
+                return [], None, {}
+            if collection["matrix"] is None:
+                collection["ids"] = list(collection["points"])
+                collection["matrix"] = np.stack([collection["points"][i][0] for i in collection["ids"]])
+            return collection["ids"], collection["matrix"], collection["points"]
+
+    def search(self, name, vector, limit, params=None):
+        self.latency.wait()
+        return self._search_many(name, [vector], limit)[0]
+
+    def search_batch(self, name, vectors, limit, params=None):
+        # One simulated round trip for the whole batch, like Qdrant's search_batch
+        self.latency.wait()
+        return self._search_many(name, vectors, limit)
+
+    def _search_many(self, name, vectors, limit):
+        import numpy as np
+        ids, matrix, points = self._snapshot(name)
+        if matrix is None:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ matrix.T
+        k = min(limit, len(ids))
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([SearchHit(ids[i], float(row[i]), points[ids[i]][1]) for i in top])
+        return results
+
+    def scroll(self, name, limit):
+        with self._lock:
+            points = list(self._collections.get(name, {"points": {}})["points"].items())[:limit]
+        return [SearchHit(point_id, 0.0, payload) for point_id, (_, payload) in points]
+
+
+# ===== SEARCH PARAMETERS =====
+
+SEARCH_PARAM_TYPES = {"hnsw_ef": int, "exact": bool, "oversampling": float}
+
+
+def normalize_search_params(params) -> Dict:
+    """Validate search parameters (hnsw_ef, exact, oversampling), dropping unset ones.
+
+    Raises ValueError for unknown keys or bad values, so routes can answer 400.
+    """
+    if not params:
+        return {}
+    if not isinstance(params, dict):
+        raise ValueError("Search parameters must be an object")
+    unknown = set(params) - set(SEARCH_PARAM_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown search parameters: {', '.join(sorted(unknown))}")
+    normalized = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        kind = SEARCH_PARAM_TYPES[key]
+        if kind is bool:
+            if isinstance(value, str):
+                value = value.strip().lower() in ("1", "true", "yes", "on")
+            normalized[key] = bool(value)
+            continue
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {key}: {value!r}")
+        if value <= 0:
+            raise ValueError(f"{key} must be positive")
+        normalized[key] = value
+    return normalized
+
+
+def search_params_from_env() -> Dict:
+    """Default search parameters from QDRANT_HNSW_EF, QDRANT_EXACT_SEARCH and QDRANT_OVERSAMPLING"""
+    return normalize_search_params({
+        "hnsw_ef": os.getenv("QDRANT_HNSW_EF"),
+        "exact": os.getenv("QDRANT_EXACT_SEARCH"),
+        "oversampling": os.getenv("QDRANT_OVERSAMPLING"),
+    })
+
+
+# ===== RERANKERS =====
+
+class Reranker:
+    """Reorders search hits by relevance to the question"""
+
+    def rerank(self, question: str, hits: List) -> List:
+        return list(hits)
+
+
+class CrossEncoderReranker(Reranker):
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name)
+
+    def rerank(self, question, hits):
+        if not hits:
+            return []
+        scores = self.model.predict([(question, hit.payload['text']) for hit in hits])
+        order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)
+        return [hits[i] for i in order]
+
+
+class OverlapReranker(Reranker):
+    """Cheap deterministic stand-in: orders hits by shared words with the question"""
+
+    def __init__(self, latency: LatencyInjector = None):
+        self.latency = latency or LatencyInjector()
+
+    def rerank(self, question, hits):
+        self.latency.wait()
+        words = set(_TOKEN_RE.findall(question.lower()))
+        return sorted(
+            hits,
+            key=lambda hit: len(words & set(_TOKEN_RE.findall(hit.payload['text'].lower()))),
+            reverse=True
+        )
+
+
+# ===== FACTORIES =====
+
+def create_openai_client():
+    """The shared, pooled OpenAI client (needs OPENAI_API_KEY)"""
+    import clients
+    return clients.get_openai_client()
+
+
+def create_embedder(openai_client=None) -> Embedder:
+    backend = os.getenv("EMBEDDING_BACKEND", "openai")
+    if backend == "hash":
+        return HashEmbedder(latency=LatencyInjector(
+            _env_ms("EMBEDDING_LATENCY_MS"), _env_ms("EMBEDDING_JITTER_MS"), seed=1))
+    if backend == "openai":
+        import clients
+        client = openai_client or create_openai_client()
+        return OpenAIEmbedder(
+            client,
+            os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL),
+            timeout=float(os.getenv("OPENAI_EMBEDDING_TIMEOUT", 15)),
+            retry=clients.retry_policy("openai", "OPENAI_MAX_RETRIES", 3)
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def create_completer(openai_client=None) -> Completer:
+    backend = os.getenv("COMPLETION_BACKEND", "openai")
+    if backend == "canned":
+        return CannedCompleter(os.getenv("CANNED_RESPONSE"), latency=LatencyInjector(
+            _env_ms("COMPLETION_LATENCY_MS"), _env_ms("COMPLETION_JITTER_MS"), seed=2))
+    if backend == "openai":
+        import clients
+        client = openai_client or create_openai_client()
+        return OpenAICompleter(
+            client,
+            os.getenv("COMPLETION_MODEL", DEFAULT_COMPLETION_MODEL),
+            timeout=float(os.getenv("OPENAI_COMPLETION_TIMEOUT", 60)),
+            retry=clients.retry_policy("openai", "OPENAI_MAX_RETRIES", 3)
+        )
+    raise ValueError(f"Unknown completion backend: {backend}")
+
+
+def create_vector_store() -> VectorStore:
+    backend = os.getenv("VECTOR_STORE_BACKEND", "qdrant")
+    if backend == "memory":
+        return InMemoryStore(latency=LatencyInjector(
+            _env_ms("VECTOR_STORE_LATENCY_MS"), _env_ms("VECTOR_STORE_JITTER_MS"), seed=3))
+    if backend == "qdrant":
+        import clients
+        return QdrantStore(
+            clients.create_qdrant_client(),
+            retry=clients.retry_policy("qdrant", "QDRANT_MAX_RETRIES", 2),
+            timeout=int(os.getenv("QDRANT_SEARCH_TIMEOUT", os.getenv("QDRANT_TIMEOUT", 10)))
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def create_reranker() -> Optional[Reranker]:
+    backend = os.getenv("RERANKER_BACKEND", "none")
+    if backend == "none":
+        return None
+    if backend == "cross-encoder":
+        return CrossEncoderReranker(os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+    if backend == "overlap":
+        return OverlapReranker(latency=LatencyInjector(
+            _env_ms("RERANKER_LATENCY_MS"), _env_ms("RERANKER_JITTER_MS"), seed=4))
+    raise ValueError(f"Unknown reranker backend: {backend}")
+
+
+def uses_openai():
+    """Whether any configured backend needs the OpenAI API"""
+    return (os.getenv("EMBEDDING_BACKEND", "openai") == "openai"
+            or os.getenv("COMPLETION_BACKEND", "openai") == "openai")
@@ -0,0 +1,732 @@
+# backend/benchmark.py - Reproducible latency/throughput benchmarks for the backend
+"""
+Runs the backend against the offline stand-ins from backends.py (hash
+embedder, canned completer, in-memory vector store) with injectable
+latency, and reports p50/p95/p99 latency and throughput per pipeline stage.
+
+    python benchmark.py pipeline --concurrency 1,8,32 --completion-latency-ms 800
+    python benchmark.py pipeline --questions 500 --output results/main.json
+    python benchmark.py storage --concurrency 1,16,64 --read-ratio 0.8
+    python benchmark.py storage --read-ratio 0 --write-behind
+    python benchmark.py moderation --rules 10,100,1000,5000 --sizes-kb 1,16
+    python benchmark.py server --workers 1,4 --threads 32 --concurrency 64
+
+Results are written as JSON (including the git commit) so runs can be
+compared across commits. Backend environment variables that are already
+set take precedence over the command-line stand-in defaults, so the same
+workload can be pointed at real OpenAI/Qdrant.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TOPICS = [
+    ("photosynthesis", "chlorophyll light energy glucose carbon dioxide oxygen leaves plants"),
+    ("mitosis", "chromosomes spindle prophase metaphase anaphase telophase cell division"),
+    ("newtonian mechanics", "force mass acceleration inertia momentum friction gravity motion"),
+    ("thermodynamics", "entropy enthalpy heat work temperature energy conservation systems"),
+    ("supply and demand", "price quantity equilibrium market elasticity consumers producers"),
+    ("recursion", "base case recursive call stack function factorial fibonacci termination"),
+    ("linear algebra", "matrix vector eigenvalue determinant basis linear transformation span"),
+    ("probability", "random variable distribution expectation variance bayes conditional events"),
+    ("organic chemistry", "carbon bonds functional groups alkanes alkenes reactions isomers"),
+    ("world war one", "alliances trenches armistice treaty versailles empires front lines"),
+    ("cell respiration", "mitochondria atp glycolysis krebs cycle electron transport chain"),
+    ("databases", "tables indexes queries transactions joins normalization primary keys"),
+]
+
+QUESTION_TEMPLATES = [
+    "What is {topic}?",
+    "Can you explain {topic} in simple terms?",
+    "How does {word} relate to {topic}?",
+    "Why is {word} important in {topic}?",
+    "Give me an example involving {word} and {topic}.",
+]
+
+
+# ===== STATISTICS =====
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(durations, wall_seconds):
+    """Latency percentiles (ms) and throughput (ops/s) for a list of durations in seconds"""
+    values = sorted(durations)
+    ms = lambda v: round(v * 1000.0, 3) if v is not None else None
+    return {
+        "count": len(values),
+        "throughput_per_s": round(len(values) / wall_seconds, 2) if wall_seconds > 0 else None,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+
+
+class StageRecorder:
+    """Collects (stage, seconds) samples from instrumentation listeners"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def __call__(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def summary(self, wall_seconds):
+        with self._lock:
+            return {name: summarize(values, wall_seconds) for name, values in sorted(self.samples.items())}
+
+
+def run_concurrently(fn, items, concurrency):
+    """Call fn(item) for every item with a thread pool; return per-call latencies and wall time"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed_call(item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed_call, items))
+    return latencies, errors, time.perf_counter() - start
+
+
+# ===== SYNTHETIC CORPUS =====
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Write a minimal text-only PDF; ``pages`` is a list of lists of lines"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>"
+        )
+        page_refs.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{n} 0 R' for n in page_refs)}] /Count {len(page_refs)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def synthetic_sentence(rng, topic, words):
+    picked = rng.sample(words, 4)
+    return (f"In {topic}, {picked[0]} and {picked[1]} interact with {picked[2]}, "
+            f"which explains the role of {picked[3]} in lecture {rng.randint(1, 30)}.")
+
+
+def build_corpus(directory, documents, pages, seed):
+    """Write ``documents`` synthetic lecture PDFs and return their paths"""
+    rng = random.Random(seed)
+    paths = []
+    for d in range(documents):
+        doc_pages = []
+        for _ in range(pages):
+            topic, vocab = rng.choice(TOPICS)
+            words = vocab.split()
+            doc_pages.append([synthetic_sentence(rng, topic, words) for _ in range(40)])
+        path = os.path.join(directory, f"lecture_{d + 1:03d}.pdf")
+        write_pdf(path, doc_pages)
+        paths.append(path)
+    return paths
+
+
+def build_questions(count, seed, repeat_ratio=0.0):
+    """Deterministic question workload; ``repeat_ratio`` of them repeat an earlier question"""
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        if questions and rng.random() < repeat_ratio:
+            questions.append(rng.choice(questions))
+            continue
+        topic, vocab = rng.choice(TOPICS)
+        template = rng.choice(QUESTION_TEMPLATES)
+        questions.append(template.format(topic=topic, word=rng.choice(vocab.split())) + f" (#{rng.randint(1, 10**6)})")
+    return questions
+
+
+# ===== ENVIRONMENT =====
+
+def configure_stand_ins(args, workdir):
+    """Point the backend at offline stand-ins unless the environment says otherwise"""
+    defaults = {
+        "EMBEDDING_BACKEND": "hash",
+        "COMPLETION_BACKEND": "canned",
+        "VECTOR_STORE_BACKEND": "memory",
+        "RERANKER_BACKEND": "overlap",
+        "EMBEDDING_LATENCY_MS": str(args.embed_latency_ms),
+        "VECTOR_STORE_LATENCY_MS": str(args.search_latency_ms),
+        "RERANKER_LATENCY_MS": str(args.rerank_latency_ms),
+        "COMPLETION_LATENCY_MS": str(args.completion_latency_ms),
+        "COMPLETION_JITTER_MS": str(args.completion_jitter_ms),
+        "CHAT_DB_PATH": os.path.join(workdir, "bench_chats.db"),
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    return {key: os.environ[key] for key in defaults}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def write_results(path, suite, config, results):
+    report = {
+        "suite": suite,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📊 Results written to {path}")
+    return report
+
+
+def print_table(title, summary):
+    print(f"\n{title}")
+    print(f"  {'stage':<12} {'count':>7} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in summary.items():
+        print(f"  {name:<12} {s['count']:>7} {s['throughput_per_s'] or 0:>9} "
+              f"{s['p50_ms'] or 0:>9} {s['p95_ms'] or 0:>9} {s['p99_ms'] or 0:>9}")
+
+
+# ===== SUITES =====
+
+def bench_pipeline(args):
+    """Upload a synthetic corpus, then replay questions through query_ai_ta and /chat"""
+    workdir = tempfile.mkdtemp(prefix="tutortron-bench-")
+    env = configure_stand_ins(args, workdir)
+
+    # Imported late so the environment above selects the backends
+    import instrumentation
+    import rag
+
+    recorder = StageRecorder()
+    instrumentation.add_listener(recorder)
+    results = {"upload": None, "targets": {}}
+
+    print(f"📄 Building corpus: {args.documents} documents x {args.pages} pages")
+    paths = build_corpus(workdir, args.documents, args.pages, args.seed)
+    upload_latencies, upload_errors, wall = run_concurrently(rag.upload_pdf, paths, 1)
+    results["upload"] = {"documents": summarize(upload_latencies, wall), "errors": upload_errors[:5],
+                         "stages": recorder.summary(wall)}
+    print_table("upload_pdf", {"total": results["upload"]["documents"], **results["upload"]["stages"]})
+
+    questions = build_questions(args.questions, args.seed, args.repeat_ratio)
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+
+    if "flask" in targets:
+        from app import app
+        from chat_storage import chat_storage
+        client_local = threading.local()
+
+        def get_client():
+            if not hasattr(client_local, "client"):
+                client_local.client = app.test_client()
+            return client_local.client
+
+    for target in targets:
+        results["targets"][target] = {}
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            recorder.reset()
+            if target == "rag":
+                def call(question):
+                    rag.query_ai_ta(question, threshold=args.threshold, top_k=args.top_k)
+            elif target == "flask":
+                chat_ids = [
+                    chat_storage.create_chat(f"bench_user_{i % 50}", "Benchmark chat")
+                    for i in range(concurrency)
+                ]
+                counter = iter(range(len(questions)))
+                counter_lock = threading.Lock()
+
+                def call(question):
+                    with counter_lock:
+                        n = next(counter)
+                    response = get_client().post("/chat", json={
+                        "message": question,
+                        "userId": f"bench_user_{n % 50}",
+                        "chatId": chat_ids[n % len(chat_ids)],
+                        "threshold": args.threshold,
+                        "top_k": args.top_k,
+                        "verbose": False,
+                    })
+                    if response.status_code != 200:
+                        raise RuntimeError(f"/chat returned {response.status_code}")
+            else:
+                raise SystemExit(f"Unknown target: {target}")
+
+            latencies, errors, wall = run_concurrently(call, questions, concurrency)
+            entry = {
+                "requests": summarize(latencies, wall),
+                "wall_seconds": round(wall, 3),
+                "errors": len(errors),
+                "error_samples": errors[:5],
+                "stages": recorder.summary(wall),
+            }
+            results["targets"][target][str(concurrency)] = entry
+            print_table(f"{target} @ concurrency {concurrency} ({len(errors)} errors)",
+                        {"request": entry["requests"], **entry["stages"]})
+
+    instrumentation.remove_listener(recorder)
+    config = {**vars(args), "environment": env}
+    config.pop("func", None)
+    return write_results(args.output or "benchmark-pipeline.json", "pipeline", config, results)
+
+
+def seed_storage(storage, args):
+    """Create args.users users with their chats and messages; returns {user_id: [chat_id, ...]}"""
+    users = [f"bench_user_{i}" for i in range(args.users)]
+    chats = {}
+    print(f"💬 Seeding {args.users} users x {args.chats_per_user} chats x {args.messages} messages")
+    for user_id in users:
+        storage.create_or_update_user(user_id, user_id, f"{user_id}@example.com")
+        chats[user_id] = []
+        for c in range(args.chats_per_user):
+            chat_id = storage.create_chat(user_id, f"Chat {c}")
+            for m in range(args.messages):
+                storage.add_message(chat_id, "user" if m % 2 == 0 else "assistant", f"Seed message {m}")
+            chats[user_id].append(chat_id)
+    return chats
+
+
+def bench_storage(args):
+    """Concurrent simulated users reading and writing chats through ChatStorage"""
+    workdir = tempfile.mkdtemp(prefix="tutortron-bench-")
+    from chat_storage import ChatStorage
+
+    storage = ChatStorage(os.path.join(workdir, "bench_storage.db"), pool_size=args.pool_size,
+                          write_behind=args.write_behind)
+    rng = random.Random(args.seed)
+    chats = seed_storage(storage, args)
+    users = list(chats)
+
+    operations = []
+    for _ in range(args.operations):
+        user_id = rng.choice(users)
+        kind = "read" if rng.random() < args.read_ratio else "write"
+        operations.append((kind, user_id, rng.choice(chats[user_id])))
+
+    results = {}
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        samples = {"read": [], "write": []}
+        lock = threading.Lock()
+
+        def call(operation):
+            kind, user_id, chat_id = operation
+            start = time.perf_counter()
+            if kind == "read":
+                storage.get_user_chats(user_id)
+                storage.get_chat_with_messages(chat_id, user_id)
+            else:
+                # The storage calls made by one /chat request
+                storage.create_or_update_user(user_id, user_id, f"{user_id}@example.com")
+                storage.add_message(chat_id, "user", "Benchmark question")
+                storage.add_message(chat_id, "assistant", "Benchmark answer")
+            with lock:
+                samples[kind].append(time.perf_counter() - start)
+
+        latencies, errors, wall = run_concurrently(call, operations, concurrency)
+        flush_start = time.perf_counter()
+        storage.flush()
+        flush_seconds = time.perf_counter() - flush_start
+        wall += flush_seconds
+        entry = {
+            "flush_seconds": round(flush_seconds, 3),
+            "all": summarize(latencies, wall),
+            "read": summarize(samples["read"], wall),
+            "write": summarize(samples["write"], wall),
+            "errors": len(errors),
+            "error_samples": errors[:5],
+        }
+        results[str(concurrency)] = entry
+        print_table(f"storage @ {concurrency} users ({len(errors)} errors)",
+                    {"all": entry["all"], "read": entry["read"], "write": entry["write"]})
+
+    storage.close()
+    config = {**vars(args)}
+    config.pop("func", None)
+    return write_results(args.output or "benchmark-storage.json", "storage", config, results)
+
+
+def bench_shards(args):
+    """Message write throughput with the chat database split over a growing number of shards"""
+    from chat_storage import open_chat_storage
+
+    results = {}
+    for shards in [int(n) for n in args.shards.split(",")]:
+        workdir = tempfile.mkdtemp(prefix="tutortron-bench-")
+        storage = open_chat_storage(os.path.join(workdir, "bench_shards.db"), shards,
+                                    pool_size=args.pool_size, write_behind=args.write_behind)
+        rng = random.Random(args.seed)
+        chats = seed_storage(storage, args)
+        operations = [(user_id, rng.choice(chats[user_id]))
+                      for user_id in (rng.choice(list(chats)) for _ in range(args.operations))]
+
+        def call(operation):
+            user_id, chat_id = operation
+            storage.create_or_update_user(user_id, user_id, f"{user_id}@example.com")
+            storage.add_message(chat_id, "user", "Benchmark question")
+            storage.add_message(chat_id, "assistant", "Benchmark answer")
+
+        latencies, errors, wall = run_concurrently(call, operations, args.concurrency)
+        flush_start = time.perf_counter()
+        storage.flush()
+        wall += time.perf_counter() - flush_start
+        entry = {
+            "write": summarize(latencies, wall),
+            "messages_per_second": round(2 * len(latencies) / wall, 1) if wall else None,
+            "errors": len(errors),
+            "error_samples": errors[:5],
+        }
+        results[str(shards)] = entry
+        print_table(f"writes @ {shards} shard(s), {args.concurrency} users ({len(errors)} errors)",
+                    {"write": entry["write"]})
+        storage.close()
+
+    config = {**vars(args)}
+    config.pop("func", None)
+    return write_results(args.output or "benchmark-shards.json", "shards", config, results)
+
+
+def legacy_moderation(keywords):
+    """The per-keyword substring scan that moderation.py replaced, as a baseline"""
+    def check(content):
+        content_lower = content.lower()
+        for keyword in keywords:
+            if keyword in content_lower:
+                return True, f"Contains inappropriate keyword: {keyword}"
+        if len(content) > 20 and sum(1 for c in content if c.isupper()) / len(content) > 0.7:
+            return True, "Excessive use of capital letters"
+        words = content.split()
+        if len(words) > 5:
+            word_counts = {}
+            for word in words:
+                word_counts[word] = word_counts.get(word, 0) + 1
+                if word_counts[word] > 5:
+                    return True, f"Excessive repetition of word: {word}"
+        return False, None
+    return check
+
+
+def bench_moderation(args):
+    """Moderation cost per KB of message as the keyword list grows"""
+    from moderation import ModerationEngine
+
+    rng = random.Random(args.seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    word = lambda: "".join(rng.choice(letters) for _ in range(rng.randint(5, 10)))
+    modes = args.modes.split(",")
+    # Clean text (no keyword hits, no word repeated often enough to flag) is
+    # the worst case: every check scans the whole message
+    vocabulary = sorted({word() for _ in range(20000)})
+    messages = {}
+    for size_kb in [int(v) for v in args.sizes_kb.split(",")]:
+        text = []
+        length = 0
+        while length < size_kb * 1024:
+            text.append(rng.choice(vocabulary).capitalize() if rng.random() < 0.1 else rng.choice(vocabulary))
+            length += len(text[-1]) + 1
+        messages[size_kb] = " ".join(text)[:size_kb * 1024]
+
+    known = set(vocabulary)
+    results = {}
+    print(f"\n  {'rules':>6} {'KB':>4} {'engine us/KB':>13} {'legacy us/KB':>13} {'compile ms':>11}")
+    for count in [int(v) for v in args.rules.split(",")]:
+        terms = set()
+        while len(terms) < count:
+            candidate = word()
+            if candidate not in known:
+                terms.add(candidate)
+        rules = {"keywords": [{"term": t, "mode": modes[i % len(modes)]} for i, t in enumerate(sorted(terms))]}
+        start = time.perf_counter()
+        engine = ModerationEngine(rules)
+        compile_ms = (time.perf_counter() - start) * 1000.0
+        legacy = legacy_moderation(sorted(terms))
+        for size_kb, text in messages.items():
+            row = {"compile_ms": round(compile_ms, 2)}
+            for name, check in (("engine", engine.check), ("legacy", legacy)):
+                timings = []
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    flagged, reason = check(text)
+                    timings.append(time.perf_counter() - start)
+                if flagged:
+                    print(f"⚠️  {name} flagged the clean text: {reason}")
+                row[f"{name}_us_per_kb"] = round(percentile(sorted(timings), 50) * 1e6 / size_kb, 2)
+            results[f"{count}x{size_kb}kb"] = {"rules": count, "size_kb": size_kb, **row}
+            print(f"  {count:>6} {size_kb:>4} {row['engine_us_per_kb']:>13} {row['legacy_us_per_kb']:>13} "
+                  f"{row['compile_ms']:>11}")
+
+    config = {**vars(args)}
+    config.pop("func", None)
+    return write_results(args.output or "benchmark-moderation.json", "moderation", config, results)
+
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(target, port, env, log, workers=1, threads=8, timeout=60):
+    """Start the dev server ("dev") or serve.py ("gunicorn") and wait until /health answers"""
+    if target == "dev":
+        # What `python app.py` runs, minus the reloader and debugger
+        command = [sys.executable, "-c", f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        command = [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}",
+                   "--workers", str(workers), "--threads", str(threads)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{target} server exited with {process.returncode}; see {log.name}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"{target} server did not become healthy within {timeout}s; see {log.name}")
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def bench_server(args):
+    """Throughput of the HTTP API under the dev server vs serve.py with several workers"""
+    workdir = tempfile.mkdtemp(prefix="tutortron-bench-")
+    configure_stand_ins(args, workdir)
+    rng = random.Random(args.seed)
+    questions = build_questions(args.operations, args.seed)
+    servers = [("dev", 1)] + [("gunicorn", int(w)) for w in args.workers.split(",")]
+    results = {}
+
+    for target, workers in servers:
+        name = "dev" if target == "dev" else f"gunicorn x{workers}"
+        port = free_port()
+        env = {**os.environ, "CHAT_DB_PATH": os.path.join(workdir, f"server-{target}-{workers}.db")}
+        log = open(os.path.join(workdir, f"server-{target}-{workers}.log"), "w")
+        print(f"🚀 Starting {name} on port {port}")
+        process = start_server(target, port, env, log, workers, args.threads)
+        local = threading.local()
+
+        def call(method, path, body=None):
+            if not hasattr(local, "connection"):
+                local.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            try:
+                local.connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+                response = local.connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                local.connection.close()  # reopened by the next request
+                raise
+            if response.status >= 400:
+                raise RuntimeError(f"{method} {path.split('?')[0]} returned {response.status}")
+            return json.loads(data)
+
+        try:
+            chats = []
+            for u in range(args.users):
+                user_id = f"bench_user_{u}"
+                created = call("POST", "/api/chats", {"userId": user_id, "title": "Benchmark chat",
+                                                      "userName": "Bench", "userEmail": f"{user_id}@example.com"})
+                chats.append((user_id, created["chatId"]))
+            operations = []
+            for question in questions:
+                user_id, chat_id = chats[rng.randrange(len(chats))]
+                kind = "turn"
+                if rng.random() < args.read_ratio:
+                    kind = "transcript" if rng.random() < 0.5 else "list"
+                operations.append((kind, user_id, chat_id, question))
+
+            def operation(item):
+                kind, user_id, chat_id, question = item
+                if kind == "turn":
+                    call("POST", "/chat", {"message": question, "userId": user_id, "chatId": chat_id,
+                                           "threshold": 0.0, "verbose": False})
+                elif kind == "transcript":
+                    call("GET", f"/api/chats/{chat_id}?userId={user_id}&limit=50")
+                else:
+                    call("GET", f"/api/chats?userId={user_id}")
+
+            latencies, errors, wall = run_concurrently(operation, operations, args.concurrency)
+            results[name] = {**summarize(latencies, wall), "errors": len(errors), "error_samples": errors[:5]}
+        finally:
+            stop_server(process)
+            log.close()
+
+    print_table(f"HTTP API @ concurrency {args.concurrency} ({args.read_ratio:.0%} reads)", results)
+    config = {**vars(args), "cpu_count": os.cpu_count()}
+    config.pop("func", None)
+    return write_results(args.output or "benchmark-server.json", "server", config, results)
+
+
+SUITES = {
+    "pipeline": bench_pipeline,
+    "storage": bench_storage,
+    "shards": bench_shards,
+    "moderation": bench_moderation,
+    "server": bench_server,
+}
+
+
+def add_latency_args(parser):
+    parser.add_argument("--embed-latency-ms", type=float, default=50, help="Simulated embedding latency")
+    parser.add_argument("--search-latency-ms", type=float, default=10, help="Simulated vector search latency")
+    parser.add_argument("--rerank-latency-ms", type=float, default=0, help="Simulated rerank latency")
+    parser.add_argument("--completion-latency-ms", type=float, default=800, help="Simulated completion latency")
+    parser.add_argument("--completion-jitter-ms", type=float, default=200, help="Random extra completion latency")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tutortron backend benchmarks")
+    subparsers = parser.add_subparsers(dest="suite", required=True)
+
+    p = subparsers.add_parser("pipeline", help="End-to-end RAG and /chat latency by stage")
+    p.add_argument("--documents", type=int, default=5, help="Synthetic PDFs to upload")
+    p.add_argument("--pages", type=int, default=10, help="Pages per synthetic PDF")
+    p.add_argument("--questions", type=int, default=200, help="Questions per concurrency level")
+    p.add_argument("--repeat-ratio", type=float, default=0.0, help="Fraction of repeated questions")
+    p.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    p.add_argument("--targets", default="rag,flask", help="Comma-separated: rag, flask")
+    p.add_argument("--threshold", type=float, default=0.0,
+                   help="Similarity threshold (0 sends every question through generation)")
+    p.add_argument("--top-k", type=int, default=8)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", help="Where to write the JSON results")
+    add_latency_args(p)
+
+    p = subparsers.add_parser("storage", help="ChatStorage read/write throughput under concurrent users")
+    p.add_argument("--users", type=int, default=200, help="Distinct users to seed")
+    p.add_argument("--chats-per-user", type=int, default=3)
+    p.add_argument("--messages", type=int, default=10, help="Seed messages per chat")
+    p.add_argument("--operations", type=int, default=2000, help="Operations per concurrency level")
+    p.add_argument("--read-ratio", type=float, default=0.8, help="Fraction of operations that are reads")
+    p.add_argument("--concurrency", default="1,16,64", help="Comma-separated concurrent users")
+    p.add_argument("--pool-size", type=int, default=16, help="ChatStorage connection pool size")
+    p.add_argument("--write-behind", action="store_true", help="Queue message writes for group commit")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", help="Where to write the JSON results")
+
+    p = subparsers.add_parser("shards", help="Chat write throughput as the shard count grows")
+    p.add_argument("--shards", default="1,2,4,8", help="Comma-separated shard counts")
+    p.add_argument("--users", type=int, default=200, help="Distinct users to seed")
+    p.add_argument("--chats-per-user", type=int, default=2)
+    p.add_argument("--messages", type=int, default=4, help="Seed messages per chat")
+    p.add_argument("--operations", type=int, default=2000, help="Chat turns (two message writes each) per shard count")
+    p.add_argument("--concurrency", type=int, default=64, help="Concurrent users")
+    p.add_argument("--pool-size", type=int, default=16, help="Connection pool size per shard")
+    p.add_argument("--write-behind", action="store_true", help="Queue message writes for group commit")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", help="Where to write the JSON results")
+
+    p = subparsers.add_parser("moderation", help="Moderation cost per KB as the keyword list grows")
+    p.add_argument("--rules", default="10,100,1000,5000", help="Comma-separated keyword counts")
+    p.add_argument("--sizes-kb", default="1,16", help="Comma-separated message sizes in KB")
+    p.add_argument("--modes", default="word,prefix,substring", help="Keyword modes to cycle through")
+    p.add_argument("--repeats", type=int, default=50, help="Timed checks per rule count and size")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", help="Where to write the JSON results")
+
+    p = subparsers.add_parser("server", help="HTTP throughput: dev server vs serve.py workers")
+    p.add_argument("--workers", default="1,4", help="Comma-separated serve.py worker counts")
+    p.add_argument("--threads", type=int, default=32, help="Threads per serve.py worker")
+    p.add_argument("--users", type=int, default=50, help="Users, one chat each")
+    p.add_argument("--operations", type=int, default=2000, help="Requests per server")
+    p.add_argument("--read-ratio", type=float, default=0.5, help="Fraction of requests that read a chat or chat list")
+    p.add_argument("--concurrency", type=int, default=64, help="Concurrent clients")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--output", help="Where to write the JSON results")
+    add_latency_args(p)
+
+    args = parser.parse_args(argv)
+    from log_config import configure_logging
+    configure_logging()
+    SUITES[args.suite](args)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
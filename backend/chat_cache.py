@@ -0,0 +1,218 @@
+# backend/chat_cache.py - Memory-capped cache of serialized chat responses
+"""
+Caches the JSON bodies of the chat read routes (a chat transcript, a page
+of a user's chat list) with their ETags, so repeat reads cost neither a
+query nor re-serialization, and unchanged data can be answered with 304.
+
+Entries are tagged with the chat and user they depend on. ChatStorage
+change listeners call ``invalidate(chat_id, user_id)`` after every write,
+which drops the chat's transcripts and its owner's chat lists. A load that
+overlaps an invalidation of one of its tags is not stored, so a slow read
+can't put back data a write has already replaced.
+
+Entries are kept per process, but when each tag was last invalidated is
+recorded in shared memory (TagVersions). Worker processes forked after this
+module is imported (serve.py preloads the app) therefore drop entries that
+another worker's write made stale. Separate processes such as
+remoderate.py don't share it; CHAT_CACHE_TTL_SECONDS bounds how stale their
+writes can leave a running app.
+
+    CHAT_CACHE_MB [64]   CHAT_CACHE_TTL_SECONDS [0 = until invalidated]
+    CHAT_CACHE_VERSION_SLOTS [65536]
+"""
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from metrics import REGISTRY, record_cache
+
+CACHE_MB = float(os.getenv("CHAT_CACHE_MB", 64))
+CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", 0))
+VERSION_SLOTS = int(os.getenv("CHAT_CACHE_VERSION_SLOTS", 65536))
+# Entries larger than this share of the budget are not cached
+MAX_ENTRY_SHARE = 0.125
+# Bookkeeping per entry on top of the body, roughly
+ENTRY_OVERHEAD_BYTES = 256
+MAX_TRACKED = 100000
+# Waiting longer than this for the shared lock means its holder died
+VERSION_LOCK_TIMEOUT = 0.5
+
+ALL_LISTS = ("lists",)
+EVERYTHING = ("all",)
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(body):
+    """Strong validator for a response body (unquoted, as werkzeug's set_etag expects)"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class TagVersions:
+    """When each tag was last invalidated, in memory shared with forked child processes.
+
+    Tags hash into ``slots`` counters of an anonymous shared mapping (a
+    collision only costs extra misses). Invalidating tags stores the next
+    value of a global sequence, kept in counter 0, in their slots. Data
+    loaded when the sequence stood at N is current as long as none of its
+    tags' slots has moved past N.
+    """
+
+    def __init__(self, slots=VERSION_SLOTS):
+        self.slots = max(1, slots)
+        self._memory = mmap.mmap(-1, 8 * (self.slots + 1))
+        self._values = memoryview(self._memory).cast("Q")
+        self._lock = multiprocessing.Lock()
+        self._locking = True
+
+    def slot(self, tag):
+        return 1 + zlib.crc32(repr(tag).encode("utf-8")) % self.slots
+
+    def current(self):
+        return self._values[0]
+
+    def changed_since(self, slots, sequence):
+        values = self._values
+        return any(values[slot] > sequence for slot in slots)
+
+    def bump(self, slots):
+        locked = self._locking and self._lock.acquire(timeout=VERSION_LOCK_TIMEOUT)
+        if self._locking and not locked:
+            # A process died holding the lock; carry on unlocked rather than stall every write
+            self._locking = False
+            logger.error("❌ Chat cache version lock is stuck; invalidating without it")
+        try:
+            sequence = self._values[0] + 1
+            self._values[0] = sequence
+            for slot in slots:
+                self._values[slot] = sequence
+        finally:
+            if locked:
+                self._lock.release()
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "tags", "slots", "loaded", "size", "expires")
+
+    def __init__(self, body, etag, tags, slots, loaded, expires):
+        self.body = body
+        self.etag = etag
+        self.tags = tags
+        self.slots = slots
+        self.loaded = loaded
+        self.size = len(body) + ENTRY_OVERHEAD_BYTES
+        self.expires = expires
+
+
+class ChatCache:
+    """LRU cache of response bodies, bounded by total bytes, with tag invalidation"""
+
+    def __init__(self, max_bytes=int(CACHE_MB * 1024 * 1024), ttl=CACHE_TTL_SECONDS, versions=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.versions = versions or TagVersions()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> _Entry
+        self._tagged = {}  # tag -> set of keys
+        self._owners = OrderedDict()  # chat_id -> user_id, learned from cached responses
+        self._bytes = 0
+
+    def get(self, kind, key):
+        """(body, etag) for ``key``, or None; counted as a ``kind`` cache lookup"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.expires and entry.expires < time.monotonic()
+                                      or self.versions.changed_since(entry.slots, entry.loaded)):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache(kind, entry is not None)
+        return (entry.body, entry.etag) if entry else None
+
+    def token(self):
+        """Take before loading; put() refuses the result if a tag was invalidated since"""
+        return self.versions.current()
+
+    def put(self, key, body, token, chat_id=None, user_id=None, chat_ids=()):
+        """Cache ``body`` for a transcript (``chat_id``) or one of ``user_id``'s chat lists; returns its ETag.
+
+        ``chat_ids`` are the chats a list contains; with ``user_id`` they teach
+        the cache which user to invalidate when one of them changes.
+        """
+        etag = make_etag(body)
+        if chat_id is not None:
+            tags = (("chat", chat_id),)
+        else:
+            tags = (("user", user_id), ALL_LISTS)
+        slots = tuple(self.versions.slot(tag) for tag in tags + (EVERYTHING,))
+        entry = _Entry(body, etag, tags, slots, token, time.monotonic() + self.ttl if self.ttl else 0)
+        if entry.size > self.max_bytes * MAX_ENTRY_SHARE:
+            return etag
+        with self._lock:
+            if self.versions.changed_since(slots, token):
+                return etag
+            for owned in ([chat_id] if chat_id is not None else chat_ids):
+                if user_id is not None:
+                    self._owners[owned] = user_id
+                    self._owners.move_to_end(owned)
+            while len(self._owners) > MAX_TRACKED:
+                self._owners.popitem(last=False)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return etag
+
+    def invalidate(self, chat_id=None, user_id=None):
+        """Drop what depends on ``chat_id`` and its owner's chat lists; everything if chat_id is None"""
+        with self._lock:
+            if chat_id is None and user_id is None:
+                self.versions.bump([self.versions.slot(EVERYTHING)])
+                self._entries.clear()
+                self._tagged.clear()
+                self._bytes = 0
+                return
+            # With the owner unknown, every user's lists may show this chat
+            owner = user_id or self._owners.get(chat_id)
+            tags = [("user", owner) if owner else ALL_LISTS]
+            if chat_id is not None:
+                tags.append(("chat", chat_id))
+            # Other processes see the new versions; here the entries go at once
+            self.versions.bump([self.versions.slot(tag) for tag in tags])
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+chat_cache = ChatCache()
+
+REGISTRY.gauge(
+    "tutortron_chat_cache_bytes",
+    "Approximate memory held by the chat response cache",
+    callback=lambda: chat_cache.stats()["bytes"]
+)
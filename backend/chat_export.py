@@ -0,0 +1,112 @@
+# backend/chat_export.py - Streaming NDJSON export and bulk import of chats
+"""
+Chats are exported as NDJSON, one record per line: every user first
+({"type": "user", ...}), then every chat with its messages
+({"type": "chat", ..., "messages": [...]}). The output is produced
+batch by batch from ChatStorage.iter_export, so memory stays flat
+however many chats there are, and can be gzip-compressed on the fly.
+
+The importer reads the same format (plain or gzip, detected from the
+file) and loads it with ChatStorage.import_records in batched
+transactions. Ids already present are skipped.
+
+    GET /api/admin/export?compress=gzip        (app.py)
+    python maintenance.py export --output chats.ndjson.gz
+    python maintenance.py import chats.ndjson.gz
+"""
+import gzip
+import json
+import sys
+import zlib
+
+# Bytes of NDJSON gathered before a chunk is compressed and sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def export_lines(storage, user_id=None):
+    """NDJSON lines for every export record"""
+    for record in storage.iter_export(user_id):
+        yield json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def export_chunks(storage, user_id=None, compress=False, chunk_size=EXPORT_CHUNK_BYTES):
+    """The export as byte chunks of about ``chunk_size``, gzip-compressed if ``compress``"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip framing
+    buffer = []
+    buffered = 0
+    for line in export_lines(storage, user_id):
+        data = line.encode("utf-8")
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= chunk_size:
+            chunk = b"".join(buffer)
+            buffer, buffered = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def read_records(lines):
+    """Parse NDJSON lines into records, skipping blank lines"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {number}: invalid JSON ({e})")
+
+
+def open_dump(path, mode):
+    """Open an export file for reading ("r") or writing ("w"); gzip when the name ends in .gz
+    (or, for reading, when the content is gzip). "-" is stdin/stdout.
+
+    For reading, returns (stream, raw): closing a gzip stream does not close
+    the file under it, so the caller closes both.
+    """
+    if mode == "w":
+        if path == "-":
+            return sys.stdout.buffer
+        return gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+    raw = sys.stdin.buffer if path == "-" else open(path, "rb")
+    if raw.peek(2)[:2] == b"\x1f\x8b":
+        return gzip.open(raw), raw
+    return raw, raw
+
+
+def export_to_file(storage, path, user_id=None):
+    """Write the export to ``path``; returns the number of records"""
+    out = open_dump(path, "w")
+    count = 0
+    try:
+        # The file object does its own compression
+        for line in export_lines(storage, user_id):
+            out.write(line.encode("utf-8"))
+            count += 1
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        else:
+            out.flush()
+    return count
+
+
+def import_from_file(storage, path, batch_size=None):
+    """Load an export file; returns the users, chats and messages inserted"""
+    source, raw = open_dump(path, "r")
+    try:
+        lines = (line.decode("utf-8") for line in source)
+        if batch_size:
+            return storage.import_records(read_records(lines), batch_size)
+        return storage.import_records(read_records(lines))
+    finally:
+        if source is not raw:
+            source.close()
+        if raw is not sys.stdin.buffer:
+            raw.close()
@@ -4,19 +4,696 @@ import json
 import datetime
 import uuid
 import time
+import base64
+import zlib
+import re
+import queue
+import threading
+import atexit
+import heapq
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 import logging
+import os
+from instrumentation import timed
+from metrics import instrument_methods, record_cache, REGISTRY, STORAGE_SECONDS, STORAGE_ERRORS
 
 logger = logging.getLogger(__name__)
 
+# Connection pool and SQLite tuning (sizes in KiB/MiB, times in ms)
+POOL_SIZE = int(os.getenv('CHAT_DB_POOL_SIZE', 16))
+POOL_TIMEOUT_MS = int(os.getenv('CHAT_DB_POOL_TIMEOUT_MS', 10000))
+BUSY_TIMEOUT_MS = int(os.getenv('CHAT_DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.getenv('CHAT_DB_CACHE_KB', 16384))
+MMAP_SIZE_MB = int(os.getenv('CHAT_DB_MMAP_MB', 256))
+CACHED_STATEMENTS = int(os.getenv('CHAT_DB_CACHED_STATEMENTS', 256))
+
+MAX_SEARCH_TERMS = 16
+
+# Searches rank only the newest matches, bounding the cost of common words
+SEARCH_CANDIDATES = int(os.getenv('CHAT_SEARCH_CANDIDATES', 2000))
+
+# Known users are cached so repeat requests skip the users upsert
+USER_CACHE_SIZE = int(os.getenv('CHAT_USER_CACHE_SIZE', 10000))
+USER_ACTIVE_INTERVAL = float(os.getenv('CHAT_USER_ACTIVE_INTERVAL_SECONDS', 300))
+
+# Separate databases, each with its own pool and writer, that users are hashed
+# across (chats.shard0of4.db, ...); changing the count needs `maintenance.py reshard`
+SHARDS = int(os.getenv('CHAT_DB_SHARDS', 1))
+CHAT_SHARD_CACHE_SIZE = int(os.getenv('CHAT_SHARD_CACHE_SIZE', 100000))
+
+# Chats per read batch when exporting, and rows (chats + messages) per import transaction
+EXPORT_BATCH_SIZE = int(os.getenv('CHAT_EXPORT_BATCH_SIZE', 100))
+IMPORT_BATCH_SIZE = int(os.getenv('CHAT_IMPORT_BATCH_SIZE', 5000))
+
+# Chats untouched this long can be moved to the compressed archive (maintenance.py archive)
+ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_COLUMNS = ('rowid', 'id', 'role', 'content', 'timestamp', 'is_flagged', 'flag_reason', 'metadata')
+
+# Active users need a range scan, so that one statistic is cached
+STATS_TTL_SECONDS = float(os.getenv('CHAT_STATS_TTL_SECONDS', 60))
+
+# Optional write-behind for messages: queued and group-committed by a background writer
+WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes', 'on')
+WRITE_QUEUE_SIZE = int(os.getenv('CHAT_WRITE_QUEUE_SIZE', 10000))
+WRITE_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BATCH_SIZE', 500))
+WRITE_LINGER_MS = float(os.getenv('CHAT_WRITE_LINGER_MS', 2))
+WRITE_SHUTDOWN_TIMEOUT = float(os.getenv('CHAT_WRITE_SHUTDOWN_TIMEOUT', 30))
+
+MESSAGE_ROLES = ('user', 'assistant', 'system')
+
+WRITE_QUEUE_DEPTH = REGISTRY.gauge(
+    'tutortron_chat_write_queue_depth',
+    'Messages queued for the write-behind writer'
+)
+WRITE_BATCH_ROWS = REGISTRY.histogram(
+    'tutortron_chat_write_batch_rows',
+    'Messages per group-committed write-behind transaction',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+WRITE_DROPPED = REGISTRY.counter(
+    'tutortron_chat_write_dropped_total',
+    'Queued messages the write-behind writer could not store'
+)
+
+# Schema migrations applied in order on startup; PRAGMA user_version records
+# the last one applied. Each entry is (version, description, statements).
+MIGRATIONS = [
+    (1, "denormalized chat counters", [
+        'ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE chats ADD COLUMN flagged_message_count INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE chats ADD COLUMN last_message_at TIMESTAMP',
+        '''
+            UPDATE chats SET
+                message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id),
+                flagged_message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id AND is_flagged = TRUE),
+                last_message_at = (SELECT MAX(timestamp) FROM messages WHERE chat_id = chats.id)
+        ''',
+        # Keep the counters current as messages are added, flagged and deleted
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_count_insert AFTER INSERT ON messages
+            BEGIN
+                UPDATE chats SET
+                    message_count = message_count + 1,
+                    flagged_message_count = flagged_message_count + (CASE WHEN NEW.is_flagged THEN 1 ELSE 0 END),
+                    last_message_at = MAX(COALESCE(last_message_at, NEW.timestamp), NEW.timestamp)
+                WHERE id = NEW.chat_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_count_flag AFTER UPDATE OF is_flagged ON messages
+            WHEN (CASE WHEN OLD.is_flagged THEN 1 ELSE 0 END) != (CASE WHEN NEW.is_flagged THEN 1 ELSE 0 END)
+            BEGIN
+                UPDATE chats SET
+                    flagged_message_count = flagged_message_count + (CASE WHEN NEW.is_flagged THEN 1 ELSE -1 END)
+                WHERE id = NEW.chat_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_count_delete AFTER DELETE ON messages
+            BEGIN
+                UPDATE chats SET
+                    message_count = message_count - 1,
+                    flagged_message_count = flagged_message_count - (CASE WHEN OLD.is_flagged THEN 1 ELSE 0 END),
+                    last_message_at = CASE WHEN last_message_at = OLD.timestamp
+                        THEN (SELECT MAX(timestamp) FROM messages WHERE chat_id = OLD.chat_id)
+                        ELSE last_message_at END
+                WHERE id = OLD.chat_id;
+            END
+        ''',
+    ]),
+    (2, "keyset pagination indexes", [
+        'CREATE INDEX IF NOT EXISTS idx_chats_user_updated ON chats (user_id, updated_at DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_updated_id ON chats (updated_at DESC, id DESC)',
+        # Both are prefixes of the composite indexes above
+        'DROP INDEX IF EXISTS idx_chats_user_id',
+        'DROP INDEX IF EXISTS idx_chats_updated_at',
+    ]),
+    (3, "message paging index", [
+        # Index entries end with the rowid, so (timestamp, rowid) order is served by the index
+        'CREATE INDEX IF NOT EXISTS idx_messages_chat_time ON messages (chat_id, timestamp)',
+        'DROP INDEX IF EXISTS idx_messages_chat_id',
+    ]),
+    (4, "statistics counters", [
+        'CREATE TABLE IF NOT EXISTS stats_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)',
+        '''
+            INSERT OR REPLACE INTO stats_counters (name, value)
+            SELECT 'total_chats', COUNT(*) FROM chats
+            UNION ALL SELECT 'flagged_chats', COUNT(*) FROM chats WHERE is_flagged = TRUE
+            UNION ALL SELECT 'total_messages', COUNT(*) FROM messages
+            UNION ALL SELECT 'flagged_messages', COUNT(*) FROM messages WHERE is_flagged = TRUE
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS chats_stats_insert AFTER INSERT ON chats
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_chats';
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'flagged_chats' AND NEW.is_flagged;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS chats_stats_delete AFTER DELETE ON chats
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_chats';
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'flagged_chats' AND OLD.is_flagged;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS chats_stats_flag AFTER UPDATE OF is_flagged ON chats
+            WHEN (CASE WHEN OLD.is_flagged THEN 1 ELSE 0 END) != (CASE WHEN NEW.is_flagged THEN 1 ELSE 0 END)
+            BEGIN
+                UPDATE stats_counters SET value = value + (CASE WHEN NEW.is_flagged THEN 1 ELSE -1 END)
+                WHERE name = 'flagged_chats';
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_stats_insert AFTER INSERT ON messages
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_messages';
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'flagged_messages' AND NEW.is_flagged;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_stats_delete AFTER DELETE ON messages
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_messages';
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'flagged_messages' AND OLD.is_flagged;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_stats_flag AFTER UPDATE OF is_flagged ON messages
+            WHEN (CASE WHEN OLD.is_flagged THEN 1 ELSE 0 END) != (CASE WHEN NEW.is_flagged THEN 1 ELSE 0 END)
+            BEGIN
+                UPDATE stats_counters SET value = value + (CASE WHEN NEW.is_flagged THEN 1 ELSE -1 END)
+                WHERE name = 'flagged_messages';
+            END
+        ''',
+    ]),
+    (5, "full-text search", [
+        # External-content FTS5 indexes over views that add the owner as a
+        # hex token, so per-user searches intersect posting lists inside FTS5.
+        # Indexed by rowid: call rebuild_search_index() after VACUUM.
+        '''
+            CREATE VIEW IF NOT EXISTS messages_search AS
+            SELECT m.rowid AS message_rowid, m.content AS content, hex(c.user_id) AS owner
+            FROM messages m JOIN chats c ON c.id = m.chat_id
+        ''',
+        '''
+            CREATE VIEW IF NOT EXISTS chats_search AS
+            SELECT rowid AS chat_rowid, title, hex(user_id) AS owner FROM chats
+        ''',
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content, owner, content='messages_search', content_rowid='message_rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''',
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5(
+                title, owner, content='chats_search', content_rowid='chat_rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''',
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+        "INSERT INTO chats_fts (chats_fts) VALUES ('rebuild')",
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+            BEGIN
+                INSERT INTO messages_fts (rowid, content, owner)
+                VALUES (NEW.rowid, NEW.content, (SELECT hex(user_id) FROM chats WHERE id = NEW.chat_id));
+            END
+        ''',
+        # Runs while the chat still exists: delete_chat removes messages first
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content, owner)
+                VALUES ('delete', OLD.rowid, OLD.content, (SELECT hex(user_id) FROM chats WHERE id = OLD.chat_id));
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content, owner)
+                VALUES ('delete', OLD.rowid, OLD.content, (SELECT hex(user_id) FROM chats WHERE id = OLD.chat_id));
+                INSERT INTO messages_fts (rowid, content, owner)
+                VALUES (NEW.rowid, NEW.content, (SELECT hex(user_id) FROM chats WHERE id = NEW.chat_id));
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS chats_fts_insert AFTER INSERT ON chats
+            BEGIN
+                INSERT INTO chats_fts (rowid, title, owner) VALUES (NEW.rowid, NEW.title, hex(NEW.user_id));
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS chats_fts_delete AFTER DELETE ON chats
+            BEGIN
+                INSERT INTO chats_fts (chats_fts, rowid, title, owner) VALUES ('delete', OLD.rowid, OLD.title, hex(OLD.user_id));
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS chats_fts_update AFTER UPDATE OF title ON chats
+            BEGIN
+                INSERT INTO chats_fts (chats_fts, rowid, title, owner) VALUES ('delete', OLD.rowid, OLD.title, hex(OLD.user_id));
+                INSERT INTO chats_fts (rowid, title, owner) VALUES (NEW.rowid, NEW.title, hex(NEW.user_id));
+            END
+        ''',
+    ]),
+    (6, "chat archive", [
+        '''
+            CREATE TABLE IF NOT EXISTS chat_archive (
+                chat_id TEXT PRIMARY KEY,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                message_count INTEGER NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                compressed_bytes INTEGER NOT NULL,
+                messages BLOB NOT NULL -- zlib-compressed JSON rows
+            )
+        ''',
+        # Moving messages between the hot table and the archive must not change
+        # the counters, so the counter triggers skip chats with an archive row
+        # (archiving inserts it before deleting messages; restoring removes it last)
+        'DROP TRIGGER IF EXISTS messages_count_insert',
+        'DROP TRIGGER IF EXISTS messages_count_delete',
+        'DROP TRIGGER IF EXISTS messages_stats_insert',
+        'DROP TRIGGER IF EXISTS messages_stats_delete',
+        '''
+            CREATE TRIGGER messages_count_insert AFTER INSERT ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM chat_archive WHERE chat_id = NEW.chat_id)
+            BEGIN
+                UPDATE chats SET
+                    message_count = message_count + 1,
+                    flagged_message_count = flagged_message_count + (CASE WHEN NEW.is_flagged THEN 1 ELSE 0 END),
+                    last_message_at = MAX(COALESCE(last_message_at, NEW.timestamp), NEW.timestamp)
+                WHERE id = NEW.chat_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER messages_count_delete AFTER DELETE ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM chat_archive WHERE chat_id = OLD.chat_id)
+            BEGIN
+                UPDATE chats SET
+                    message_count = message_count - 1,
+                    flagged_message_count = flagged_message_count - (CASE WHEN OLD.is_flagged THEN 1 ELSE 0 END),
+                    last_message_at = CASE WHEN last_message_at = OLD.timestamp
+                        THEN (SELECT MAX(timestamp) FROM messages WHERE chat_id = OLD.chat_id)
+                        ELSE last_message_at END
+                WHERE id = OLD.chat_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER messages_stats_insert AFTER INSERT ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM chat_archive WHERE chat_id = NEW.chat_id)
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_messages';
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'flagged_messages' AND NEW.is_flagged;
+            END
+        ''',
+        '''
+            CREATE TRIGGER messages_stats_delete AFTER DELETE ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM chat_archive WHERE chat_id = OLD.chat_id)
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_messages';
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'flagged_messages' AND OLD.is_flagged;
+            END
+        ''',
+    ]),
+]
+
+
+_SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(text: str) -> List[str]:
+    """Words of a search query; raises ValueError if there are none"""
+    tokens = _SEARCH_TOKEN_RE.findall(text or '')[:MAX_SEARCH_TERMS]
+    if not tokens:
+        raise ValueError("Search query must contain at least one word")
+    return tokens
+
+
+def build_fts_query(tokens: List[str], column: str, user_id: str = None) -> str:
+    """Safe FTS5 query on ``column``: every word must match, the last as a prefix.
+    
+    Words are quoted, so FTS5 operators and syntax in user input are inert.
+    With ``user_id`` the query is restricted to that owner's rows.
+    """
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    query = f"{column} : ({' '.join(terms)})"
+    if user_id:
+        query = f'owner : "{user_id.encode().hex()}" AND {query}'
+    return query
+
+
+def make_snippet(content: str, tokens: List[str], words: int = 24) -> str:
+    """A window of ``content`` around the first matching word, matches in [brackets]"""
+    # Earlier words match whole, the last as a prefix, like the FTS query
+    alternatives = [re.escape(t) + r'\b' for t in tokens[:-1]] + [re.escape(tokens[-1]) + r'\w*']
+    pattern = re.compile(r'\b(?:' + '|'.join(alternatives) + ')', re.IGNORECASE)
+    parts = content.split()
+    first = next((i for i, part in enumerate(parts) if pattern.search(part)), 0)
+    start = max(0, first - words // 4)
+    window = parts[start:start + words]
+    text = ' '.join(pattern.sub(lambda m: f'[{m.group(0)}]', part) for part in window)
+    return ('…' if start > 0 else '') + text + ('…' if start + words < len(parts) else '')
+
+
+def encode_cursor(*values) -> str:
+    """Opaque pagination cursor holding the sort key of the last row returned"""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Sort key from ``encode_cursor``; raises ValueError for malformed cursors"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def shard_index(user_id: str, shards: int) -> int:
+    """The shard holding ``user_id``'s data; stable across processes and restarts"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % shards if shards > 1 else 0
+
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """Database files of a ``shards``-way split of ``db_path``"""
+    if shards <= 1:
+        return [db_path]
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.shard{i}of{shards}{ext or '.db'}" for i in range(shards)]
+
+
+# Storages whose connections, locks and threads are replaced in a forked child
+_live_storages = weakref.WeakSet()
+# A child never touches (or closes) the parent's connections: SQLite locks and
+# WAL state are per process, so they are kept here instead of being collected
+_inherited_connections = []
+
+
+def _reset_after_fork():
+    for storage in list(_live_storages):
+        storage._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _utc_timestamp():
+    """Current time in the format SQLite's CURRENT_TIMESTAMP uses"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class MessageWriter:
+    """Background writer that group-commits queued messages.
+    
+    Callers enqueue complete rows (ids and timestamps assigned up front) and
+    return immediately; the writer drains up to ``batch_size`` rows into one
+    transaction, so one commit covers many messages. The queue is bounded:
+    when it is full, enqueue blocks (backpressure) and then raises.
+    
+    Callers already hold the ids of queued messages, so a failed group
+    commit is retried row by row: only rows that fail on their own are
+    dropped. Those are logged and counted in ``failed`` and
+    tutortron_chat_write_dropped_total; flush() does not report them.
+    """
+    
+    def __init__(self, storage, max_queue: int = WRITE_QUEUE_SIZE, batch_size: int = WRITE_BATCH_SIZE,
+                 linger: float = WRITE_LINGER_MS / 1000.0):
+        self.storage = storage
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._pending = {}  # chat_id -> queued or in-flight messages
+        self._pending_cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.committed = 0
+        self.failed = 0
+    
+    def _ensure_started(self):
+        # Threads do not survive fork, so a forked worker starts its own writer
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='chat-message-writer', daemon=True)
+                self._thread.start()
+    
+    def enqueue(self, row, timeout: float = POOL_TIMEOUT_MS / 1000.0):
+        """Queue one message row (id, chat_id, role, content, timestamp, is_flagged, flag_reason, metadata)"""
+        self._ensure_started()
+        chat_id = row[1]
+        with self._pending_cond:
+            self._pending[chat_id] = self._pending.get(chat_id, 0) + 1
+        try:
+            self._queue.put(row, timeout=timeout)
+        except queue.Full:
+            self._done([row])
+            raise sqlite3.OperationalError("Message write queue is full")
+        WRITE_QUEUE_DEPTH.inc()
+    
+    def _done(self, rows):
+        with self._pending_cond:
+            for row in rows:
+                remaining = self._pending.get(row[1], 0) - 1
+                if remaining > 0:
+                    self._pending[row[1]] = remaining
+                else:
+                    self._pending.pop(row[1], None)
+            self._pending_cond.notify_all()
+    
+    def wait_for_chat(self, chat_id, timeout: float = None) -> bool:
+        """Block until every queued message of ``chat_id`` is committed"""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: chat_id not in self._pending, timeout)
+    
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every queued message is committed"""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: not self._pending, timeout)
+    
+    def pending(self) -> int:
+        return self._queue.qsize()
+    
+    def _after_fork(self):
+        # The parent's queued rows are the parent's to commit
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        WRITE_QUEUE_DEPTH.set(0)
+    
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            if self.linger:
+                time.sleep(self.linger)  # let concurrent writers join this commit
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            WRITE_QUEUE_DEPTH.dec(len(rows))
+            try:
+                self._write(rows)
+            finally:
+                self._done(rows)
+    
+    def _write(self, rows):
+        try:
+            self.storage._insert_messages(rows)
+            self.committed += len(rows)
+            WRITE_BATCH_ROWS.observe(len(rows))
+        except Exception as e:
+            # Isolate the bad row(s) so one failure doesn't drop the whole batch
+            logger.error(f"❌ Group commit of {len(rows)} messages failed ({e}); retrying row by row")
+            for row in rows:
+                try:
+                    self.storage._insert_messages([row])
+                    self.committed += 1
+                except Exception as row_error:
+                    self.failed += 1
+                    WRITE_DROPPED.inc()
+                    logger.error(f"❌ Dropped queued message {row[0]} for chat {row[1]}: {row_error}")
+
+
+@instrument_methods(STORAGE_SECONDS, STORAGE_ERRORS)
 class ChatStorage:
-    def __init__(self, db_path='chats.db'):
+    def __init__(self, db_path='chats.db', pool_size: int = POOL_SIZE, write_behind: bool = WRITE_BEHIND):
         self.db_path = db_path
+        self.pool_size = max(1, pool_size)
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._pool_lock = threading.Lock()
+        self._open_connections = 0
+        # Writers queue here instead of in SQLite's sleep-and-retry busy handler
+        self._write_lock = threading.Lock()
+        self._active_users = None  # (count, expires_at)
+        self._active_users_lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> ((name, email, role), written_at)
+        self._users_lock = threading.Lock()
+        self._change_listeners = []
+        _live_storages.add(self)
         self.init_database()
+        self.writer = None
+        if write_behind:
+            self.writer = MessageWriter(self)
+            # Durable shutdown: commit whatever is still queued before exiting
+            atexit.register(self.flush, WRITE_SHUTDOWN_TIMEOUT)
+            logger.info("✓ Message write-behind enabled")
+    
+    # ===== CONNECTION POOL =====
+    
+    def _connect(self):
+        """Open a tuned connection; pooled connections are shared across threads one at a time"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000.0,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA synchronous = NORMAL')  # durable across app crashes in WAL mode
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE_MB * 1024 * 1024}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+    
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._open_connections < self.pool_size:
+                self._open_connections += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._open_connections -= 1
+                    raise
+        try:
+            return self._pool.get(timeout=POOL_TIMEOUT_MS / 1000.0)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Timed out waiting for a database connection (pool size {self.pool_size})")
+    
+    def _release(self, conn, broken=False):
+        if broken:
+            with self._pool_lock:
+                self._open_connections -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        self._pool.put(conn)
+    
+    @contextmanager
+    def _connection(self, write=False):
+        """Borrow a pooled connection; commits on success and rolls back on error.
+        
+        ``write=True`` serializes the transaction with other writers in this process.
+        """
+        conn = self._acquire()
+        broken = False
+        if write:
+            self._write_lock.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                broken = True
+            raise
+        finally:
+            if write:
+                self._write_lock.release()
+            self._release(conn, broken)
+    
+    def close(self):
+        """Close idle pooled connections"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            self._release(conn, broken=True)
+    
+    def _after_fork(self):
+        """Start a forked child with an empty pool and fresh locks (the parent's may be held)"""
+        while True:
+            try:
+                _inherited_connections.append(self._pool.get_nowait())
+            except queue.Empty:
+                break
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._pool_lock = threading.Lock()
+        self._open_connections = 0
+        self._write_lock = threading.Lock()
+        self._active_users_lock = threading.Lock()
+        self._users_lock = threading.Lock()
+        if self.writer is not None:
+            self.writer._after_fork()
+    
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until queued write-behind messages are committed"""
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+    
+    def ping(self):
+        """Cheap connectivity check for readiness probes; raises if the database is unusable"""
+        with self._connection() as conn:
+            conn.execute('SELECT 1').fetchone()
+    
+    @property
+    def shards(self) -> List['ChatStorage']:
+        return [self]
+    
+    def add_change_listener(self, listener):
+        """Call ``listener(chat_id, user_id)`` after a chat or a user's chat list changes.
+        
+        user_id is None when the write didn't name it; chat_id and user_id are
+        both None after bulk changes that may touch anything.
+        """
+        if listener not in self._change_listeners:
+            self._change_listeners.append(listener)
+    
+    def _changed(self, chat_id=None, user_id=None):
+        for listener in list(self._change_listeners):
+            try:
+                listener(chat_id, user_id)
+            except Exception as e:
+                logger.error(f"❌ Chat change listener failed: {e}")
+    
+    def _await_chat_writes(self, chat_id):
+        """Read-your-writes: let queued messages of this chat land before reading it"""
+        if self.writer is not None:
+            self.writer.wait_for_chat(chat_id)
     
     def init_database(self):
         """Initialize the chat database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        setup = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0)
+        try:
+            # WAL lets readers proceed while a writer commits; the mode is persistent
+            setup.execute('PRAGMA journal_mode = WAL')
+        finally:
+            setup.close()
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             
             # Create chats table
@@ -61,16 +738,30 @@ class ChatStorage:
                 )
             ''')
             
-            # Create indexes for better performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_chats_user_id ON chats (user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_chats_updated_at ON chats (updated_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id)')
+            # Create indexes for better performance (composite ones come from MIGRATIONS)
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_flagged ON messages (is_flagged)')
             
-            conn.commit()
+            self._migrate(conn)
             logger.info("✓ Chat database initialized successfully")
     
+    def _migrate(self, conn):
+        """Apply pending MIGRATIONS, each in its own transaction"""
+        for version, description, statements in MIGRATIONS:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                continue
+            conn.commit()
+            conn.execute('BEGIN IMMEDIATE')
+            # Re-check under the write lock in case another process migrated first
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+            logger.info(f"✓ Applied chat database migration {version}: {description}")
+    
     def _generate_unique_id(self, prefix=""):
         """Generate a guaranteed unique ID"""
         # Use UUID4 for guaranteed uniqueness
@@ -79,6 +770,7 @@ class ChatStorage:
             return f"{prefix}_{unique_id}"
         return unique_id
     
+    @timed("db_write")
     def create_chat(self, user_id: str, title: str, chat_id: str = None) -> str:
         """Create a new chat"""
         if not chat_id:
@@ -88,7 +780,7 @@ class ChatStorage:
         if chat_id.startswith('temp_'):
             chat_id = self._generate_unique_id("chat")
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             
             # Check if chat already exists
@@ -104,26 +796,38 @@ class ChatStorage:
             ''', (chat_id, user_id, title))
             conn.commit()
             
+        self._changed(chat_id, user_id)
         logger.info(f"Created chat {chat_id} for user {user_id}")
         return chat_id
     
     def get_user_chats(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """Get all chats for a user"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, title, created_at, updated_at, is_flagged, flag_reason,
-                       (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id) as message_count
-                FROM chats 
-                WHERE user_id = ? 
-                ORDER BY updated_at DESC 
-                LIMIT ?
-            ''', (user_id, limit))
+        """Get a user's most recently updated chats"""
+        return self.get_user_chats_page(user_id, limit)['chats']
+    
+    def get_user_chats_page(self, user_id: str, limit: int = 50, cursor: str = None) -> Dict:
+        """One page of a user's chats, newest first, continuing after ``cursor``.
+        
+        Returns {'chats': [...], 'next_cursor': str or None}. Pages are keyed on
+        (updated_at, id), so every page costs the same as the first.
+        """
+        query = '''
+            SELECT id, title, created_at, updated_at, is_flagged, flag_reason,
+                   message_count, last_message_at
+            FROM chats 
+            WHERE user_id = ? 
+        '''
+        params = [user_id]
+        if cursor:
+            query += ' AND (updated_at, id) < (?, ?)'
+            params.extend(decode_cursor(cursor, 2))
+        query += ' ORDER BY updated_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
             
             chats = []
-            for row in cursor.fetchall():
+            for row in rows[:limit]:
                 chats.append({
                     'id': row['id'],
                     'title': row['title'],
@@ -131,52 +835,112 @@ class ChatStorage:
                     'updated_at': row['updated_at'],
                     'is_flagged': bool(row['is_flagged']),
                     'flag_reason': row['flag_reason'],
-                    'message_count': row['message_count']
+                    'message_count': row['message_count'],
+                    'last_message_at': row['last_message_at']
                 })
             
-            return chats
+            next_cursor = None
+            if len(rows) > limit:
+                next_cursor = encode_cursor(chats[-1]['updated_at'], chats[-1]['id'])
+            return {'chats': chats, 'next_cursor': next_cursor}
+    
+    @staticmethod
+    def _chat_row(cursor, chat_id, user_id=None):
+        query = 'SELECT * FROM chats WHERE id = ?'
+        params = [chat_id]
+        
+        if user_id:  # For regular users, check ownership
+            query += ' AND user_id = ?'
+            params.append(user_id)
+        
+        cursor.execute(query, params)
+        return cursor.fetchone()
+    
+    @staticmethod
+    def _format_message(msg_row) -> Dict:
+        metadata = json.loads(msg_row['metadata']) if msg_row['metadata'] else {}
+        return {
+            'id': msg_row['id'],
+            'role': msg_row['role'],
+            'content': msg_row['content'],
+            'timestamp': msg_row['timestamp'],
+            'is_flagged': bool(msg_row['is_flagged']),
+            'flag_reason': msg_row['flag_reason'],
+            'metadata': metadata
+        }
+    
+    @staticmethod
+    def _archived_rows(cursor, chat_id) -> Optional[List[Dict]]:
+        """Decompressed message rows of an archived chat, oldest first; None if the chat is not archived"""
+        row = cursor.execute('SELECT messages FROM chat_archive WHERE chat_id = ?', (chat_id,)).fetchone()
+        if row is None:
+            return None
+        return [dict(zip(ARCHIVE_COLUMNS, values)) for values in json.loads(zlib.decompress(row[0]))]
+    
+    @staticmethod
+    def _newest_messages(cursor, chat_id, limit, before=None):
+        """Up to ``limit`` messages before a (timestamp, rowid) cursor, oldest first, and the cursor for older ones"""
+        archived = ChatStorage._archived_rows(cursor, chat_id)
+        if archived is not None:
+            if before:
+                key = tuple(decode_cursor(before, 2))
+                archived = [row for row in archived if (row['timestamp'], row['rowid']) < key]
+            rows = archived[::-1][:limit + 1]
+            page = rows[:limit]
+            next_cursor = None
+            if len(rows) > limit:
+                next_cursor = encode_cursor(page[-1]['timestamp'], page[-1]['rowid'])
+            return [ChatStorage._format_message(row) for row in reversed(page)], next_cursor
+        
+        query = 'SELECT rowid, * FROM messages WHERE chat_id = ?'
+        params = [chat_id]
+        if before:
+            query += ' AND (timestamp, rowid) < (?, ?)'
+            params.extend(decode_cursor(before, 2))
+        # rowid breaks ties between messages written in the same second
+        query += ' ORDER BY timestamp DESC, rowid DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        rows = cursor.execute(query, params).fetchall()
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(page[-1]['timestamp'], page[-1]['rowid'])
+        return [ChatStorage._format_message(row) for row in reversed(page)], next_cursor
     
-    def get_chat_with_messages(self, chat_id: str, user_id: str = None) -> Optional[Dict]:
-        """Get a chat with all its messages"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+    def get_chat_with_messages(self, chat_id: str, user_id: str = None, message_limit: int = None) -> Optional[Dict]:
+        """Get a chat with its messages; with ``message_limit`` only the newest ones.
+        
+        When messages are limited, 'messages_cursor' pages further back via
+        get_chat_messages_page.
+        """
+        self._await_chat_writes(chat_id)
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Get chat info
-            query = 'SELECT * FROM chats WHERE id = ?'
-            params = [chat_id]
-            
-            if user_id:  # For regular users, check ownership
-                query += ' AND user_id = ?'
-                params.append(user_id)
-            
-            cursor.execute(query, params)
-            chat_row = cursor.fetchone()
+            chat_row = self._chat_row(cursor, chat_id, user_id)
             
             if not chat_row:
                 return None
             
             # Get messages
-            cursor.execute('''
-                SELECT * FROM messages 
-                WHERE chat_id = ? 
-                ORDER BY timestamp ASC
-            ''', (chat_id,))
-            
-            messages = []
-            for msg_row in cursor.fetchall():
-                metadata = json.loads(msg_row['metadata']) if msg_row['metadata'] else {}
-                messages.append({
-                    'id': msg_row['id'],
-                    'role': msg_row['role'],
-                    'content': msg_row['content'],
-                    'timestamp': msg_row['timestamp'],
-                    'is_flagged': bool(msg_row['is_flagged']),
-                    'flag_reason': msg_row['flag_reason'],
-                    'metadata': metadata
-                })
+            messages_cursor = None
+            archived = None if message_limit else self._archived_rows(cursor, chat_id)
+            if message_limit:
+                messages, messages_cursor = self._newest_messages(cursor, chat_id, message_limit)
+            elif archived is not None:
+                # Cold chats are read straight from the compressed archive
+                messages = [self._format_message(row) for row in archived]
+            else:
+                cursor.execute('''
+                    SELECT * FROM messages 
+                    WHERE chat_id = ? 
+                    ORDER BY timestamp ASC, rowid ASC
+                ''', (chat_id,))
+                messages = [self._format_message(row) for row in cursor.fetchall()]
             
-            return {
+            chat = {
                 'id': chat_row['id'],
                 'user_id': chat_row['user_id'],
                 'title': chat_row['title'],
@@ -186,16 +950,101 @@ class ChatStorage:
                 'flag_reason': chat_row['flag_reason'],
                 'messages': messages
             }
+            if message_limit:
+                chat['messages_cursor'] = messages_cursor
+            return chat
+    
+    def get_chat_messages_page(self, chat_id: str, user_id: str = None, limit: int = 50,
+                               before: str = None) -> Optional[Dict]:
+        """The newest ``limit`` messages before cursor ``before``, oldest first.
+        
+        Returns {'messages': [...], 'next_cursor': str or None} where
+        next_cursor loads the page of older messages, or None if the chat
+        does not exist (or is not the user's).
+        """
+        self._await_chat_writes(chat_id)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            if not self._chat_row(cursor, chat_id, user_id):
+                return None
+            messages, next_cursor = self._newest_messages(cursor, chat_id, limit, before)
+            return {'messages': messages, 'next_cursor': next_cursor}
+    
+    def get_chat_messages_since(self, chat_id: str, user_id: str = None, since_id: str = None,
+                                since_timestamp: str = None, limit: int = 500) -> Optional[Dict]:
+        """Messages newer than message ``since_id`` (or than ``since_timestamp``), oldest first.
+        
+        Returns {'messages': [...], 'has_more': bool}, or None if the chat does
+        not exist. Raises ValueError if ``since_id`` is not a message of the chat.
+        """
+        self._await_chat_writes(chat_id)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            if not self._chat_row(cursor, chat_id, user_id):
+                return None
+            
+            archived = self._archived_rows(cursor, chat_id)
+            if archived is not None:
+                if since_id:
+                    anchor = next(((m['timestamp'], m['rowid']) for m in archived if m['id'] == since_id), None)
+                    if anchor is None:
+                        raise ValueError(f"Unknown message id: {since_id}")
+                    archived = [m for m in archived if (m['timestamp'], m['rowid']) > anchor]
+                elif since_timestamp:
+                    archived = [m for m in archived if m['timestamp'] > since_timestamp]
+                return {
+                    'messages': [self._format_message(row) for row in archived[:limit]],
+                    'has_more': len(archived) > limit
+                }
+            
+            query = 'SELECT * FROM messages WHERE chat_id = ?'
+            params = [chat_id]
+            if since_id:
+                anchor = cursor.execute(
+                    'SELECT timestamp, rowid FROM messages WHERE id = ? AND chat_id = ?',
+                    (since_id, chat_id)
+                ).fetchone()
+                if not anchor:
+                    raise ValueError(f"Unknown message id: {since_id}")
+                query += ' AND (timestamp, rowid) > (?, ?)'
+                params.extend([anchor[0], anchor[1]])
+            elif since_timestamp:
+                query += ' AND timestamp > ?'
+                params.append(since_timestamp)
+            query += ' ORDER BY timestamp ASC, rowid ASC LIMIT ?'
+            params.append(limit + 1)
+            
+            rows = cursor.execute(query, params).fetchall()
+            return {
+                'messages': [self._format_message(row) for row in rows[:limit]],
+                'has_more': len(rows) > limit
+            }
     
+    @timed("db_write")
     def add_message(self, chat_id: str, role: str, content: str, message_id: str = None, 
                    is_flagged: bool = False, flag_reason: str = None, metadata: Dict = None) -> str:
-        """Add a message to a chat - FIXED VERSION"""
+        """Add a message to a chat - FIXED VERSION
+        
+        With write-behind enabled the message is queued and committed shortly
+        after by the background writer; the returned id is final either way.
+        """
         if not message_id:
             message_id = self._generate_unique_id(f"{role}_msg")
         
         metadata_json = json.dumps(metadata) if metadata else None
         
-        with sqlite3.connect(self.db_path) as conn:
+        if self.writer is not None:
+            # Validate now: the caller can't see errors from the background writer
+            if role not in MESSAGE_ROLES:
+                raise ValueError(f"Invalid message role: {role}")
+            self.writer.enqueue((message_id, chat_id, role, content, _utc_timestamp(),
+                                 bool(is_flagged), flag_reason, metadata_json))
+            # Reads of the chat wait for its queued messages; the writer
+            # invalidates again after the commit, for chat lists
+            self._changed(chat_id)
+            return message_id
+        
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             
             # Check if message already exists (prevent duplicates)
@@ -204,6 +1053,8 @@ class ChatStorage:
                 logger.warning(f"Message {message_id} already exists, skipping insert")
                 return message_id
             
+            self._restore_archived(cursor, chat_id)
+            
             # Add message with retry logic for uniqueness
             max_retries = 3
             for attempt in range(max_retries):
@@ -231,12 +1082,35 @@ class ChatStorage:
                         logger.error(f"Failed to insert message after {max_retries} attempts: {e}")
                         raise e
         
+        self._changed(chat_id)
         logger.info(f"Added {role} message to chat {chat_id}")
         return message_id
     
+    def _insert_messages(self, rows):
+        """Insert message rows in one transaction; ids already stored are skipped"""
+        latest = {}
+        for row in rows:
+            latest[row[1]] = max(latest.get(row[1], row[4]), row[4])
+        with self._connection(write=True) as conn:
+            for chat_id in latest:
+                self._restore_archived(conn, chat_id)
+            conn.executemany('''
+                INSERT OR IGNORE INTO messages (id, chat_id, role, content, timestamp, is_flagged, flag_reason, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.executemany(
+                'UPDATE chats SET updated_at = MAX(updated_at, ?) WHERE id = ?',
+                [(timestamp, chat_id) for chat_id, timestamp in latest.items()]
+            )
+        # Chat lists don't wait for queued messages, so one read while they were
+        # queued may have cached the old counts; drop it now they are committed
+        for chat_id in latest:
+            self._changed(chat_id)
+    
+    @timed("db_write")
     def update_chat_title(self, chat_id: str, title: str, user_id: str = None) -> bool:
         """Update chat title"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             
             query = 'UPDATE chats SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?'
@@ -248,29 +1122,52 @@ class ChatStorage:
             
             cursor.execute(query, params)
             conn.commit()
-            
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+        
+        if updated:
+            self._changed(chat_id, user_id)
+        return updated
     
+    @timed("db_write")
     def delete_chat(self, chat_id: str, user_id: str = None) -> bool:
         """Delete a chat and all its messages"""
-        with sqlite3.connect(self.db_path) as conn:
+        self._await_chat_writes(chat_id)
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             
-            query = 'DELETE FROM chats WHERE id = ?'
+            where = 'WHERE id = ?'
             params = [chat_id]
             
             if user_id:  # For regular users, check ownership
-                query += ' AND user_id = ?'
+                where += ' AND user_id = ?'
                 params.append(user_id)
             
-            cursor.execute(query, params)
+            # Foreign keys are not enforced, so remove the messages explicitly,
+            # first, while the chat row still exists for the search-index triggers
+            chat_row = cursor.execute(
+                f'SELECT message_count, flagged_message_count FROM chats {where}', params
+            ).fetchone()
+            if chat_row:
+                cursor.execute('DELETE FROM messages WHERE chat_id = ?', (chat_id,))
+                cursor.execute('DELETE FROM chat_archive WHERE chat_id = ?', (chat_id,))
+                if cursor.rowcount:
+                    # Archived messages bypass the counter triggers; take them off by hand
+                    cursor.execute('''
+                        UPDATE stats_counters SET value = value - CASE name
+                            WHEN 'total_messages' THEN ? WHEN 'flagged_messages' THEN ? ELSE 0 END
+                    ''', (chat_row[0], chat_row[1]))
+            cursor.execute(f'DELETE FROM chats {where}', params)
             conn.commit()
-            
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+        
+        if deleted:
+            self._changed(chat_id, user_id)
+        return deleted
     
+    @timed("db_write")
     def flag_chat(self, chat_id: str, flag_reason: str) -> bool:
         """Flag a chat for admin review"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE chats 
@@ -278,26 +1175,35 @@ class ChatStorage:
                 WHERE id = ?
             ''', (flag_reason, chat_id))
             conn.commit()
-            
-            return cursor.rowcount > 0
+            flagged = cursor.rowcount > 0
+        
+        if flagged:
+            self._changed(chat_id)
+        return flagged
     
+    @timed("db_write")
     def flag_message(self, message_id: str, flag_reason: str) -> bool:
         """Flag a message for admin review"""
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()  # the message may still be queued for write-behind
+        with self._connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE messages 
                 SET is_flagged = TRUE, flag_reason = ? 
                 WHERE id = ?
+                RETURNING chat_id
             ''', (flag_reason, message_id))
+            row = cursor.fetchone()
             conn.commit()
-            
-            return cursor.rowcount > 0
+        
+        if row is None:
+            return False
+        self._changed(row[0])
+        return True
     
     def get_flagged_content(self, limit: int = 100) -> Dict:
         """Get flagged chats and messages for admin review"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Get flagged chats
@@ -331,67 +1237,739 @@ class ChatStorage:
             }
     
     def get_all_chats_for_admin(self, limit: int = 100, offset: int = 0) -> List[Dict]:
-        """Get all chats for admin monitoring"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        """Get all chats for admin monitoring (offset paging; prefer get_admin_chats_page)"""
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT c.*, u.name as user_name, u.email as user_email,
-                       (SELECT COUNT(*) FROM messages WHERE chat_id = c.id) as message_count,
-                       (SELECT COUNT(*) FROM messages WHERE chat_id = c.id AND is_flagged = TRUE) as flagged_message_count
+                SELECT c.*, u.name as user_name, u.email as user_email
                 FROM chats c
                 JOIN users u ON c.user_id = u.id
-                ORDER BY c.updated_at DESC
+                ORDER BY c.updated_at DESC, c.id DESC
                 LIMIT ? OFFSET ?
             ''', (limit, offset))
             
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_admin_chats_page(self, limit: int = 100, cursor: str = None) -> Dict:
+        """One page of all chats for admin monitoring, newest first, continuing after ``cursor``"""
+        query = '''
+            SELECT c.*, u.name as user_name, u.email as user_email
+            FROM chats c
+            JOIN users u ON c.user_id = u.id
+        '''
+        params = []
+        if cursor:
+            query += ' WHERE (c.updated_at, c.id) < (?, ?)'
+            params.extend(decode_cursor(cursor, 2))
+        query += ' ORDER BY c.updated_at DESC, c.id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        with self._connection() as conn:
+            rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id'])
+        return {'chats': rows, 'next_cursor': next_cursor}
+    
     def create_or_update_user(self, user_id: str, name: str, email: str, role: str = 'student'):
-        """Create or update user record"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO users (id, name, email, role, last_active)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (user_id, name, email, role))
-            conn.commit()
+        """Create or update user record.
+        
+        Users seen recently with the same details are skipped without touching
+        the database; otherwise the row is upserted, and last_active is only
+        refreshed once per CHAT_USER_ACTIVE_INTERVAL_SECONDS.
+        """
+        details = (name, email, role)
+        now = time.monotonic()
+        with self._users_lock:
+            known = self._users.get(user_id)
+            if known:
+                self._users.move_to_end(user_id)
+        fresh = known is not None and known[0] == details and now - known[1] < USER_ACTIVE_INTERVAL
+        record_cache('users', fresh)
+        if fresh:
+            return
+        
+        self._upsert_user(user_id, name, email, role)
+        with self._users_lock:
+            self._users[user_id] = (details, now)
+            self._users.move_to_end(user_id)
+            while len(self._users) > USER_CACHE_SIZE:
+                self._users.popitem(last=False)
     
-    def get_chat_statistics(self) -> Dict:
-        """Get chat statistics for admin dashboard"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Total chats
-            cursor.execute('SELECT COUNT(*) FROM chats')
-            total_chats = cursor.fetchone()[0]
-            
-            # Total messages
-            cursor.execute('SELECT COUNT(*) FROM messages')
-            total_messages = cursor.fetchone()[0]
-            
-            # Flagged content
-            cursor.execute('SELECT COUNT(*) FROM chats WHERE is_flagged = TRUE')
-            flagged_chats = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM messages WHERE is_flagged = TRUE')
-            flagged_messages = cursor.fetchone()[0]
-            
-            # Active users (last 7 days)
-            cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) FROM chats 
-                WHERE updated_at > datetime('now', '-7 days')
+    @timed("db_write")
+    def _upsert_user(self, user_id, name, email, role):
+        with self._connection(write=True) as conn:
+            try:
+                # A real upsert: the row (and its email index entry) is only
+                # rewritten when something changed or last_active is stale
+                conn.execute('''
+                    INSERT INTO users (id, name, email, role, last_active)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (id) DO UPDATE SET
+                        name = excluded.name,
+                        email = excluded.email,
+                        role = excluded.role,
+                        last_active = excluded.last_active
+                    WHERE users.name IS NOT excluded.name
+                       OR users.email IS NOT excluded.email
+                       OR users.role IS NOT excluded.role
+                       OR users.last_active IS NULL
+                       OR users.last_active < datetime('now', ?)
+                ''', (user_id, name, email, role, f'-{int(USER_ACTIVE_INTERVAL)} seconds'))
+            except sqlite3.IntegrityError as e:
+                # The email belongs to another user id; keep the previous behaviour
+                logger.warning(f"⚠️ Email for user {user_id} already in use ({e}); replacing record")
+                conn.execute('''
+                    INSERT OR REPLACE INTO users (id, name, email, role, last_active)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (user_id, name, email, role))
+    
+    def search_messages(self, query: str, user_id: str = None, limit: int = 20, cursor: str = None) -> Dict:
+        """Rank messages matching ``query`` by BM25, limited to ``user_id``'s chats if given.
+        
+        Only the newest CHAT_SEARCH_CANDIDATES matches are ranked, so common
+        words stay cheap. Messages of archived chats are not indexed and are
+        not found until the chat is restored (their titles still match
+        search_chats). Returns {'results': [...], 'next_cursor': str or None};
+        each result has the message, its chat and a highlighted snippet.
+        """
+        offset = decode_cursor(cursor, 1)[0] if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid cursor")
+        tokens = search_terms(query)
+        sql = '''
+            SELECT m.id, m.chat_id, m.role, m.content, m.timestamp, m.is_flagged,
+                   c.title AS chat_title, c.user_id, hits.score
+            FROM (
+                SELECT rowid, score FROM (
+                    SELECT rowid, bm25(messages_fts, 1.0, 0.0) AS score
+                    FROM messages_fts WHERE messages_fts MATCH ?
+                    ORDER BY rowid DESC LIMIT ?
+                ) ORDER BY score LIMIT ? OFFSET ?
+            ) hits
+            JOIN messages m ON m.rowid = hits.rowid
+            JOIN chats c ON c.id = m.chat_id
+            ORDER BY hits.score
+        '''
+        params = [build_fts_query(tokens, 'content', user_id), SEARCH_CANDIDATES, limit + 1, offset]
+        
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        results = [{
+            'message_id': row['id'],
+            'chat_id': row['chat_id'],
+            'chat_title': row['chat_title'],
+            'user_id': row['user_id'],
+            'role': row['role'],
+            'timestamp': row['timestamp'],
+            'is_flagged': bool(row['is_flagged']),
+            'snippet': make_snippet(row['content'], tokens),
+            'score': -row['score']  # bm25() is lower-is-better
+        } for row in rows[:limit]]
+        next_cursor = encode_cursor(offset + limit) if len(rows) > limit else None
+        return {'results': results, 'next_cursor': next_cursor}
+    
+    def search_chats(self, query: str, user_id: str = None, limit: int = 20) -> List[Dict]:
+        """Chats whose title matches ``query``, best match first"""
+        sql = '''
+            SELECT c.id, c.title, c.user_id, c.updated_at, c.message_count, hits.score
+            FROM (
+                SELECT rowid, bm25(chats_fts, 1.0, 0.0) AS score
+                FROM chats_fts WHERE chats_fts MATCH ?
+                ORDER BY score LIMIT ?
+            ) hits
+            JOIN chats c ON c.rowid = hits.rowid
+            ORDER BY hits.score
+        '''
+        with self._connection() as conn:
+            rows = conn.execute(sql, [build_fts_query(search_terms(query), 'title', user_id), limit]).fetchall()
+        return [{**dict(row), 'score': -row['score']} for row in rows]
+    
+    # ===== EXPORT / IMPORT =====
+    
+    def iter_export(self, user_id: str = None, batch_size: int = EXPORT_BATCH_SIZE):
+        """Yield every user, then every chat with its messages, as export records.
+        
+        Records are dicts with a 'type' of 'user' or 'chat'. Rows are read in
+        id-keyed batches, each in its own short read, so memory stays flat and
+        the export never holds a snapshot open (which would pin the WAL).
+        """
+        self.flush()
+        last_id = ''
+        while True:
+            query = 'SELECT id, name, email, role, status, created_at, last_active FROM users WHERE id > ?'
+            params = [last_id]
+            if user_id:
+                query += ' AND id = ?'
+                params.append(user_id)
+            with self._connection() as conn:
+                rows = conn.execute(query + ' ORDER BY id LIMIT ?', params + [batch_size]).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield {'type': 'user', **dict(row)}
+            last_id = rows[-1]['id']
+        
+        last_id = ''
+        while True:
+            query = '''
+                SELECT id, user_id, title, created_at, updated_at, is_flagged, flag_reason
+                FROM chats WHERE id > ?
+            '''
+            params = [last_id]
+            if user_id:
+                query += ' AND user_id = ?'
+                params.append(user_id)
+            with self._connection() as conn:
+                chats = conn.execute(query + ' ORDER BY id LIMIT ?', params + [batch_size]).fetchall()
+                if not chats:
+                    break
+                chat_ids = [chat['id'] for chat in chats]
+                placeholders = ', '.join('?' * len(chat_ids))
+                messages = {}
+                for row in conn.execute(f'''
+                    SELECT * FROM messages WHERE chat_id IN ({placeholders})
+                    ORDER BY chat_id, timestamp ASC, rowid ASC
+                ''', chat_ids):
+                    messages.setdefault(row['chat_id'], []).append(self._format_message(row))
+                archived = conn.execute(
+                    f'SELECT chat_id FROM chat_archive WHERE chat_id IN ({placeholders})', chat_ids
+                ).fetchall()
+                for (chat_id,) in archived:
+                    messages[chat_id] = [self._format_message(row)
+                                         for row in self._archived_rows(conn, chat_id)]
+            for chat in chats:
+                yield {'type': 'chat', **dict(chat), 'is_flagged': bool(chat['is_flagged']),
+                       'messages': messages.get(chat['id'], [])}
+            last_id = chat_ids[-1]
+    
+    def import_records(self, records, batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+        """Load export records, committing about ``batch_size`` rows per transaction.
+        
+        Ids already present are skipped, so an import can be re-run after a
+        failure. Returns the number of users, chats and messages inserted.
+        """
+        counts = {'users': 0, 'chats': 0, 'messages': 0}
+        batch, size = [], 0
+        for record in records:
+            batch.append(record)
+            size += 1 + len(record.get('messages') or ())
+            if size >= batch_size:
+                self._import_batch(batch, counts)
+                batch, size = [], 0
+        if batch:
+            self._import_batch(batch, counts)
+        return counts
+    
+    @timed("db_write")
+    def _import_batch(self, records, counts):
+        users, chats, messages = [], [], []
+        for record in records:
+            kind = record.get('type')
+            if kind == 'user':
+                users.append((record['id'], record['name'], record['email'], record.get('role') or 'student',
+                              record.get('status') or 'active', record.get('created_at'), record.get('last_active')))
+            elif kind == 'chat':
+                chats.append((record['id'], record['user_id'], record['title'], record.get('created_at'),
+                              record.get('updated_at'), bool(record.get('is_flagged')), record.get('flag_reason')))
+                for m in record.get('messages') or ():
+                    messages.append((m['id'], record['id'], m['role'], m['content'], m.get('timestamp'),
+                                     bool(m.get('is_flagged')), m.get('flag_reason'),
+                                     json.dumps(m['metadata']) if m.get('metadata') else None))
+            else:
+                raise ValueError(f"Unknown export record type: {kind!r}")
+        
+        with self._connection(write=True) as conn:
+            # Chats before messages, so the triggers keep counters and the search index current
+            counts['users'] += conn.executemany('''
+                INSERT OR IGNORE INTO users (id, name, email, role, status, created_at, last_active)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+            ''', users).rowcount if users else 0
+            counts['chats'] += conn.executemany('''
+                INSERT OR IGNORE INTO chats (id, user_id, title, created_at, updated_at, is_flagged, flag_reason)
+                VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+            ''', chats).rowcount if chats else 0
+            counts['messages'] += conn.executemany('''
+                INSERT OR IGNORE INTO messages (id, chat_id, role, content, timestamp, is_flagged, flag_reason, metadata)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?)
+            ''', messages).rowcount if messages else 0
+        self._active_users = None
+        self._changed()
+    
+    # ===== RE-MODERATION =====
+    
+    def iter_moderation_batches(self, after_rowid: int = 0, batch_size: int = 500):
+        """Yield batches of user messages in rowid order, starting after ``after_rowid``.
+        
+        Rows are (rowid, id, chat_id, content, is_flagged, flag_reason), each
+        batch read in its own short transaction like iter_export. Messages of
+        archived chats are not in the messages table and are skipped.
+        """
+        self.flush()
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute('''
+                    SELECT rowid, id, chat_id, content, is_flagged, flag_reason FROM messages
+                    WHERE rowid > ? AND role = 'user'
+                    ORDER BY rowid LIMIT ?
+                ''', (after_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            yield [tuple(row) for row in rows]
+            after_rowid = rows[-1][0]
+    
+    @timed("db_write")
+    def apply_moderation(self, changes, unflag_chats: bool = False) -> Dict:
+        """Write re-moderation results, given as (message_id, chat_id, is_flagged, flag_reason).
+        
+        Everything goes in one transaction. A chat that gains a flagged message
+        is flagged the way the message routes do it; with ``unflag_chats``, a
+        chat flagged only for containing flagged messages is cleared once it
+        has none left.
+        """
+        flagged_chats = {}
+        cleared_chats = set()
+        for _, chat_id, is_flagged, flag_reason in changes:
+            if is_flagged:
+                flagged_chats.setdefault(chat_id, flag_reason)
+            else:
+                cleared_chats.add(chat_id)
+        result = {'messages': 0, 'chats_flagged': 0, 'chats_unflagged': 0}
+        if not changes:
+            return result
+        
+        with self._connection(write=True) as conn:
+            result['messages'] = conn.executemany(
+                'UPDATE messages SET is_flagged = ?, flag_reason = ? WHERE id = ?',
+                [(bool(is_flagged), reason, message_id) for message_id, _, is_flagged, reason in changes]
+            ).rowcount
+            if flagged_chats:
+                result['chats_flagged'] = conn.executemany('''
+                    UPDATE chats SET is_flagged = TRUE, flag_reason = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND NOT is_flagged
+                ''', [(f"Contains flagged message: {reason}", chat_id)
+                      for chat_id, reason in flagged_chats.items()]).rowcount
+            if unflag_chats and cleared_chats:
+                # The triggers have already brought flagged_message_count up to date
+                result['chats_unflagged'] = conn.executemany('''
+                    UPDATE chats SET is_flagged = FALSE, flag_reason = NULL
+                    WHERE id = ? AND is_flagged AND flagged_message_count = 0
+                      AND flag_reason LIKE 'Contains flagged message: %'
+                ''', [(chat_id,) for chat_id in cleared_chats]).rowcount
+        
+        for chat_id in flagged_chats.keys() | cleared_chats:
+            self._changed(chat_id)
+        return result
+    
+    # ===== ARCHIVE =====
+    
+    @staticmethod
+    def _restore_archived(cursor, chat_id) -> bool:
+        """Move an archived chat's messages back into the messages table (inside a write transaction)"""
+        row = cursor.execute('SELECT messages FROM chat_archive WHERE chat_id = ?', (chat_id,)).fetchone()
+        if row is None:
+            return False
+        rows = [dict(zip(ARCHIVE_COLUMNS, values)) for values in json.loads(zlib.decompress(row[0]))]
+        # Messages get their original rowids back, so (timestamp, rowid) cursors
+        # and message positions handed out before archiving still hold. SQLite
+        # may have reused a rowid meanwhile (it can reissue the highest one);
+        # such a message takes a new rowid. The archive row is removed last so
+        # the counter triggers stay quiet.
+        renumbered = 0
+        for m in rows:
+            values = (m['id'], chat_id, m['role'], m['content'], m['timestamp'], m['is_flagged'],
+                      m['flag_reason'], m['metadata'])
+            try:
+                cursor.execute('''
+                    INSERT INTO messages (rowid, id, chat_id, role, content, timestamp, is_flagged, flag_reason, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (m['rowid'],) + values)
+            except sqlite3.IntegrityError:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO messages (id, chat_id, role, content, timestamp, is_flagged, flag_reason, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', values)
+                renumbered += cursor.rowcount
+        if renumbered:
+            logger.warning(f"⚠️  {renumbered} restored messages of chat {chat_id} got new rowids")
+        cursor.execute('DELETE FROM chat_archive WHERE chat_id = ?', (chat_id,))
+        logger.info(f"Restored {len(rows)} archived messages of chat {chat_id}")
+        return True
+    
+    def restore_chat(self, chat_id: str) -> bool:
+        """Move an archived chat back to hot storage; False if it was not archived"""
+        with self._connection(write=True) as conn:
+            return self._restore_archived(conn.cursor(), chat_id)
+    
+    def archive_chats(self, older_than_days: int = ARCHIVE_AFTER_DAYS, limit: int = None) -> Dict:
+        """Compress the messages of chats untouched for ``older_than_days`` into chat_archive.
+        
+        The chat rows stay where they are and reads of archived chats are
+        transparent; writing to one restores it. Flagged chats stay hot for
+        review, and archived messages drop out of full-text search until
+        restored. Each chat is archived in its own short transaction.
+        """
+        self.flush()
+        with self._connection() as conn:
+            query = '''
+                SELECT id FROM chats
+                WHERE updated_at < datetime('now', ?) AND message_count > 0
+                  AND NOT is_flagged AND flagged_message_count = 0
+                  AND id NOT IN (SELECT chat_id FROM chat_archive)
+                ORDER BY updated_at
+            '''
+            params = [f'-{int(older_than_days)} days']
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
+            chat_ids = [row[0] for row in conn.execute(query, params).fetchall()]
+        
+        result = {'chats': 0, 'messages': 0, 'raw_bytes': 0, 'compressed_bytes': 0}
+        for chat_id in chat_ids:
+            with self._connection(write=True) as conn:
+                rows = conn.execute(f'''
+                    SELECT {', '.join(ARCHIVE_COLUMNS)} FROM messages
+                    WHERE chat_id = ? ORDER BY timestamp ASC, rowid ASC
+                ''', (chat_id,)).fetchall()
+                if not rows:
+                    continue
+                raw = json.dumps([list(row) for row in rows], separators=(',', ':')).encode('utf-8')
+                blob = zlib.compress(raw, 9)
+                conn.execute('''
+                    INSERT INTO chat_archive (chat_id, message_count, raw_bytes, compressed_bytes, messages)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (chat_id, len(rows), len(raw), len(blob), blob))
+                conn.execute('DELETE FROM messages WHERE chat_id = ?', (chat_id,))
+            result['chats'] += 1
+            result['messages'] += len(rows)
+            result['raw_bytes'] += len(raw)
+            result['compressed_bytes'] += len(blob)
+        
+        logger.info(f"✓ Archived {result['chats']} chats ({result['messages']} messages, "
+                    f"{result['raw_bytes']} -> {result['compressed_bytes']} bytes)")
+        return result
+    
+    def get_archive_stats(self) -> Dict:
+        """Archived chat/message counts and their raw vs compressed size"""
+        with self._connection() as conn:
+            row = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(message_count), 0),
+                       COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(compressed_bytes), 0)
+                FROM chat_archive
+            ''').fetchone()
+        return {'chats': row[0], 'messages': row[1], 'raw_bytes': row[2], 'compressed_bytes': row[3]}
+    
+    def rebuild_search_index(self):
+        """Rebuild the full-text indexes from their tables (needed after VACUUM renumbers rowids)"""
+        with self._connection(write=True) as conn:
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO chats_fts (chats_fts) VALUES ('rebuild')")
+        logger.info("✓ Rebuilt full-text search indexes")
+    
+    def recount_statistics(self):
+        """Recompute stats_counters from the per-chat counters (after a bulk copy that bypassed the triggers)"""
+        with self._connection(write=True) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO stats_counters (name, value)
+                SELECT 'total_chats', COUNT(*) FROM chats
+                UNION ALL SELECT 'flagged_chats', COUNT(*) FROM chats WHERE is_flagged = TRUE
+                UNION ALL SELECT 'total_messages', COALESCE(SUM(message_count), 0) FROM chats
+                UNION ALL SELECT 'flagged_messages', COALESCE(SUM(flagged_message_count), 0) FROM chats
             ''')
-            active_users = cursor.fetchone()[0]
-            
-            return {
-                'total_chats': total_chats,
-                'total_messages': total_messages,
-                'flagged_chats': flagged_chats,
-                'flagged_messages': flagged_messages,
-                'active_users': active_users
-            }
+        self._active_users = None
+    
+    def get_chat_statistics(self) -> Dict:
+        """Get chat statistics for admin dashboard.
+        
+        Totals come from stats_counters, which triggers keep current, so this
+        costs the same however many messages exist. Active users (last 7 days)
+        is cached for CHAT_STATS_TTL_SECONDS.
+        """
+        with self._connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+        
+        return {
+            'total_chats': counters.get('total_chats', 0),
+            'total_messages': counters.get('total_messages', 0),
+            'flagged_chats': counters.get('flagged_chats', 0),
+            'flagged_messages': counters.get('flagged_messages', 0),
+            'active_users': self._count_active_users()
+        }
+    
+    def _count_active_users(self) -> int:
+        cached = self._active_users
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        with self._active_users_lock:
+            cached = self._active_users
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+            with self._connection() as conn:
+                # Active users (last 7 days); a range scan of idx_chats_updated_id
+                count = conn.execute('''
+                    SELECT COUNT(DISTINCT user_id) FROM chats 
+                    WHERE updated_at > datetime('now', '-7 days')
+                ''').fetchone()[0]
+            self._active_users = (count, time.monotonic() + STATS_TTL_SECONDS)
+            return count
+
+
+def _newest_first(rows, *keys):
+    return sorted(rows, key=lambda row: tuple(row[k] or '' for k in keys), reverse=True)
+
+
+class ShardedChatStorage:
+    """ChatStorage split over several databases by a stable hash of user_id.
+    
+    Each shard is a full ChatStorage with its own pool, write lock and
+    writer, so writes for different users commit in parallel. Calls that
+    name a user go straight to that user's shard; calls that only name a
+    chat find it through a chat -> shard cache (one parallel probe on a
+    miss); admin queries fan out to every shard and merge.
+    """
+    
+    def __init__(self, db_path='chats.db', shards: int = SHARDS, **options):
+        self.db_path = db_path
+        self._shards = [ChatStorage(path, **options) for path in shard_paths(db_path, shards)]
+        self._executor = ThreadPoolExecutor(max_workers=len(self._shards), thread_name_prefix='chat-shard')
+        self._chat_shards = OrderedDict()  # chat_id -> shard index
+        self._chat_shards_lock = threading.Lock()
+        _live_storages.add(self)
+        logger.info(f"✓ Chat storage sharded over {len(self._shards)} databases")
+    
+    @property
+    def shards(self) -> List[ChatStorage]:
+        return list(self._shards)
+    
+    def _fan_out(self, method: str, *args, **kwargs) -> list:
+        """Call ``method`` on every shard in parallel; results in shard order"""
+        futures = [self._executor.submit(getattr(shard, method), *args, **kwargs) for shard in self._shards]
+        return [future.result() for future in futures]
+    
+    def _sum(self, method: str, *args) -> Dict:
+        """Fan out a method returning a dict of counts and add the counts up"""
+        totals = {}
+        for result in self._fan_out(method, *args):
+            for name, value in result.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+    
+    def add_change_listener(self, listener):
+        for shard in self._shards:
+            shard.add_change_listener(listener)
+    
+    def _user_shard(self, user_id) -> ChatStorage:
+        return self._shards[shard_index(user_id, len(self._shards))]
+    
+    def _remember_chat(self, chat_id, index):
+        with self._chat_shards_lock:
+            self._chat_shards[chat_id] = index
+            self._chat_shards.move_to_end(chat_id)
+            while len(self._chat_shards) > CHAT_SHARD_CACHE_SIZE:
+                self._chat_shards.popitem(last=False)
+    
+    def _find_chat(self, chat_id) -> Optional[int]:
+        with self._chat_shards_lock:
+            index = self._chat_shards.get(chat_id)
+            if index is not None:
+                self._chat_shards.move_to_end(chat_id)
+        hit = index is not None
+        record_cache('chat_shards', hit)
+        if hit:
+            return index
+        
+        def probe(shard):
+            with shard._connection() as conn:
+                return conn.execute('SELECT 1 FROM chats WHERE id = ?', (chat_id,)).fetchone() is not None
+        
+        found = [future.result() for future in [self._executor.submit(probe, shard) for shard in self._shards]]
+        if True not in found:
+            return None
+        index = found.index(True)
+        self._remember_chat(chat_id, index)
+        return index
+    
+    def _chat_shard(self, chat_id, user_id=None) -> Optional[ChatStorage]:
+        """The shard holding ``chat_id``: the owner's shard when known, else looked up"""
+        if user_id:
+            return self._user_shard(user_id)
+        index = self._find_chat(chat_id)
+        return None if index is None else self._shards[index]
+    
+    # ===== LIFECYCLE =====
+    
+    def _after_fork(self):
+        # Executor threads don't survive fork; each shard resets itself
+        self._executor = ThreadPoolExecutor(max_workers=len(self._shards), thread_name_prefix='chat-shard')
+        self._chat_shards_lock = threading.Lock()
+    
+    def close(self):
+        for shard in self._shards:
+            shard.close()
+    
+    def flush(self, timeout: float = None) -> bool:
+        return all(self._fan_out('flush', timeout))
+    
+    def ping(self):
+        self._fan_out('ping')
+    
+    def rebuild_search_index(self):
+        self._fan_out('rebuild_search_index')
+    
+    def recount_statistics(self):
+        self._fan_out('recount_statistics')
+    
+    # ===== USERS AND CHATS =====
+    
+    def create_or_update_user(self, user_id: str, name: str, email: str, role: str = 'student'):
+        return self._user_shard(user_id).create_or_update_user(user_id, name, email, role)
+    
+    def create_chat(self, user_id: str, title: str, chat_id: str = None) -> str:
+        chat_id = self._user_shard(user_id).create_chat(user_id, title, chat_id)
+        self._remember_chat(chat_id, shard_index(user_id, len(self._shards)))
+        return chat_id
+    
+    def get_user_chats(self, user_id: str, limit: int = 50) -> List[Dict]:
+        return self._user_shard(user_id).get_user_chats(user_id, limit)
+    
+    def get_user_chats_page(self, user_id: str, limit: int = 50, cursor: str = None) -> Dict:
+        return self._user_shard(user_id).get_user_chats_page(user_id, limit, cursor)
+    
+    def get_chat_with_messages(self, chat_id: str, user_id: str = None, message_limit: int = None) -> Optional[Dict]:
+        shard = self._chat_shard(chat_id, user_id)
+        return shard.get_chat_with_messages(chat_id, user_id, message_limit) if shard else None
+    
+    def get_chat_messages_page(self, chat_id: str, user_id: str = None, limit: int = 50,
+                               before: str = None) -> Optional[Dict]:
+        shard = self._chat_shard(chat_id, user_id)
+        return shard.get_chat_messages_page(chat_id, user_id, limit, before) if shard else None
+    
+    def get_chat_messages_since(self, chat_id: str, user_id: str = None, since_id: str = None,
+                                since_timestamp: str = None, limit: int = 500) -> Optional[Dict]:
+        shard = self._chat_shard(chat_id, user_id)
+        return shard.get_chat_messages_since(chat_id, user_id, since_id, since_timestamp, limit) if shard else None
+    
+    def add_message(self, chat_id: str, role: str, content: str, message_id: str = None,
+                    is_flagged: bool = False, flag_reason: str = None, metadata: Dict = None) -> str:
+        shard = self._chat_shard(chat_id)
+        if shard is None:
+            # Its owner is unknown, so there is no shard the message belongs on
+            raise ValueError(f"Chat not found: {chat_id}")
+        return shard.add_message(chat_id, role, content, message_id, is_flagged, flag_reason, metadata)
+    
+    def update_chat_title(self, chat_id: str, title: str, user_id: str = None) -> bool:
+        shard = self._chat_shard(chat_id, user_id)
+        return shard.update_chat_title(chat_id, title, user_id) if shard else False
+    
+    def delete_chat(self, chat_id: str, user_id: str = None) -> bool:
+        shard = self._chat_shard(chat_id, user_id)
+        if not shard or not shard.delete_chat(chat_id, user_id):
+            return False
+        with self._chat_shards_lock:
+            self._chat_shards.pop(chat_id, None)
+        return True
+    
+    def flag_chat(self, chat_id: str, flag_reason: str) -> bool:
+        shard = self._chat_shard(chat_id)
+        return shard.flag_chat(chat_id, flag_reason) if shard else False
+    
+    def flag_message(self, message_id: str, flag_reason: str) -> bool:
+        return any(self._fan_out('flag_message', message_id, flag_reason))
+    
+    # ===== ADMIN (fan-out) =====
+    
+    def get_flagged_content(self, limit: int = 100) -> Dict:
+        results = self._fan_out('get_flagged_content', limit)
+        chats = _newest_first([c for r in results for c in r['flagged_chats']], 'updated_at')
+        messages = _newest_first([m for r in results for m in r['flagged_messages']], 'timestamp')
+        return {'flagged_chats': chats[:limit], 'flagged_messages': messages[:limit]}
+    
+    def get_all_chats_for_admin(self, limit: int = 100, offset: int = 0) -> List[Dict]:
+        # Each shard's first offset + limit rows hold every row of the merged page
+        results = self._fan_out('get_all_chats_for_admin', offset + limit, 0)
+        return _newest_first([c for r in results for c in r], 'updated_at', 'id')[offset:offset + limit]
+    
+    def get_admin_chats_page(self, limit: int = 100, cursor: str = None) -> Dict:
+        pages = self._fan_out('get_admin_chats_page', limit, cursor)
+        chats = _newest_first([c for page in pages for c in page['chats']], 'updated_at', 'id')
+        next_cursor = None
+        if len(chats) > limit or any(page['next_cursor'] for page in pages):
+            chats = chats[:limit]
+            next_cursor = encode_cursor(chats[-1]['updated_at'], chats[-1]['id'])
+        return {'chats': chats, 'next_cursor': next_cursor}
+    
+    def search_messages(self, query: str, user_id: str = None, limit: int = 20, cursor: str = None) -> Dict:
+        if user_id:
+            return self._user_shard(user_id).search_messages(query, user_id, limit, cursor)
+        offset = decode_cursor(cursor, 1)[0] if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid cursor")
+        pages = self._fan_out('search_messages', query, None, offset + limit)
+        ranked = list(heapq.merge(*[page['results'] for page in pages], key=lambda r: -r['score']))
+        more = len(ranked) > offset + limit or any(page['next_cursor'] for page in pages)
+        return {
+            'results': ranked[offset:offset + limit],
+            'next_cursor': encode_cursor(offset + limit) if more else None
+        }
+    
+    def search_chats(self, query: str, user_id: str = None, limit: int = 20) -> List[Dict]:
+        if user_id:
+            return self._user_shard(user_id).search_chats(query, user_id, limit)
+        results = self._fan_out('search_chats', query, None, limit)
+        return list(heapq.merge(*results, key=lambda r: -r['score']))[:limit]
+    
+    def get_chat_statistics(self) -> Dict:
+        # Users live on exactly one shard, so even active_users simply adds up
+        return self._sum('get_chat_statistics')
+    
+    # ===== EXPORT / IMPORT =====
+    
+    def iter_export(self, user_id: str = None, batch_size: int = EXPORT_BATCH_SIZE):
+        shards = [self._user_shard(user_id)] if user_id else self._shards
+        for shard in shards:
+            yield from shard.iter_export(user_id, batch_size)
+    
+    def import_records(self, records, batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+        """Route export records to their users' shards, batching per shard"""
+        counts = {'users': 0, 'chats': 0, 'messages': 0}
+        batches = [[] for _ in self._shards]
+        sizes = [0] * len(self._shards)
+        for record in records:
+            index = shard_index(record['id'] if record.get('type') == 'user' else record.get('user_id'),
+                                len(self._shards))
+            batches[index].append(record)
+            sizes[index] += 1 + len(record.get('messages') or ())
+            if sizes[index] >= batch_size:
+                self._shards[index]._import_batch(batches[index], counts)
+                batches[index], sizes[index] = [], 0
+        for shard, batch in zip(self._shards, batches):
+            if batch:
+                shard._import_batch(batch, counts)
+        return counts
+    
+    # ===== ARCHIVE =====
+    
+    def archive_chats(self, older_than_days: int = ARCHIVE_AFTER_DAYS, limit: int = None) -> Dict:
+        return self._sum('archive_chats', older_than_days, limit)
+    
+    def get_archive_stats(self) -> Dict:
+        return self._sum('get_archive_stats')
+    
+    def restore_chat(self, chat_id: str) -> bool:
+        shard = self._chat_shard(chat_id)
+        return shard.restore_chat(chat_id) if shard else False
+
+
+def open_chat_storage(db_path='chats.db', shards: int = SHARDS, **options):
+    """A ChatStorage, or a ShardedChatStorage when more than one shard is configured"""
+    if shards > 1:
+        return ShardedChatStorage(db_path, shards, **options)
+    return ChatStorage(db_path, **options)
+
 
 # Initialize global chat storage instance
-chat_storage = ChatStorage()
\ No newline at end of file
+chat_storage = open_chat_storage(os.getenv('CHAT_DB_PATH', 'chats.db'))
\ No newline at end of file
@@ -0,0 +1,268 @@
+# backend/clients.py - Shared, tuned network clients for OpenAI and Qdrant
+"""
+Builds the OpenAI and Qdrant clients used by the real backends with
+explicit connection pools, keep-alive, per-call timeouts and a jittered
+retry policy, and counts connection reuse so churn shows up in /metrics.
+
+One client per service is shared by all request threads (httpx and gRPC
+channels are thread-safe), so connections are pooled instead of being
+opened per request.
+
+Settings (environment variables, defaults in brackets):
+
+    OPENAI_MAX_CONNECTIONS [100]   OPENAI_MAX_KEEPALIVE [20]   OPENAI_KEEPALIVE_EXPIRY [30]
+    OPENAI_CONNECT_TIMEOUT [5]     OPENAI_EMBEDDING_TIMEOUT [15]
+    OPENAI_COMPLETION_TIMEOUT [60] OPENAI_MAX_RETRIES [3]
+    QDRANT_URL / QDRANT_HOST [localhost] / QDRANT_PORT [6333]   QDRANT_API_KEY
+    QDRANT_PREFER_GRPC [false]     QDRANT_GRPC_PORT [6334]      QDRANT_TIMEOUT [10]
+    QDRANT_MAX_CONNECTIONS [50]    QDRANT_MAX_KEEPALIVE [20]    QDRANT_MAX_RETRIES [2]
+    QDRANT_SEARCH_TIMEOUT [QDRANT_TIMEOUT]
+    RETRY_BASE_DELAY_MS [200]      RETRY_MAX_DELAY_MS [5000]
+
+Timeouts are in seconds.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ResponseHandlingException", "TimeoutException", "TransportError", "ConnectError",
+    "ReadTimeout", "WriteTimeout", "PoolTimeout", "RemoteProtocolError",
+}
+RETRYABLE_GRPC_CODES = {"UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED"}
+
+HTTP_CLIENT_REQUESTS = REGISTRY.counter(
+    "tutortron_upstream_requests_total",
+    "HTTP requests sent to upstream services",
+    ["client"]
+)
+HTTP_CLIENT_CONNECTIONS = REGISTRY.counter(
+    "tutortron_upstream_connections_opened_total",
+    "New TCP connections opened to upstream services",
+    ["client"]
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "tutortron_upstream_retries_total",
+    "Upstream calls retried after a transient failure",
+    ["client"]
+)
+
+
+def _connection_reuse():
+    ratios = {}
+    for (client,), child in HTTP_CLIENT_REQUESTS._items():
+        requests = child.get()
+        if requests:
+            opened = HTTP_CLIENT_CONNECTIONS.labels(client).get()
+            ratios[(client,)] = max(0.0, 1.0 - opened / requests)
+    return ratios
+
+
+REGISTRY.gauge(
+    "tutortron_upstream_connection_reuse_ratio",
+    "Fraction of upstream HTTP requests served on an already open connection",
+    ["client"],
+    callback=_connection_reuse
+)
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def is_retryable(error):
+    """Whether an upstream error is transient (timeouts, connection drops, 429/5xx)"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            if getattr(code(), "name", None) in RETRYABLE_GRPC_CODES:
+                return True
+        except Exception:
+            pass
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _retry_after(error):
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Retry transient failures with capped exponential backoff and full jitter"""
+
+    def __init__(self, name, max_retries=3, base_delay=0.2, max_delay=5.0):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._retries = UPSTREAM_RETRIES.labels(name)
+
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = min(self.max_delay, max(delay, retry_after))
+                attempt += 1
+                self._retries.inc()
+                logger.warning(f"{self.name} call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+
+def retry_policy(name, retries_env, default_retries):
+    return RetryPolicy(
+        name,
+        max_retries=_env_int(retries_env, default_retries),
+        base_delay=_env_float("RETRY_BASE_DELAY_MS", 200) / 1000.0,
+        max_delay=_env_float("RETRY_MAX_DELAY_MS", 5000) / 1000.0,
+    )
+
+
+def _connection_tracer(name):
+    """httpx request hook counting requests and the new connections httpcore opens for them"""
+    requests = HTTP_CLIENT_REQUESTS.labels(name)
+    connections = HTTP_CLIENT_CONNECTIONS.labels(name)
+
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            connections.inc()
+
+    def on_request(request):
+        requests.inc()
+        request.extensions["trace"] = trace
+
+    return on_request
+
+
+def get_connection_stats():
+    """Requests, new connections and reuse ratio per upstream client"""
+    stats = {}
+    for (client,), child in HTTP_CLIENT_REQUESTS._items():
+        requests = child.get()
+        opened = HTTP_CLIENT_CONNECTIONS.labels(client).get()
+        stats[client] = {
+            "requests": int(requests),
+            "connections_opened": int(opened),
+            "reuse_ratio": round(1.0 - opened / requests, 4) if requests else None,
+            "retries": int(UPSTREAM_RETRIES.labels(client).get()),
+        }
+    return stats
+
+
+# ===== CLIENT FACTORIES =====
+
+_lock = threading.Lock()
+_openai_client = None
+
+
+def get_openai_client():
+    """The process-wide OpenAI client (created on first use)"""
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            _openai_client = _create_openai_client()
+        return _openai_client
+
+
+def _create_openai_client():
+    import httpx
+    from openai import OpenAI
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key or api_key == "your_openai_api_key_here":
+        raise ValueError("OpenAI API key not configured")
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=_env_int("OPENAI_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int("OPENAI_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("OPENAI_KEEPALIVE_EXPIRY", 30),
+        ),
+        timeout=httpx.Timeout(
+            _env_float("OPENAI_COMPLETION_TIMEOUT", 60),
+            connect=_env_float("OPENAI_CONNECT_TIMEOUT", 5),
+        ),
+        event_hooks={"request": [_connection_tracer("openai")]},
+    )
+    # Retries are done by our RetryPolicy so they are jittered and counted
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def create_qdrant_client():
+    import httpx
+    from qdrant_client import QdrantClient
+
+    prefer_grpc = _env_bool("QDRANT_PREFER_GRPC")
+    options = dict(
+        port=_env_int("QDRANT_PORT", 6333),
+        grpc_port=_env_int("QDRANT_GRPC_PORT", 6334),
+        prefer_grpc=prefer_grpc,
+        api_key=os.getenv("QDRANT_API_KEY") or None,
+        timeout=_env_int("QDRANT_TIMEOUT", 10),
+        # REST transport: a real keep-alive pool (qdrant-client disables
+        # keep-alive for localhost by default, which reconnects per request)
+        limits=httpx.Limits(
+            max_connections=_env_int("QDRANT_MAX_CONNECTIONS", 50),
+            max_keepalive_connections=_env_int("QDRANT_MAX_KEEPALIVE", 20),
+            keepalive_expiry=30,
+        ),
+        event_hooks={"request": [_connection_tracer("qdrant")]},
+    )
+    if prefer_grpc:
+        # One multiplexed HTTP/2 channel, kept alive between bursts
+        options["grpc_options"] = {
+            "grpc.keepalive_time_ms": 30000,
+            "grpc.keepalive_timeout_ms": 10000,
+            "grpc.keepalive_permit_without_calls": 1,
+            "grpc.http2.max_pings_without_data": 0,
+        }
+    url = os.getenv("QDRANT_URL")
+    if url:
+        client = QdrantClient(url=url, **options)
+    else:
+        client = QdrantClient(host=os.getenv("QDRANT_HOST", "localhost"), **options)
+    logger.info(f"✓ Qdrant client configured ({'gRPC' if prefer_grpc else 'REST'})")
+    return client
+
+
+def reset_clients():
+    """Drop shared clients so they are recreated (e.g. in a forked worker)"""
+    global _openai_client
+    with _lock:
+        _openai_client = None
@@ -0,0 +1,212 @@
+# backend/eval_retrieval.py - Retrieval speed/recall evaluation over search parameters
+"""
+Sweeps vector search parameters (hnsw_ef, exact, oversampling) and top_k
+over a labelled question set, measuring recall@k against search latency,
+so the fastest setting that keeps answer quality can be chosen.
+
+The labelled set is JSON or JSONL; each item has a question and the
+chunks that should be retrieved, by point id and/or by a text snippet
+contained in the chunk:
+
+    {"question": "What does chlorophyll do?", "relevant_ids": ["9dd4e461..."]}
+    {"question": "Define entropy", "relevant_texts": ["entropy is a measure"]}
+
+Without a labelled set, ``--sample N`` builds one from the collection
+itself (a sentence of each sampled chunk as the question), and
+``--ground-truth exact`` labels each question with the exact-search
+top_k instead, measuring how much recall approximate search gives up.
+
+    python eval_retrieval.py --labels questions.jsonl --ef 16,32,64,128 --k 3,8
+    python eval_retrieval.py --sample 200 --ground-truth exact --plot sweep.png
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import percentile, write_results
+
+
+def load_labels(path):
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for item in items:
+        if "question" not in item:
+            raise ValueError(f"Labelled item without a question: {item}")
+    return items
+
+
+def sample_labels(store, collection, count, seed):
+    """Self-labelled questions: one sentence from each sampled chunk, labelled with that chunk"""
+    rng = random.Random(seed)
+    points = store.scroll(collection, limit=max(count * 5, 100))
+    rng.shuffle(points)
+    items = []
+    for point in points[:count]:
+        sentences = [s for s in re.split(r'(?<=[.!?])\s+', point.payload.get("text", "")) if len(s) > 30]
+        if sentences:
+            items.append({"question": rng.choice(sentences), "relevant_ids": [str(point.id)]})
+    return items
+
+
+def is_relevant(hit, item):
+    if str(hit.id) in {str(i) for i in item.get("relevant_ids", [])}:
+        return True
+    text = hit.payload.get("text", "")
+    return any(snippet in text for snippet in item.get("relevant_texts", []))
+
+
+def recall_at_k(hits, item):
+    expected = len(item.get("relevant_ids", [])) + len(item.get("relevant_texts", []))
+    if not expected:
+        return None
+    found = sum(1 for hit in hits if is_relevant(hit, item))
+    return min(1.0, found / expected)
+
+
+def parse_list(value, kind):
+    return [kind(v) for v in value.split(",") if v.strip()]
+
+
+def parameter_grid(args):
+    """Every combination of the swept parameters, exact search included once"""
+    grid = []
+    oversampling = parse_list(args.oversampling, float) if args.oversampling else [None]
+    for ef, over in itertools.product(parse_list(args.ef, int), oversampling):
+        params = {"hnsw_ef": ef}
+        if over:
+            params["oversampling"] = over
+        grid.append(params)
+    if args.include_exact:
+        grid.append({"exact": True})
+    return grid
+
+
+def evaluate(store, collection, vectors, items, k, params, repeats):
+    latencies = []
+    recalls = []
+    for vector, item in zip(vectors, items):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            hits = store.search(collection, vector, k, params)
+            latencies.append(time.perf_counter() - start)
+        recall = recall_at_k(hits, item)
+        if recall is not None:
+            recalls.append(recall)
+    latencies.sort()
+    ms = lambda v: round(v * 1000.0, 3)
+    return {
+        "k": k,
+        "params": params,
+        "recall": round(sum(recalls) / len(recalls), 4) if recalls else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "qps": round(len(latencies) / sum(latencies), 1) if sum(latencies) else None,
+    }
+
+
+def plot(rows, path):
+    """Recall@k against p50 latency, one series per k; needs matplotlib"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️  matplotlib not installed; skipping plot (pip install matplotlib)")
+        return
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for k in sorted({row["k"] for row in rows}):
+        series = sorted((r for r in rows if r["k"] == k and r["recall"] is not None), key=lambda r: r["p50_ms"])
+        ax.plot([r["p50_ms"] for r in series], [r["recall"] for r in series], marker="o", label=f"k={k}")
+        for r in series:
+            ax.annotate(json.dumps(r["params"], separators=(",", ":")), (r["p50_ms"], r["recall"]), fontsize=6)
+    ax.set_xlabel("p50 search latency (ms)")
+    ax.set_ylabel("recall@k")
+    ax.set_title("Retrieval recall vs latency")
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    print(f"📈 Plot written to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep search parameters and measure recall@k vs latency")
+    parser.add_argument("--labels", help="Labelled questions (JSON or JSONL)")
+    parser.add_argument("--sample", type=int, help="Build N self-labelled questions from the collection")
+    parser.add_argument("--ground-truth", choices=["labels", "exact"], default="labels",
+                        help="Use the labels, or exact-search top_k results, as the relevant set")
+    parser.add_argument("--ef", default="16,32,64,128,256", help="Comma-separated hnsw_ef values")
+    parser.add_argument("--oversampling", default="", help="Comma-separated quantization oversampling values")
+    parser.add_argument("--no-exact", dest="include_exact", action="store_false", help="Skip the exact-search baseline")
+    parser.add_argument("--k", default="3,8", help="Comma-separated top_k values")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed searches per question and setting")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="Recall the recommendation must keep")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="retrieval-eval.json")
+    parser.add_argument("--plot", help="Write a recall-vs-latency PNG here (requires matplotlib)")
+    args = parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+    import rag
+
+    store = rag.init_vector_store()
+    if args.labels:
+        items = load_labels(args.labels)
+    elif args.sample:
+        items = sample_labels(store, rag.COLLECTION_NAME, args.sample, args.seed)
+    else:
+        parser.error("Provide --labels or --sample")
+    if not items:
+        raise SystemExit("No labelled questions to evaluate")
+
+    print(f"🔍 Embedding {len(items)} questions")
+    vectors = rag.get_embeddings_batch([item["question"] for item in items], batch_size=rag.BATCH_EMBED_SIZE)
+
+    ks = parse_list(args.k, int)
+    if args.ground_truth == "exact":
+        # Label with the exact top-k at the largest k; recall@k then compares against its first k
+        exact = [store.search(rag.COLLECTION_NAME, v, max(ks), {"exact": True}) for v in vectors]
+
+    rows = []
+    for k in ks:
+        if args.ground_truth == "exact":
+            items = [{"question": item["question"], "relevant_ids": [str(hit.id) for hit in hits[:k]]}
+                     for item, hits in zip(items, exact)]
+        for params in parameter_grid(args):
+            row = evaluate(store, rag.COLLECTION_NAME, vectors, items, k, params, args.repeats)
+            rows.append(row)
+            print(f"  k={k:<3} {json.dumps(params):<45} recall={row['recall']}  "
+                  f"p50={row['p50_ms']}ms  p95={row['p95_ms']}ms")
+
+    recommendations = {}
+    for k in ks:
+        ok = [r for r in rows if r["k"] == k and r["recall"] is not None and r["recall"] >= args.target_recall]
+        if ok:
+            best = min(ok, key=lambda r: r["p50_ms"])
+            recommendations[str(k)] = best
+            print(f"\n✓ k={k}: fastest setting with recall >= {args.target_recall}: "
+                  f"{json.dumps(best['params'])} (p50 {best['p50_ms']}ms, recall {best['recall']})")
+        else:
+            print(f"\n⚠️  k={k}: no setting reached recall {args.target_recall}")
+
+    config = {key: value for key, value in vars(args).items()}
+    write_results(args.output, "retrieval", config, {"rows": rows, "recommendations": recommendations})
+    if args.plot:
+        plot(rows, args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# backend/health.py - Background dependency checks behind cheap liveness/readiness probes
+"""
+Probes are called every few seconds by every load balancer and orchestrator
+watching the service, so they must cost next to nothing and must not turn
+a dependency's brief hiccup into a restarted worker:
+
+    GET /livez    the process is serving requests; touches nothing else
+    GET /readyz   the latest results of the checks below, which a background
+                  thread runs every HEALTH_CHECK_INTERVAL_SECONDS; the probe
+                  itself never calls a dependency
+    GET /health   deep diagnostics for people and dashboards (collections,
+                  chat statistics, upstream connections), computed at most
+                  once per HEALTH_DIAGNOSTICS_INTERVAL_SECONDS per worker
+
+A check that has passed is reported failing only after
+HEALTH_FAILURE_THRESHOLD consecutive failures; before it first passes (and
+after it has been reported failing) its latest result counts. A worker is not ready until its warm-up (compiling the moderation
+rules, a first reranker pass) has finished, and stops being ready when the
+checker hasn't reported for three intervals, e.g. because a check hangs.
+
+    HEALTH_CHECK_INTERVAL_SECONDS [10]   HEALTH_FAILURE_THRESHOLD [3]
+    HEALTH_DIAGNOSTICS_INTERVAL_SECONDS [30]
+"""
+import logging
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", 10))
+FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", 3))
+DIAGNOSTICS_INTERVAL_SECONDS = float(os.getenv("HEALTH_DIAGNOSTICS_INTERVAL_SECONDS", 30))
+# Results older than this many intervals mean the checker is stuck
+STALE_INTERVALS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Runs registered dependency checks on a background thread and keeps the results.
+
+    A check is a callable that raises when its dependency is unusable.
+    Warm-up callables run once, before the first round of checks.
+    """
+
+    def __init__(self, interval: float = CHECK_INTERVAL_SECONDS, failure_threshold: int = FAILURE_THRESHOLD):
+        self.interval = max(0.1, interval)
+        self.failure_threshold = max(1, failure_threshold)
+        self._checks = {}
+        self._warm_ups = {}
+        self._results = {}
+        self._warmed = False
+        self._checked_at = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def add_check(self, name, check):
+        self._checks[name] = check
+
+    def add_warm_up(self, name, warm_up):
+        self._warm_ups[name] = warm_up
+
+    def start(self):
+        # Threads do not survive fork, so a forked worker starts its own checker
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    # A forked worker has warmed nothing of its own yet
+                    self._results, self._warmed, self._checked_at = {}, False, None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='health-checker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        self.warm_up()
+        while True:
+            self.run_checks()
+            time.sleep(self.interval)
+
+    def warm_up(self):
+        for name, warm_up in self._warm_ups.items():
+            start = time.perf_counter()
+            try:
+                warm_up()
+                logger.info(f"✓ Warmed up {name} in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                # Serve anyway: the request that needs it will report the error
+                logger.error(f"❌ Warm-up of {name} failed: {e}")
+        self._warmed = True
+
+    def run_checks(self):
+        """Run every check once and record the results"""
+        for name, check in self._checks.items():
+            start = time.perf_counter()
+            try:
+                check()
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latency_ms = round((time.perf_counter() - start) * 1000, 1)
+            previous = self._results.get(name)
+            failures = 0 if error is None else (previous["consecutive_failures"] if previous else 0) + 1
+            if previous is None or not previous["ok"]:
+                # Until a check has passed, its latest result stands: a worker that
+                # boots with a dead dependency must not look ready meanwhile
+                ok = error is None
+            else:
+                ok = failures < self.failure_threshold
+            if previous and previous["ok"] != ok:
+                if ok:
+                    logger.info(f"✓ Health check {name} recovered")
+                else:
+                    logger.error(f"❌ Health check {name} failed {failures} times: {error}")
+            self._results[name] = {
+                "ok": ok,
+                "latency_ms": latency_ms,
+                "consecutive_failures": failures,
+                "error": error,
+            }
+        self._checked_at = time.monotonic()
+
+    def results(self):
+        return dict(self._results)
+
+    def readiness(self):
+        """(ready, report) from the latest recorded results; never runs a check itself"""
+        self.start()
+        checked_at = self._checked_at
+        results = self.results()
+        if checked_at is None:
+            return False, {"status": "starting", "models_warmed": self._warmed, "checks": results}
+        age = time.monotonic() - checked_at
+        stale = age > self.interval * STALE_INTERVALS
+        ready = self._warmed and not stale and all(result["ok"] for result in results.values())
+        return ready, {
+            "status": "ready" if ready else "not_ready",
+            "models_warmed": self._warmed,
+            "checked_seconds_ago": round(age, 1),
+            "stale": stale,
+            "checks": results,
+        }
+
+
+class Throttled:
+    """Calls ``fn`` at most once per ``interval`` seconds; callers in between get the last result.
+
+    Concurrent callers of an expired result wait for the one refresh instead
+    of each running ``fn``.
+    """
+
+    def __init__(self, fn, interval: float = DIAGNOSTICS_INTERVAL_SECONDS):
+        self.fn = fn
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._result = None
+        self._computed_at = None
+
+    def get(self):
+        """(result, age in seconds)"""
+        with self._lock:
+            if self._computed_at is None or time.monotonic() - self._computed_at >= self.interval:
+                self._result = self.fn()
+                self._computed_at = time.monotonic()
+            return self._result, time.monotonic() - self._computed_at
+
+
+health_monitor = HealthMonitor()
+
+REGISTRY.gauge(
+    "tutortron_dependency_up",
+    "Whether each dependency passed its background health check (1) or not (0)",
+    ["dependency"],
+    callback=lambda: {(name,): int(result["ok"]) for name, result in health_monitor.results().items()}
+)
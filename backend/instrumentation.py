@@ -0,0 +1,70 @@
+# backend/instrumentation.py - Per-stage timing hooks for the request pipeline
+"""
+Hot-path code wraps each pipeline stage in ``with stage("embed"):``.
+Listeners registered with ``add_listener`` receive ``(stage_name, seconds)``
+for every completed stage, and start listeners receive ``stage_name`` when
+one begins. With no listeners registered a stage costs a single list check,
+so the hooks can stay in production code.
+
+Stage names used by the backend:
+
+    moderation   content flag checks on incoming messages
+    db_write     ChatStorage writes made while handling a request
+    embed        embedding requests
+    search       vector store searches
+    rerank       reranking of retrieved chunks
+    generate     chat completions
+"""
+import functools
+import time
+from contextlib import contextmanager
+
+_listeners = []
+_start_listeners = []
+
+
+def add_listener(listener):
+    """Register ``listener(stage_name, seconds)`` for every completed stage"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def add_start_listener(listener):
+    """Register ``listener(stage_name)`` called when a stage begins"""
+    if listener not in _start_listeners:
+        _start_listeners.append(listener)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block and report it to the listeners"""
+    if not _listeners and not _start_listeners:
+        yield
+        return
+    for listener in list(_start_listeners):
+        listener(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in list(_listeners):
+            listener(name, elapsed)
+
+
+def timed(name):
+    """Decorator form of ``stage`` for functions that are a stage in themselves"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _listeners and not _start_listeners:
+                return fn(*args, **kwargs)
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
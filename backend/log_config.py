@@ -0,0 +1,190 @@
+# backend/log_config.py - Non-blocking structured logging with request correlation ids
+"""
+Logging calls on the request path only merge the message and put the
+record on a bounded queue; a listener thread formats it and writes it out,
+so slow log I/O never stalls a request. When the queue is full, records are dropped and counted
+(tutortron_log_records_dropped_total) instead of blocking.
+
+Records are JSON lines by default (LOG_FORMAT=text for the classic console
+format), and every record carries the id of the request that logged it.
+The id is taken from the X-Request-ID header when a proxy sets one (the
+Next.js API routes do), or made up, and is echoed in the response.
+
+Per-request retrieval detail (scores, chunk previews, prompt sizes) is
+debug output: it is logged for every request at LOG_LEVEL=DEBUG, and
+otherwise for a LOG_DETAIL_SAMPLE_RATE share of requests.
+
+Importing this module changes nothing: entry points (create_app,
+serve.py, the command-line tools) call configure_logging().
+
+    LOG_LEVEL [INFO]   LOG_FORMAT [json]   LOG_QUEUE_SIZE [10000]
+    LOG_DETAIL_SAMPLE_RATE [0.01]
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+
+from metrics import REGISTRY
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+DETAIL_SAMPLE_RATE = float(os.getenv("LOG_DETAIL_SAMPLE_RATE", 0.01))
+TEXT_FORMAT = "%(levelname)s:%(name)s:[%(request_id)s] %(message)s"
+
+# Ids from clients are only trusted if they look like ids
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+_detail_sampled = contextvars.ContextVar("log_detail_sampled", default=False)
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "tutortron_log_records_dropped_total",
+    "Log records dropped because the log queue was full"
+)
+
+
+def start_request(request_id=None):
+    """Bind a request id (the given one if valid, else a new one) to the current context; returns it.
+
+    Also decides whether this request logs retrieval detail (see detail_logger).
+    """
+    if not request_id or not _REQUEST_ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    _request_id.set(request_id)
+    _detail_sampled.set(DETAIL_SAMPLE_RATE > 0 and random.random() < DETAIL_SAMPLE_RATE)
+    return request_id
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def detail_logger(logger):
+    """The logging method for per-request detail, or None when this request logs none.
+
+    At DEBUG level every request logs detail (``logger.debug``); otherwise
+    only sampled requests do, at INFO. Check the result before building
+    expensive arguments.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        return logger.debug
+    if _detail_sampled.get() and logger.isEnabledFor(logging.INFO):
+        return logger.info
+    return None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id; runs in the thread that logs"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with ``extra=``"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + ".%03dZ" % record.msecs,
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising"""
+
+    def prepare(self, record):
+        # Merge the arguments here: they may be mutable objects the caller keeps
+        # changing. The traceback is kept as text for the listener's formatter.
+        # The root handler runs after every other handler, so no copy is needed.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_handler = None
+_listener = None
+
+
+def _start_listener(output):
+    global _listener
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Route the root logger through a queue to a listener thread writing to ``stream`` (stderr).
+
+    Replaces handlers installed earlier (e.g. by logging.basicConfig).
+    Calling it again reconfigures.
+    """
+    global _handler
+    stop_logging()
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    _handler = _DroppingQueueHandler(queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE)))
+    _handler.addFilter(RequestIdFilter())
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _start_listener(output)
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    # The listener thread doesn't survive fork: a child gets its own queue and thread
+    if _listener is not None:
+        output = _listener.handlers[0]
+        _handler.queue = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+        _start_listener(output)
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
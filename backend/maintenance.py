@@ -0,0 +1,216 @@
+# backend/maintenance.py - Chat database maintenance (archiving cold chats, reclaiming space)
+"""
+Moves chats that have not been touched for a while into the compressed
+archive table, restores them, and reports how much space the archive
+saves. Archived chats stay readable through ChatStorage; writing to one
+restores it automatically. Also re-splits the database when the shard
+count (CHAT_DB_SHARDS) changes, and exports/imports chats as NDJSON
+(see chat_export.py).
+
+    python maintenance.py stats
+    python maintenance.py archive --days 180 --limit 5000
+    python maintenance.py archive --days 180 --vacuum     # also give the freed pages back to the OS
+    python maintenance.py restore <chat_id>
+    python maintenance.py reshard --from-shards 1 --to-shards 4   # then set CHAT_DB_SHARDS=4
+    python maintenance.py export --output chats.ndjson.gz [--user <user_id>]
+    python maintenance.py import chats.ndjson.gz
+
+Run --vacuum in a quiet period: VACUUM rewrites the whole file and holds
+the write lock while it does.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def human_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024.0
+
+
+def database_size(storage):
+    """Bytes of the database files (every shard) plus their WALs"""
+    paths = [shard.db_path for shard in storage.shards]
+    return sum(os.path.getsize(p) for path in paths for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def reclaimable_bytes(storage):
+    """Free pages left behind by deletes, which VACUUM gives back"""
+    total = 0
+    for shard in storage.shards:
+        with shard._connection() as conn:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        total += free_pages * page_size
+    return total
+
+
+def vacuum(storage):
+    storage.flush()
+    for shard in storage.shards:
+        with shard._connection(write=True) as conn:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    # VACUUM may renumber rowids, which the full-text indexes point at
+    storage.rebuild_search_index()
+
+
+def reshard(db_path, from_shards, to_shards):
+    """Copy every user's data from a ``from_shards`` split into a new ``to_shards`` split.
+    
+    The source files are left untouched; the new files must not hold chats
+    yet. Rows are copied in bulk with the triggers' derived data (counters,
+    search index) rebuilt afterwards.
+    """
+    from chat_storage import open_chat_storage, shard_index, shard_paths
+
+    sources = shard_paths(db_path, from_shards)
+    targets = shard_paths(db_path, to_shards)
+    if set(sources) & set(targets):
+        raise SystemExit("Source and target shard files are the same")
+
+    # Opening migrates the sources to the current schema and commits queued writes
+    source = open_chat_storage(db_path, from_shards)
+    source.flush()
+    source_chats = source.get_chat_statistics()["total_chats"]
+    source.close()
+    if not source_chats:
+        raise SystemExit(f"No chats in the {from_shards}-shard database at {db_path}")
+    target = open_chat_storage(db_path, to_shards)
+
+    copied = {"users": 0, "chats": 0, "messages": 0, "chat_archive": 0}
+    for index, shard in enumerate(target.shards):
+        with shard._connection() as conn:
+            if conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]:
+                raise SystemExit(f"Target {shard.db_path} already holds chats")
+
+        conn = sqlite3.connect(shard.db_path, isolation_level=None)
+        conn.create_function("shard_of", 1, lambda user_id: shard_index(user_id, to_shards), deterministic=True)
+        columns = {table: ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+                   for table in copied}
+        try:
+            for path in sources:
+                conn.execute("ATTACH DATABASE ? AS src", (path,))
+                conn.execute("BEGIN IMMEDIATE")
+                # Messages go in before their chats so the per-chat counter
+                # triggers find nothing to update; the copied chat rows carry them
+                for table, select in (
+                    ("users", "SELECT {cols} FROM src.users WHERE shard_of(id) = ?"),
+                    ("messages", "SELECT {mcols} FROM src.messages m JOIN src.chats c ON c.id = m.chat_id "
+                                 "WHERE shard_of(c.user_id) = ? ORDER BY m.rowid"),
+                    ("chat_archive", "SELECT {mcols} FROM src.chat_archive m JOIN src.chats c ON c.id = m.chat_id "
+                                     "WHERE shard_of(c.user_id) = ?"),
+                    ("chats", "SELECT {cols} FROM src.chats WHERE shard_of(user_id) = ?"),
+                ):
+                    cols = columns[table]
+                    mcols = ", ".join(f"m.{col.strip()}" for col in cols.split(","))
+                    cursor = conn.execute(f"INSERT OR IGNORE INTO {table} ({cols}) " +
+                                          select.format(cols=cols, mcols=mcols), (index,))
+                    copied[table] += cursor.rowcount
+                conn.execute("COMMIT")
+                conn.execute("DETACH DATABASE src")
+        finally:
+            conn.close()
+        print(f"  ✓ {shard.db_path}")
+
+    target.recount_statistics()
+    target.rebuild_search_index()
+    target.close()
+    return copied
+
+
+def print_stats(storage):
+    stats = storage.get_archive_stats()
+    saved = stats["raw_bytes"] - stats["compressed_bytes"]
+    ratio = stats["raw_bytes"] / stats["compressed_bytes"] if stats["compressed_bytes"] else 0
+    print(f"📦 Archive: {stats['chats']} chats, {stats['messages']} messages")
+    print(f"   {human_bytes(stats['raw_bytes'])} raw -> {human_bytes(stats['compressed_bytes'])} compressed "
+          f"({ratio:.1f}x, {human_bytes(saved)} saved)")
+    print(f"   Database files: {human_bytes(database_size(storage))}, "
+          f"reclaimable by VACUUM: {human_bytes(reclaimable_bytes(storage))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat database maintenance")
+    parser.add_argument("--db", default=os.getenv("CHAT_DB_PATH", "chats.db"), help="Chat database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser("archive", help="Compress chats not updated for --days into the archive")
+    archive.add_argument("--days", type=int, default=None, help="Age threshold (default CHAT_ARCHIVE_AFTER_DAYS)")
+    archive.add_argument("--limit", type=int, default=None, help="Archive at most this many chats")
+    archive.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the file")
+
+    restore = commands.add_parser("restore", help="Move an archived chat back to hot storage")
+    restore.add_argument("chat_id")
+
+    commands.add_parser("stats", help="Show archive size and reclaimable space")
+
+    split = commands.add_parser("reshard", help="Copy the data into a split over a different number of shards")
+    split.add_argument("--from-shards", type=int, default=int(os.getenv("CHAT_DB_SHARDS", 1)))
+    split.add_argument("--to-shards", type=int, required=True)
+    export = commands.add_parser("export", help="Write users and chats with their messages as NDJSON")
+    export.add_argument("--output", default="-", help="File to write (.gz compresses; default stdout)")
+    export.add_argument("--user", help="Only this user's chats")
+
+    load = commands.add_parser("import", help="Load an NDJSON export (plain or gzip)")
+    load.add_argument("input", help="Export file, or - for stdin")
+    load.add_argument("--batch-size", type=int, default=None, help="Rows per transaction (default CHAT_IMPORT_BATCH_SIZE)")
+    args = parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+    # The storage module opens CHAT_DB_PATH on import
+    os.environ["CHAT_DB_PATH"] = args.db
+    if args.command == "reshard":
+        os.environ["CHAT_DB_SHARDS"] = str(args.from_shards)
+        print(f"🔀 Resharding {args.db}: {args.from_shards} -> {args.to_shards} shards")
+        copied = reshard(args.db, args.from_shards, args.to_shards)
+        print(f"✓ Copied {copied['users']} users, {copied['chats']} chats, {copied['messages']} messages, "
+              f"{copied['chat_archive']} archived chats")
+        print(f"   Set CHAT_DB_SHARDS={args.to_shards} and restart; the old files can be removed afterwards")
+        return 0
+
+    from chat_storage import chat_storage, ARCHIVE_AFTER_DAYS
+    from chat_export import export_to_file, import_from_file
+
+    if args.command == "export":
+        count = export_to_file(chat_storage, args.output, args.user)
+        print(f"✓ Exported {count} records", file=sys.stderr)
+    elif args.command == "import":
+        start = time.perf_counter()
+        counts = import_from_file(chat_storage, args.input, args.batch_size)
+        print(f"✓ Imported {counts['users']} users, {counts['chats']} chats, {counts['messages']} messages "
+              f"in {time.perf_counter() - start:.1f}s")
+    elif args.command == "stats":
+        print_stats(chat_storage)
+    elif args.command == "restore":
+        if chat_storage.restore_chat(args.chat_id):
+            print(f"✓ Restored chat {args.chat_id}")
+        else:
+            print(f"⚠️  Chat {args.chat_id} is not archived")
+            return 1
+    elif args.command == "archive":
+        days = args.days if args.days is not None else ARCHIVE_AFTER_DAYS
+        result = chat_storage.archive_chats(days, args.limit)
+        print(f"✓ Archived {result['chats']} chats ({result['messages']} messages) older than {days} days: "
+              f"{human_bytes(result['raw_bytes'])} -> {human_bytes(result['compressed_bytes'])}")
+        if args.vacuum:
+            before = database_size(chat_storage)
+            print(f"🧹 Vacuuming ({human_bytes(reclaimable_bytes(chat_storage))} reclaimable)...")
+            vacuum(chat_storage)
+            after = database_size(chat_storage)
+            print(f"✓ Database file {human_bytes(before)} -> {human_bytes(after)}")
+        else:
+            print(f"   {human_bytes(reclaimable_bytes(chat_storage))} reclaimable; run with --vacuum to shrink the file")
+    chat_storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
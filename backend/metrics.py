@@ -0,0 +1,413 @@
+# backend/metrics.py - Prometheus-style metrics with low-overhead recording
+"""
+Counters, gauges and histograms rendered in the Prometheus text exposition
+format by ``/metrics``.
+
+Recording is kept cheap and lock-light: every labelled child is resolved
+once and cached, and each child spreads its updates over a few lock stripes
+chosen by thread id, so concurrent request threads rarely touch the same
+lock and never hold one for more than a couple of additions. Stripes are
+only summed when the endpoint is scraped.
+"""
+import bisect
+import functools
+import inspect
+import math
+import threading
+import time
+
+from instrumentation import add_listener, add_start_listener
+
+_STRIPES = 8
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _stripe():
+    return threading.get_ident() % _STRIPES
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for metrics; a ``callback`` computes the value(s) at scrape time instead.
+
+    A callback returns a number, or for labelled metrics a dict mapping
+    label-value tuples to numbers. It suits values another component
+    already keeps, such as counts held by a SingleFlight.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def labels(self, *values, **kwargs):
+        """Child metric for one combination of label values (cached after first use)"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        else:
+            values = tuple(values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return lines
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            for values, v in items:
+                if v is not None:
+                    lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(float(v))}")
+            return lines
+        for values, child in self._items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("_stripes",)
+
+    def __init__(self):
+        self._stripes = [[threading.Lock(), 0.0] for _ in range(_STRIPES)]
+
+    def inc(self, amount=1.0):
+        stripe = self._stripes[_stripe()]
+        with stripe[0]:
+            stripe[1] += amount
+
+    def get(self):
+        return sum(stripe[1] for stripe in self._stripes)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+
+
+class _GaugeChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def get(self):
+        return self.value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default.dec(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_stripes")
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # Each stripe: [lock, bucket counts (+Inf last), sum]
+        self._stripes = [[threading.Lock(), [0] * (len(buckets) + 1), 0.0] for _ in range(_STRIPES)]
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        stripe = self._stripes[_stripe()]
+        with stripe[0]:
+            stripe[1][index] += 1
+            stripe[2] += value
+
+    def time(self):
+        """Context manager that observes the elapsed seconds"""
+        return _Timer(self)
+
+    def snapshot(self):
+        counts = [0] * (len(self._buckets) + 1)
+        total = 0.0
+        for stripe in self._stripes:
+            with stripe[0]:
+                for i, c in enumerate(stripe[1]):
+                    counts[i] += c
+                total += stripe[2]
+        return counts, total
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, values, child):
+        counts, total = child.snapshot()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = _format_labels(self.labelnames, values, [("le", _format_value(float(bound)))])
+            yield f"{self.name}_bucket{le} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ===== STANDARD METRICS =====
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "tutortron_stage_duration_seconds",
+    "Latency of pipeline stages and external calls (embed, search, rerank, generate, moderation, db_write)",
+    ["stage"]
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "tutortron_stage_in_flight",
+    "Pipeline stages currently executing",
+    ["stage"]
+)
+STORAGE_SECONDS = REGISTRY.histogram(
+    "tutortron_storage_duration_seconds",
+    "Latency of ChatStorage methods",
+    ["method"]
+)
+STORAGE_ERRORS = REGISTRY.counter(
+    "tutortron_storage_errors_total",
+    "ChatStorage method calls that raised",
+    ["method"]
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "tutortron_http_requests_total",
+    "HTTP requests by route, method and status code",
+    ["route", "method", "status"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "tutortron_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["route", "method"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "tutortron_http_requests_in_flight",
+    "HTTP requests currently being handled, by route",
+    ["route"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "tutortron_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"]
+)
+
+
+def _cache_hit_ratios():
+    totals = {}
+    for (cache, result), child in CACHE_REQUESTS._items():
+        hits, lookups = totals.get(cache, (0.0, 0.0))
+        value = child.get()
+        totals[cache] = (hits + (value if result == "hit" else 0.0), lookups + value)
+    return {(cache,): hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "tutortron_cache_hit_ratio",
+    "Fraction of cache lookups that were hits since start",
+    ["cache"],
+    callback=_cache_hit_ratios
+)
+
+
+def record_cache(cache, hit):
+    """Count one lookup against ``cache``"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def instrument_methods(histogram, errors=None, prefix=""):
+    """Class decorator timing every public method into ``histogram{method=...}``.
+
+    Generator methods are timed over their whole iteration, counting only
+    the time spent inside the generator, and errors raised while iterating
+    are counted too.
+    """
+    def decorator(cls):
+        for attr, fn in list(vars(cls).items()):
+            if attr.startswith("_") or not callable(fn):
+                continue
+            observe = _observed_generator if inspect.isgeneratorfunction(fn) else _observed
+            setattr(cls, attr, observe(fn, histogram.labels(prefix + attr),
+                                        errors.labels(prefix + attr) if errors else None))
+        return cls
+    return decorator
+
+
+def _observed(fn, child, error_child):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if error_child is not None:
+                error_child.inc()
+            raise
+        finally:
+            child.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def _observed_generator(fn, child, error_child):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        generator = fn(*args, **kwargs)
+        busy = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                except Exception:
+                    if error_child is not None:
+                        error_child.inc()
+                    raise
+                finally:
+                    busy += time.perf_counter() - start
+                yield item
+        finally:
+            # Also when the consumer stops early: close the inner generator first
+            generator.close()
+            child.observe(busy)
+    return wrapper
+
+
+# Pipeline stages report through instrumentation hooks
+add_start_listener(lambda name: STAGE_IN_FLIGHT.labels(name).inc())
+
+
+def _on_stage_end(name, seconds):
+    STAGE_IN_FLIGHT.labels(name).dec()
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+
+add_listener(_on_stage_end)
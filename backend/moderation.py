@@ -0,0 +1,226 @@
+# backend/moderation.py - Content moderation with a compiled single-pass matcher
+"""
+Flags messages that contain blocked keywords, are mostly shouting, or
+repeat one word over and over. Rules live in a JSON file
+(MODERATION_RULES_PATH, default moderation_rules.json next to this
+module) that is re-read when it changes:
+
+    {
+      "keywords": [
+        "violence",                                   # a whole word
+        {"term": "hack", "mode": "word", "forms": ["hacked", "hacking"]},
+        {"term": "fraud", "mode": "prefix"},          # fraud, fraudulent, ...
+        {"term": "xxx", "mode": "substring"}          # anywhere inside a word
+      ],
+      "caps": {"min_length": 20, "max_ratio": 0.7},
+      "repetition": {"min_words": 6, "max_repeats": 5}
+    }
+
+All keywords are compiled into one case-insensitive regex whose
+alternatives are a character trie, so the cost per character barely
+grows with the number of rules. One scan over the text finds keywords.
+The caps and repetition checks are the original ones: the share of
+uppercase characters, and case-sensitive counts of whitespace-separated
+words.
+
+    MODERATION_RULES_PATH   MODERATION_RELOAD_SECONDS [5]
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.getenv(
+    "MODERATION_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "moderation_rules.json")
+)
+RELOAD_SECONDS = float(os.getenv("MODERATION_RELOAD_SECONDS", 5))
+MODES = ("word", "prefix", "substring")
+# Every reason check() gives starts with one of these; other reasons were set by an admin
+AUTOMATIC_REASONS = (
+    "Contains inappropriate keyword: ",
+    "Excessive use of capital letters",
+    "Excessive repetition of word: ",
+)
+
+DEFAULT_RULES = {
+    "keywords": [],
+    "caps": {"min_length": 20, "max_ratio": 0.7},
+    "repetition": {"min_words": 6, "max_repeats": 5},
+}
+
+
+def trie_pattern(terms):
+    """A regex matching any of ``terms``, factored into a character trie"""
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = None
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    branches = [re.escape(char) + _node_pattern(child)
+                for char, child in sorted(node.items()) if char != ""]
+    if not branches:
+        return ""
+    if "" in node:
+        # A term ends here: the longer continuations are optional
+        return "(?:" + "|".join(branches) + ")?"
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class ModerationEngine:
+    """Moderation rules compiled into one regex; ``check`` makes a single pass over the text"""
+
+    def __init__(self, rules):
+        rules = {**DEFAULT_RULES, **(rules or {})}
+        self.labels = {}  # lower-cased matched text -> keyword reported in the reason
+        terms = {mode: set() for mode in MODES}
+        for rule in rules["keywords"]:
+            if isinstance(rule, str):
+                rule = {"term": rule}
+            mode = rule.get("mode", "word")
+            if mode not in MODES:
+                raise ValueError(f"Unknown keyword mode {mode!r} for {rule.get('term')!r}")
+            label = rule["term"]
+            for form in [label] + list(rule.get("forms", ())):
+                form = form.strip().lower()
+                if form:
+                    terms[mode].add(form)
+                    self.labels.setdefault(form, label)
+        self.rule_count = sum(len(t) for t in terms.values())
+
+        # Matching runs on lower-cased text, which is cheaper than IGNORECASE.
+        # Word and prefix terms are only tried where a word starts; substring
+        # terms match anywhere, so "scam" in "scamper" needs the word mode
+        starts = []
+        if terms["word"]:
+            starts.append("(?P<word>" + trie_pattern(terms["word"]) + r")\b")
+        if terms["prefix"]:
+            starts.append("(?P<prefix>" + trie_pattern(terms["prefix"]) + ")")
+        self.patterns = []
+        if starts:
+            self.patterns.append(re.compile(r"\b(?:" + "|".join(starts) + ")"))
+        if terms["substring"]:
+            self.patterns.append(re.compile("(?P<substring>" + trie_pattern(terms["substring"]) + ")"))
+
+        caps = rules["caps"]
+        self.caps_min_length = caps.get("min_length", 20)
+        self.caps_max_ratio = caps.get("max_ratio", 0.7)
+        repetition = rules["repetition"]
+        self.repeat_min_words = repetition.get("min_words", 6)
+        self.repeat_max = repetition.get("max_repeats", 5)
+
+    def check(self, content):
+        """(is_flagged, reason) for ``content``"""
+        # Every step below runs in C: a regex scan for the keywords, a count
+        # of uppercase characters and one Counter over whitespace-split words
+        lowered = content.lower()
+        for pattern in self.patterns:
+            match = pattern.search(lowered)
+            if match:
+                found = match.group(match.lastgroup)
+                return True, f"Contains inappropriate keyword: {self.labels.get(found, found)}"
+
+        if len(content) > self.caps_min_length:
+            caps = sum(map(str.isupper, content))
+            if caps / len(content) > self.caps_max_ratio:
+                return True, "Excessive use of capital letters"
+        words = content.split()
+        if len(words) >= self.repeat_min_words:
+            counts = Counter(words)
+            if max(counts.values()) > self.repeat_max:
+                return True, f"Excessive repetition of word: {self._first_repeated(words)}"
+        return False, None
+
+    def _first_repeated(self, words):
+        """The first word seen more than repeat_max times, reading from the start"""
+        seen = Counter()
+        for word in words:
+            seen[word] += 1
+            if seen[word] > self.repeat_max:
+                return word
+
+
+def is_automatic_reason(reason):
+    """Whether a flag_reason came from check() rather than an admin"""
+    return bool(reason) and reason.startswith(AUTOMATIC_REASONS)
+
+
+def load_rules(path=RULES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+class _Reloader:
+    """Keeps the engine for the rules file current, re-reading it when its mtime changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._engine = None
+        self._mtime = None
+        self._checked = 0.0
+
+    def engine(self):
+        now = time.monotonic()
+        if self._engine is not None and now - self._checked < RELOAD_SECONDS:
+            return self._engine
+        with self._lock:
+            if self._engine is None or now - self._checked >= RELOAD_SECONDS:
+                self._checked = now
+                self._reload_if_changed()
+            return self._engine
+
+    def reload(self):
+        with self._lock:
+            self._mtime = None
+            self._reload_if_changed()
+            return self._engine
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if self._engine is not None and mtime == self._mtime:
+            return
+        try:
+            engine = ModerationEngine(load_rules(self.path) if mtime is not None else DEFAULT_RULES)
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            logger.error(f"❌ Invalid moderation rules in {self.path}: {e}")
+            if self._engine is None:
+                self._engine = ModerationEngine(DEFAULT_RULES)
+            return
+        if mtime is None:
+            logger.warning(f"⚠️ Moderation rules {self.path} not found; only caps and repetition checks apply")
+        self._engine = engine
+        self._mtime = mtime
+        logger.info(f"✓ Loaded {engine.rule_count} moderation keywords from {self.path}")
+
+
+_reloader = _Reloader(RULES_PATH)
+
+
+def get_engine():
+    return _reloader.engine()
+
+
+def reload_rules():
+    """Re-read the rules file now instead of at the next periodic check"""
+    return _reloader.reload()
+
+
+def check_content(content):
+    """(is_flagged, reason) under the current rules"""
+    return get_engine().check(content)
@@ -2,67 +2,127 @@
 from dotenv import load_dotenv
 load_dotenv()
 import pdfplumber
-from openai import OpenAI
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from singleflight import SingleFlight
+from instrumentation import stage
+from metrics import REGISTRY
+from log_config import configure_logging, detail_logger
+from admission import llm_limiter
+import backends
+import clients
 import hashlib
-import numpy as np
-from sentence_transformers import CrossEncoder
+import contextvars
 import datetime
 import os
 import logging
 import re
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the entry points (create_app, serve.py, the CLIs)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
+# Backends are chosen by environment variables (see backends.py) and can be
+# swapped at runtime with configure_backends(), e.g. for offline benchmarks
 openai_client = None
+embedder = None
+completer = None
+reranker = None
+
+if backends.uses_openai():
+    try:
+        openai_client = backends.create_openai_client()
+        logger.info("✓ OpenAI client initialized successfully")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize OpenAI client: {e}")
+
 try:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key or api_key == "your_openai_api_key_here":
-        logger.error("OpenAI API key not configured!")
-        raise ValueError("OpenAI API key not configured")
-    
-    openai_client = OpenAI(api_key=api_key)
-    logger.info("✓ OpenAI client initialized successfully")
+    embedder = backends.create_embedder(openai_client)
+    completer = backends.create_completer(openai_client)
 except Exception as e:
-    logger.error(f"❌ Failed to initialize OpenAI client: {e}")
+    logger.error(f"❌ Failed to initialize model backends: {e}")
 
 COLLECTION_NAME = "ai_ta_docs"
 
-# Initialize Qdrant client but don't create collection immediately
-qdrant = None
+# Bumped whenever the document collection changes, so coalesced or cached
+# answers are never shared across different corpus contents
+corpus_version = 0
+
+def bump_corpus_version():
+    """Mark the document collection as changed"""
+    global corpus_version
+    corpus_version += 1
+    return corpus_version
+
+# Initialize the vector store lazily but don't create collection immediately
+vector_store = None
+
+# Default HNSW search parameters (QDRANT_HNSW_EF, QDRANT_EXACT_SEARCH,
+# QDRANT_OVERSAMPLING); requests can override them per call
+DEFAULT_SEARCH_PARAMS = backends.search_params_from_env()
+
+def resolve_search_params(search_params=None):
+    """Merge per-request search parameters over the configured defaults"""
+    return {**DEFAULT_SEARCH_PARAMS, **backends.normalize_search_params(search_params)}
+
+def configure_backends(**overrides):
+    """Replace active backends, e.g. configure_backends(embedder=backends.HashEmbedder())"""
+    unknown = set(overrides) - {"embedder", "completer", "vector_store", "reranker"}
+    if unknown:
+        raise TypeError(f"Unknown backends: {', '.join(sorted(unknown))}")
+    globals().update(overrides)
+    if "vector_store" in overrides:
+        dimension = embedder.dimension if embedder else backends.EMBEDDING_DIMENSION
+        vector_store.ensure_collection(COLLECTION_NAME, dimension)
+        bump_corpus_version()
+
+def is_ai_configured():
+    """Whether both the embedding and completion backends are available"""
+    return embedder is not None and completer is not None
 
-def init_qdrant():
-    """Initialize Qdrant connection and create collection if needed"""
-    global qdrant
+def init_vector_store():
+    """Initialize the vector store connection and create collection if needed"""
+    global vector_store
     
-    if qdrant is None:
+    if vector_store is None:
         try:
-            qdrant = QdrantClient(host="localhost", port=6333)
-            logger.info("✓ Connected to Qdrant")
+            store = backends.create_vector_store()
+            logger.info(f"✓ Connected to vector store ({type(store).__name__})")
             
             # Check if collection exists, create if it doesn't
-            collections = qdrant.get_collections()
-            collection_names = [col.name for col in collections.collections]
-            
-            if COLLECTION_NAME not in collection_names:
-                qdrant.recreate_collection(
-                    collection_name=COLLECTION_NAME,
-                    vectors_config=VectorParams(size=1536, distance=Distance.COSINE)
-                )
-                logger.info(f"✓ Created collection: {COLLECTION_NAME}")
-            else:
-                logger.info(f"✓ Collection {COLLECTION_NAME} already exists")
+            dimension = embedder.dimension if embedder else backends.EMBEDDING_DIMENSION
+            store.ensure_collection(COLLECTION_NAME, dimension)
+            vector_store = store
                 
         except Exception as e:
-            logger.error(f"❌ Failed to connect to Qdrant: {e}")
+            logger.error(f"❌ Failed to connect to vector store: {e}")
             logger.error("Make sure Qdrant is running: docker run -p 6333:6333 qdrant/qdrant")
             raise e
     
-    return qdrant
+    return vector_store
+
+def reset_connections():
+    """Drop upstream connections inherited from a parent process; models stay shared.
+    
+    Runs in every forked child (os.register_at_fork): sockets must not be
+    shared between processes, so OpenAI-backed backends get a new client and
+    a Qdrant store reconnects on first use. The reranker model is read-only
+    and is shared with the parent copy-on-write.
+    """
+    global openai_client, embedder, completer, vector_store
+    clients.reset_clients()
+    if openai_client is not None:
+        try:
+            openai_client = backends.create_openai_client()
+            if isinstance(embedder, backends.OpenAIEmbedder):
+                embedder = backends.create_embedder(openai_client)
+            if isinstance(completer, backends.OpenAICompleter):
+                completer = backends.create_completer(openai_client)
+        except Exception as e:
+            logger.error(f"❌ Failed to recreate OpenAI client after fork: {e}")
+    if isinstance(vector_store, backends.QdrantStore):
+        vector_store = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_connections)
 
 def smart_chunk_text(text, max_chars=800, overlap=100):
     """Split text into chunks with better sentence and paragraph awareness"""
@@ -131,7 +191,7 @@ def pdf_to_chunks(pdf_path):
                     page_text = re.sub(r'\s+', ' ', page_text)
                     # Add page breaks
                     full_text += page_text + "\n\n"
-                    logger.info(f"Extracted {len(page_text)} characters from page {page_num + 1}")
+                    logger.debug("Extracted %d characters from page %d", len(page_text), page_num + 1)
         
         if not full_text.strip():
             logger.warning("No text extracted from PDF")
@@ -139,11 +199,13 @@ def pdf_to_chunks(pdf_path):
         
         # Use smart chunking instead of simple character splitting
         chunks = smart_chunk_text(full_text, max_chars=800, overlap=100)
-        logger.info(f"Created {len(chunks)} smart chunks from PDF")
+        logger.info("Created %d smart chunks from PDF", len(chunks))
         
         # Log some sample chunks for debugging
-        for i, chunk in enumerate(chunks[:3]):
-            logger.info(f"Sample chunk {i+1}: {chunk[:200]}...")
+        detail = detail_logger(logger)
+        if detail:
+            for i, chunk in enumerate(chunks[:3]):
+                detail("Sample chunk %d: %.200s...", i + 1, chunk)
         
         return chunks
     except Exception as e:
@@ -152,35 +214,28 @@ def pdf_to_chunks(pdf_path):
 
 def get_embedding(text, batch_size=8):
     """Get embedding for a single text"""
-    if not openai_client:
-        raise ValueError("OpenAI client not initialized")
+    if not embedder:
+        raise ValueError("Embedding backend not initialized")
     
     try:
-        response = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=[text]
-        )
-        return response.data[0].embedding
+        with stage("embed"):
+            return embedder.embed([text])[0]
     except Exception as e:
         logger.error(f"Error getting embedding: {e}")
         raise e
 
 def get_embeddings_batch(texts, batch_size=8):
     """Get embeddings for multiple texts in batches"""
-    if not openai_client:
-        raise ValueError("OpenAI client not initialized")
+    if not embedder:
+        raise ValueError("Embedding backend not initialized")
     
     all_embeddings = []
     for i in range(0, len(texts), batch_size):
         batch = texts[i:i + batch_size]
         try:
-            response = openai_client.embeddings.create(
-                model="text-embedding-3-small",
-                input=batch
-            )
-            embeddings = [r.embedding for r in response.data]
-            all_embeddings.extend(embeddings)
-            logger.info(f"Got embeddings for batch {i//batch_size + 1}")
+            with stage("embed"):
+                all_embeddings.extend(embedder.embed(batch))
+            logger.debug("Got embeddings for batch %d", i // batch_size + 1)
         except Exception as e:
             logger.error(f"Error getting embeddings for batch: {e}")
             raise e
@@ -190,15 +245,14 @@ def upload_pdf(pdf_path):
     """Upload and process PDF file"""
     logger.info(f"Processing PDF: {pdf_path}")
     
-    # Initialize Qdrant connection
-    qdrant_client = init_qdrant()
+    # Initialize vector store connection
+    store = init_vector_store()
     
     # Extract chunks from PDF
     chunks = pdf_to_chunks(pdf_path)
     if not chunks:
         raise ValueError("No text could be extracted from the PDF")
     
-    points = []
     logger.info(f"Processing {len(chunks)} chunks from {pdf_path}")
     
     # Get embeddings for all chunks
@@ -208,35 +262,48 @@ def upload_pdf(pdf_path):
         logger.error(f"Failed to get embeddings: {e}")
         raise e
     
-    # Create points for Qdrant
-    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        hash_id = hashlib.md5(chunk.encode()).hexdigest()
-        points.append(PointStruct(
-            id=hash_id,
-            vector=embedding,
-            payload={
-                "text": chunk,
-                "date_uploaded": str(datetime.datetime.utcnow()),
-                "source": pdf_path,
-                "chunk_index": i
-            }
-        ))
+    # Create points for the vector store
+    uploaded_at = str(datetime.datetime.utcnow())
+    ids = [hashlib.md5(chunk.encode()).hexdigest() for chunk in chunks]
+    payloads = [
+        {
+            "text": chunk,
+            "date_uploaded": uploaded_at,
+            "source": pdf_path,
+            "chunk_index": i
+        }
+        for i, chunk in enumerate(chunks)
+    ]
     
-    # Upload to Qdrant
+    # Upload to the vector store
     try:
-        qdrant_client.upsert(collection_name=COLLECTION_NAME, points=points)
-        logger.info(f"✓ Uploaded {len(points)} chunks to Qdrant")
+        store.upsert(COLLECTION_NAME, ids, embeddings, payloads)
+        bump_corpus_version()
+        logger.info(f"✓ Uploaded {len(ids)} chunks to vector store")
     except Exception as e:
-        logger.error(f"Failed to upload to Qdrant: {e}")
+        logger.error(f"Failed to upload to vector store: {e}")
         raise e
 
-# Initialize CrossEncoder
+def clear_documents():
+    """Delete every document from the collection and recreate it empty"""
+    store = init_vector_store()
+    store.delete_collection(COLLECTION_NAME)
+    store.recreate_collection(COLLECTION_NAME, embedder.dimension if embedder else backends.EMBEDDING_DIMENSION)
+    bump_corpus_version()
+
+# Initialize the reranker (RERANKER_BACKEND=cross-encoder loads the CrossEncoder model)
 try:
-    cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-    logger.info("✓ CrossEncoder initialized")
+    reranker = backends.create_reranker()
+    if reranker:
+        logger.info(f"✓ Reranker initialized ({type(reranker).__name__})")
 except Exception as e:
-    logger.error(f"Failed to initialize CrossEncoder: {e}")
-    cross_encoder = None
+    logger.error(f"Failed to initialize reranker: {e}")
+    reranker = None
+
+def warm_up():
+    """Run the loaded reranker once so the first question doesn't pay for its lazy setup"""
+    if reranker:
+        reranker.rerank("warm up", [backends.SearchHit(0, 1.0, {"text": "warm up"})])
 
 PROMPT_TEMPLATE = """
 You are an AI Teaching Assistant. Answer the student's question based on the provided context from uploaded course materials.
@@ -261,110 +328,228 @@ Format your response with clear structure and proper spacing for readability.
 
 Answer:"""
 
-def query_ai_ta(question, threshold=0.25, top_k=8, verbose=False):
+SYSTEM_PROMPT = "You are a helpful AI teaching assistant that answers questions based on uploaded course materials."
+
+# Batch question answering
+BATCH_EMBED_SIZE = 256      # inputs per embeddings request (API limit is 2048)
+BATCH_SEARCH_SIZE = 64      # queries per Qdrant search_batch call
+BATCH_MAX_WORKERS = 4       # concurrent chat completions
+
+def answer_from_results(question, results, threshold=0.25, verbose=False, patient=False):
+    """Turn retrieved Qdrant results into a final answer (steps 3-6 of query_ai_ta).
+
+    The completion holds an LLM slot (admission.py); when none frees up in
+    time this raises admission.Overloaded, unless ``patient`` (batch work).
+    """
+    # Retrieval detail is debug output, logged for a sample of requests (log_config.py)
+    detail = detail_logger(logger) if verbose else None
+    if not results:
+        if detail:
+            detail("🔍 No results retrieved from Qdrant.")
+        return "I don't have any uploaded course materials to reference. Please upload some documents first."
+
+    # Step 3: Check cosine similarity threshold (lowered to 0.25)
+    best_score = results[0].score
+    if detail:
+        detail("Best similarity score: %.4f", best_score)
+        for i, result in enumerate(results[:3]):
+            detail("Result %d (score: %.4f): %.100s...", i + 1, result.score, result.payload['text'])
+    
+    if best_score < threshold:
+        if detail:
+            detail("⚠️ Best cosine score %.4f is below threshold (%s)", best_score, threshold)
+        return f"I couldn't find information directly related to your question in the uploaded materials. The best match had a similarity score of {best_score:.3f}. Could you try asking about specific topics from your course materials?"
+
+    # Step 4: Use multiple contexts for better coverage, reranked if configured
+    if reranker:
+        try:
+            with stage("rerank"):
+                results = reranker.rerank(question, results)
+        except Exception as e:
+            logger.error(f"Error reranking results: {e}")
+    contexts = [r.payload['text'] for r in results[:3]]  # Use top 3 results
+    combined_context = "\n\n---\n\n".join(contexts)
+    
+    # Step 5: Format the final prompt with the new template
+    prompt = PROMPT_TEMPLATE.format(
+        user_input=question,
+        retrieved_context=combined_context
+    )
+
+    if detail:
+        detail("Sending prompt to OpenAI (combined context length: %d characters)", len(combined_context))
+
+    # Step 6: Generate final response from the completion backend
+    with llm_limiter.slot(patient):
+        try:
+            with stage("generate"):
+                final_answer = completer.complete(
+                    [
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    max_tokens=1000
+                )
+            if detail:
+                detail("✓ OpenAI response generated successfully")
+            
+            return final_answer
+            
+        except Exception as e:
+            logger.error(f"Error generating OpenAI response: {e}")
+            return "I'm sorry, there was an error generating a response. Please try again."
+
+# Identical questions that arrive while one is being answered share its answer
+_question_flights = SingleFlight()
+
+def normalize_question(question):
+    """Case- and whitespace-insensitive form of a question used for coalescing"""
+    return " ".join(question.split()).casefold()
+
+def get_coalescing_stats():
+    """Counts of executed and coalesced query_ai_ta calls"""
+    return _question_flights.stats()
+
+REGISTRY.counter(
+    "tutortron_questions_total",
+    "query_ai_ta calls that ran the pipeline (executed) or joined an identical in-flight one (coalesced)",
+    ["result"],
+    callback=lambda: {("executed",): _question_flights.executed, ("coalesced",): _question_flights.coalesced}
+)
+REGISTRY.gauge(
+    "tutortron_questions_in_flight",
+    "Distinct questions currently being answered",
+    callback=_question_flights.in_flight
+)
+
+def query_ai_ta(question, threshold=0.25, top_k=8, verbose=False, search_params=None):
+    """Query the AI Teaching Assistant, coalescing identical in-flight questions.
+
+    Raises admission.Overloaded when no LLM slot frees up in time; callers
+    coalesced onto the same question share that outcome.
+    """
+    params = resolve_search_params(search_params)
+    key = (normalize_question(question), threshold, top_k, tuple(sorted(params.items())), corpus_version)
+    return _question_flights.do(key, _query_ai_ta, question, threshold, top_k, verbose, params)
+
+def _query_ai_ta(question, threshold=0.25, top_k=8, verbose=False, search_params=None):
     """Query the AI Teaching Assistant with lower threshold"""
-    logger.info(f"Processing question: {question[:100]}...")
+    detail = detail_logger(logger) if verbose else None
+    if detail:
+        detail("Processing question: %.100s...", question)
     
-    if not openai_client:
+    if not is_ai_configured():
         return "I'm sorry, the AI service is not properly configured. Please check the OpenAI API key."
     
-    # Initialize Qdrant connection
+    # Initialize vector store connection
     try:
-        qdrant_client = init_qdrant()
+        store = init_vector_store()
     except Exception as e:
-        logger.error(f"Qdrant connection failed: {e}")
+        logger.error(f"Vector store connection failed: {e}")
         return "I'm sorry, there was an error accessing the document database. Please try again."
 
     # Step 1: Embed the question
     try:
         query_embedding = get_embedding(question)
-        if verbose:
-            logger.info("✓ Question embedded successfully")
+        if detail:
+            detail("✓ Question embedded successfully")
     except Exception as e:
         logger.error(f"Failed to embed question: {e}")
         return "I'm sorry, there was an error processing your question. Please try again."
 
-    # Step 2: Retrieve top_k docs from Qdrant using cosine similarity
+    # Step 2: Retrieve top_k docs from the vector store using cosine similarity
     try:
-        results = qdrant_client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_embedding,
-            limit=top_k,
-            with_payload=True
-        )
-        if verbose:
-            logger.info(f"Retrieved {len(results)} results from Qdrant")
+        with stage("search"):
+            results = store.search(COLLECTION_NAME, query_embedding, top_k, search_params)
+        if detail:
+            detail("Retrieved %d results from vector store", len(results))
     except Exception as e:
         logger.error(f"Error searching Qdrant: {e}")
         return "I'm sorry, there was an error accessing the document database. Please try again."
 
-    if not results:
-        if verbose:
-            logger.info("🔍 No results retrieved from Qdrant.")
-        return "I don't have any uploaded course materials to reference. Please upload some documents first."
+    return answer_from_results(question, results, threshold=threshold, verbose=verbose)
 
-    # Step 3: Check cosine similarity threshold (lowered to 0.25)
-    best_score = results[0].score
-    if verbose:
-        logger.info(f"Best similarity score: {best_score:.4f}")
-        for i, result in enumerate(results[:3]):
-            logger.info(f"Result {i+1} (score: {result.score:.4f}): {result.payload['text'][:100]}...")
-    
-    if best_score < threshold:
-        if verbose:
-            logger.info(f"⚠️ Best cosine score {best_score:.4f} is below threshold ({threshold})")
-        return f"I couldn't find information directly related to your question in the uploaded materials. The best match had a similarity score of {best_score:.3f}. Could you try asking about specific topics from your course materials?"
+def query_ai_ta_batch(questions, threshold=0.25, top_k=8, max_workers=BATCH_MAX_WORKERS, search_params=None):
+    """Answer many questions at once, yielding results as they finish.
 
-    # Step 4: Use multiple contexts for better coverage
-    contexts = [r.payload['text'] for r in results[:3]]  # Use top 3 results
-    combined_context = "\n\n---\n\n".join(contexts)
-    
-    # Step 5: Format the final prompt with the new template
-    prompt = PROMPT_TEMPLATE.format(
-        user_input=question,
-        retrieved_context=combined_context
-    )
+    Questions are embedded in a few batched requests and retrieved with
+    Qdrant ``search_batch``; only the chat completions run per question,
+    at most ``max_workers`` at a time; they share the LLM slots with chat
+    requests but wait for one rather than being turned away. Each yielded
+    dict carries the question's ``index`` in the input list, since results
+    arrive out of order.
+    """
+    questions = list(questions)
+    search_params = resolve_search_params(search_params)
+    logger.info("Processing batch of %d questions", len(questions))
+
+    def failed(message):
+        for index, question in enumerate(questions):
+            yield {"index": index, "question": question, "answer": message}
 
-    if verbose:
-        logger.info("Sending prompt to OpenAI...")
-        logger.info(f"Combined context length: {len(combined_context)} characters")
+    if not questions:
+        return
+
+    if not is_ai_configured():
+        yield from failed("I'm sorry, the AI service is not properly configured. Please check the OpenAI API key.")
+        return
 
-    # Step 6: Generate final response from OpenAI
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful AI teaching assistant that answers questions based on uploaded course materials."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1000
-        )
-        
-        final_answer = response.choices[0].message.content
-        if verbose:
-            logger.info("✓ OpenAI response generated successfully")
-        
-        return final_answer
-        
+        store = init_vector_store()
+    except Exception as e:
+        logger.error(f"Vector store connection failed: {e}")
+        yield from failed("I'm sorry, there was an error accessing the document database. Please try again.")
+        return
+
+    # Step 1: Embed all questions in as few requests as possible
+    try:
+        embeddings = get_embeddings_batch(questions, batch_size=BATCH_EMBED_SIZE)
     except Exception as e:
-        logger.error(f"Error generating OpenAI response: {e}")
-        return "I'm sorry, there was an error generating a response. Please try again."
+        logger.error(f"Failed to embed batch: {e}")
+        yield from failed("I'm sorry, there was an error processing your question. Please try again.")
+        return
+
+    # Step 2: Retrieve for every question with multi-query searches
+    try:
+        all_results = []
+        for i in range(0, len(embeddings), BATCH_SEARCH_SIZE):
+            with stage("search"):
+                all_results.extend(store.search_batch(
+                    COLLECTION_NAME, embeddings[i:i + BATCH_SEARCH_SIZE], top_k, search_params
+                ))
+        logger.info("Retrieved results for %d questions from vector store", len(all_results))
+    except Exception as e:
+        logger.error(f"Error searching Qdrant: {e}")
+        yield from failed("I'm sorry, there was an error accessing the document database. Please try again.")
+        return
+
+    # Steps 3-6: Generate answers with bounded concurrency
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {
+            # Each completion logs with the request's id (contextvars don't follow threads on their own)
+            executor.submit(contextvars.copy_context().run, answer_from_results, question, results, threshold,
+                            patient=True): index
+            for index, (question, results) in enumerate(zip(questions, all_results))
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            yield {"index": index, "question": questions[index], "answer": future.result()}
+    finally:
+        # Stop queued completions if the consumer goes away (e.g. client disconnect)
+        executor.shutdown(wait=False, cancel_futures=True)
 
 def inspect_documents():
     """Inspect what documents are in the database"""
     try:
-        qdrant_client = init_qdrant()
+        store = init_vector_store()
         
         # Get some sample documents
-        results = qdrant_client.scroll(
-            collection_name=COLLECTION_NAME,
-            limit=5,
-            with_payload=True
-        )
+        points = store.scroll(COLLECTION_NAME, limit=5)
         
-        print(f"\n📄 Found {len(results[0])} sample documents:")
-        for i, point in enumerate(results[0]):
+        print(f"\n📄 Found {len(points)} sample documents:")
+        for i, point in enumerate(points):
             text = point.payload.get('text', '')
             source = point.payload.get('source', 'unknown')
             print(f"\nDocument {i+1} (from {source}):")
@@ -379,22 +564,19 @@ def test_system():
     logger.info("Testing RAG system...")
     
     try:
-        # Test OpenAI connection
-        if openai_client:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": "Hello"}],
-                max_tokens=10
-            )
-            logger.info("✓ OpenAI connection working")
+        # Test model backends
+        if is_ai_configured():
+            embedder.embed(["Hello"])
+            completer.complete([{"role": "user", "content": "Hello"}], max_tokens=10)
+            logger.info("✓ Model backends working")
         else:
-            logger.error("❌ OpenAI client not initialized")
+            logger.error("❌ Model backends not initialized")
             return False
         
-        # Test Qdrant connection
-        qdrant_client = init_qdrant()
-        collections = qdrant_client.get_collections()
-        logger.info("✓ Qdrant connection working")
+        # Test vector store connection
+        store = init_vector_store()
+        store.list_collections()
+        logger.info("✓ Vector store connection working")
         
         return True
         
@@ -403,4 +585,5 @@ def test_system():
         return False
 
 if __name__ == "__main__":
+    configure_logging()
     test_system()
\ No newline at end of file
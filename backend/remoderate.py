@@ -0,0 +1,196 @@
+# backend/remoderate.py - Re-check stored messages against the current moderation rules
+"""
+Messages are moderated once, when they are sent, so changing
+moderation_rules.json leaves is_flagged/flag_reason on older messages as
+the old rules decided. This job re-scans every user message: batches are
+read in rowid order (shard by shard), checked across a process pool, and
+the flags that changed are written back one batch per transaction. Chats
+that gain a flagged message are flagged as the message routes do it.
+
+Flags set by an admin are never touched. Automatic flags the new rules no
+longer raise are kept unless --unflag is given; with it, such messages are
+cleared, and so are chats flagged only because they held one.
+
+The position is saved to a checkpoint file after every batch, so an
+interrupted run continues where it stopped (a changed rules file starts
+over). --rate caps messages per second, and each write transaction is
+short, so the job can run next to live traffic. Messages of archived chats
+are re-checked once the chats are restored. Don't VACUUM mid-run: it can
+renumber rowids.
+
+A running app caches chat transcripts per process (chat_cache.py), so it
+shows the new flags after CHAT_CACHE_TTL_SECONDS or a restart.
+
+    python remoderate.py --dry-run                    # count what would change
+    python remoderate.py --workers 4 --rate 5000
+    python remoderate.py --unflag                     # also clear flags the rules no longer raise
+    python remoderate.py --restart                    # ignore the checkpoint
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import moderation
+
+_engine = None
+
+
+def _init_worker(rules):
+    global _engine
+    _engine = moderation.ModerationEngine(rules)
+
+
+def _check_batch(contents):
+    """(is_flagged, reason) for each message; runs in a pool worker"""
+    return [_engine.check(content) for content in contents]
+
+
+def rules_fingerprint(rules):
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def changes_for(rows, results, unflag=False):
+    """The (message_id, chat_id, is_flagged, flag_reason) updates a checked batch calls for"""
+    changes = []
+    for (_, message_id, chat_id, _, was_flagged, old_reason), (flagged, reason) in zip(rows, results):
+        if was_flagged and not moderation.is_automatic_reason(old_reason):
+            continue  # an admin's decision
+        if flagged:
+            if not was_flagged or reason != old_reason:
+                changes.append((message_id, chat_id, True, reason))
+        elif was_flagged and unflag:
+            changes.append((message_id, chat_id, False, None))
+    return changes
+
+
+def load_checkpoint(path, fingerprint):
+    """Saved rowid per database file, or {} when missing or made under other rules"""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get("rules") != fingerprint:
+        print(f"⚠️  Rules changed since checkpoint {path} was written; starting over")
+        return {}
+    return state.get("positions", {})
+
+
+def save_checkpoint(path, fingerprint, positions):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"rules": fingerprint, "positions": positions}, f)
+    os.replace(tmp, path)
+
+
+def remoderate(storage, rules, checkpoint=None, workers=os.cpu_count(), batch_size=500,
+               rate=0, unflag=False, dry_run=False, progress=None):
+    """Re-check every user message in ``storage`` under ``rules``; returns totals.
+
+    ``checkpoint`` is a file recording how far each shard got. ``rate`` caps
+    messages checked per second (0: no limit). ``progress(totals)`` is
+    called after each batch.
+    """
+    fingerprint = rules_fingerprint(rules)
+    positions = load_checkpoint(checkpoint, fingerprint) if checkpoint else {}
+    totals = {"checked": 0, "messages": 0, "chats_flagged": 0, "chats_unflagged": 0}
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(rules,)) if workers > 0 else None
+    if pool is None:
+        _init_worker(rules)
+    start = time.monotonic()
+
+    def finish(shard, rows, results):
+        changes = changes_for(rows, results, unflag)
+        if dry_run:
+            totals["messages"] += len(changes)
+        else:
+            for name, value in shard.apply_moderation(changes, unflag_chats=unflag).items():
+                totals[name] += value
+        totals["checked"] += len(rows)
+        positions[shard.db_path] = rows[-1][0]
+        if checkpoint and not dry_run:
+            save_checkpoint(checkpoint, fingerprint, positions)
+        if progress:
+            progress(totals)
+        if rate:
+            # Pace against the whole run so short stalls are made up, not doubled
+            ahead = totals["checked"] / rate - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    try:
+        for shard in storage.shards:
+            # A few batches in flight keep every worker busy while results are written in order
+            pending = deque()
+            for rows in shard.iter_moderation_batches(positions.get(shard.db_path, 0), batch_size):
+                contents = [row[3] for row in rows]
+                if pool is None:
+                    finish(shard, rows, _check_batch(contents))
+                    continue
+                pending.append((rows, pool.submit(_check_batch, contents)))
+                if len(pending) > workers * 2:
+                    done_rows, future = pending.popleft()
+                    finish(shard, done_rows, future.result())
+            while pending:
+                done_rows, future = pending.popleft()
+                finish(shard, done_rows, future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    totals["seconds"] = round(time.monotonic() - start, 2)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-check stored messages against the current moderation rules")
+    parser.add_argument("--db", default=os.getenv("CHAT_DB_PATH", "chats.db"), help="Chat database path")
+    parser.add_argument("--rules", default=moderation.RULES_PATH, help="Moderation rules file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Checker processes (0: in this process)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Messages per batch and write transaction")
+    parser.add_argument("--rate", type=float, default=5000, help="Max messages per second (0: unthrottled)")
+    parser.add_argument("--unflag", action="store_true", help="Clear automatic flags the rules no longer raise")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the messages that would change")
+    parser.add_argument("--checkpoint", default=None, help="Resume file (default <db>.remoderate.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the beginning")
+    args = parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+    # The storage module opens CHAT_DB_PATH on import
+    os.environ["CHAT_DB_PATH"] = args.db
+    from chat_storage import chat_storage
+
+    checkpoint = args.checkpoint or args.db + ".remoderate.json"
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    rules = moderation.load_rules(args.rules)
+    print(f"🔍 Re-moderating {args.db} with {moderation.ModerationEngine(rules).rule_count} keywords "
+          f"({args.workers} workers, {args.rate:g} msgs/s{', dry run' if args.dry_run else ''})")
+
+    last = [0.0]
+
+    def progress(totals):
+        if time.monotonic() - last[0] >= 5:
+            last[0] = time.monotonic()
+            print(f"   {totals['checked']} checked, {totals['messages']} changed")
+
+    totals = remoderate(chat_storage, rules, None if args.dry_run else checkpoint, args.workers,
+                        args.batch_size, args.rate, args.unflag, args.dry_run, progress)
+    verb = "would change" if args.dry_run else "changed"
+    print(f"✓ Checked {totals['checked']} messages in {totals['seconds']}s: {totals['messages']} {verb}, "
+          f"{totals['chats_flagged']} chats flagged, {totals['chats_unflagged']} unflagged")
+    if not args.dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)  # finished: the next run starts from the beginning
+    chat_storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
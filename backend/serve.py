@@ -0,0 +1,132 @@
+# backend/serve.py - Production server: gunicorn workers forked from a preloaded app
+"""
+Runs the API under gunicorn instead of Flask's development server
+(``python app.py``). The app is imported once in the master process, so
+models loaded at import (the cross-encoder reranker) are shared
+copy-on-write by every worker instead of being loaded per worker. What
+holds a socket or file lock is per worker: os.register_at_fork hooks in
+chat_storage.py and rag.py give each worker its own database connections
+and upstream clients. The chat response cache coordinates its
+invalidations between workers through shared memory (chat_cache.py).
+
+Workers are gthread workers. Most request time is spent waiting on OpenAI
+and Qdrant, so each worker serves WEB_THREADS requests at once, and
+WEB_WORKERS processes spread the Python work (moderation, JSON, SQLite)
+over cores.
+
+    WEB_BIND [0.0.0.0:5001]     WEB_WORKERS [CPU count]    WEB_THREADS [32]
+    WEB_TIMEOUT [120]           WEB_GRACEFUL_TIMEOUT [30]  WEB_KEEPALIVE [5]
+    WEB_MAX_REQUESTS [0 = never recycle workers]          WEB_BACKLOG [2048]
+
+Timeouts are in seconds; WEB_TIMEOUT must cover the slowest completion.
+Each worker keeps its own /metrics, so a scrape reports the worker that
+answered it.
+
+    python serve.py
+    python serve.py --workers 4 --threads 64 --bind 127.0.0.1:5001
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("serve")
+
+
+def server_options(args):
+    """gunicorn settings for ``args`` (see main for the command-line options)"""
+    max_requests = int(os.getenv("WEB_MAX_REQUESTS", 0))
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "preload_app": True,
+        "timeout": int(os.getenv("WEB_TIMEOUT", 120)),
+        "graceful_timeout": int(os.getenv("WEB_GRACEFUL_TIMEOUT", 30)),
+        "keepalive": int(os.getenv("WEB_KEEPALIVE", 5)),
+        "backlog": int(os.getenv("WEB_BACKLOG", 2048)),
+        "max_requests": max_requests,
+        # Spread recycling out so workers don't all restart at once
+        "max_requests_jitter": max_requests // 10,
+        "accesslog": os.getenv("WEB_ACCESS_LOG") or None,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }
+
+
+def when_ready(server):
+    """In the master, after the app is loaded and before the first worker is forked"""
+    from chat_storage import chat_storage
+
+    # The master never serves requests: close its connections so workers
+    # don't inherit them, and move the loaded objects out of the garbage
+    # collector's reach so collections in workers don't copy their pages
+    chat_storage.close()
+    gc.collect()
+    gc.freeze()
+    logger.info(f"✓ App preloaded; starting {server.cfg.workers} workers x {server.cfg.threads} threads "
+                f"on {', '.join(server.cfg.bind)}")
+
+
+def post_fork(server, worker):
+    # Each worker warms up and checks its own dependencies for /readyz
+    from health import health_monitor
+    health_monitor.start()
+    logger.info(f"✓ Worker {worker.pid} started")
+
+
+def worker_exit(server, worker):
+    # Commit write-behind messages before the worker goes away
+    from chat_storage import chat_storage, WRITE_SHUTDOWN_TIMEOUT
+    chat_storage.flush(WRITE_SHUTDOWN_TIMEOUT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with gunicorn")
+    parser.add_argument("--bind", default=os.getenv("WEB_BIND", "0.0.0.0:5001"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", 32)))
+    args = parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+
+    if args.workers > 1:
+        # Native thread pools (torch, numpy) would otherwise each use every core;
+        # set before the app imports them
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ gunicorn is not installed (pip install -r requirements.txt)")
+        return 1
+
+    class Server(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # With preload_app this runs once, in the master
+            from app import create_app, check_environment
+            import moderation
+            check_environment()
+            moderation.get_engine()  # compile the rules once, for every worker
+            return create_app()
+
+    Server(server_options(args)).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+# backend/tests/conftest.py - Shared pytest setup: offline backends and throwaway databases
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Backend modules read their configuration on import, so set it first.
+# The module-level chat_storage gets a database of its own, never chats.db
+os.environ["CHAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="tutortron-tests-"), "chats.db")
+os.environ["CHAT_WRITE_BEHIND"] = "0"
+os.environ["CHAT_DB_SHARDS"] = "1"
+os.environ.setdefault("EMBEDDING_BACKEND", "hash")
+os.environ.setdefault("COMPLETION_BACKEND", "canned")
+os.environ.setdefault("VECTOR_STORE_BACKEND", "memory")
+
+from chat_storage import ChatStorage, ShardedChatStorage  # noqa: E402
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """A fresh single-file ChatStorage with synchronous writes"""
+    store = ChatStorage(str(tmp_path / "chats.db"), write_behind=False)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def sharded_storage(tmp_path):
+    """A fresh ChatStorage split over three shards"""
+    store = ShardedChatStorage(str(tmp_path / "chats.db"), shards=3, write_behind=False)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def make_chat():
+    """make_chat(storage, user_id, messages=0) creates the user and a chat with that many messages"""
+    def make(store, user_id, messages=0, title="Chat"):
+        store.create_or_update_user(user_id, user_id.title(), f"{user_id}@example.edu")
+        chat_id = store.create_chat(user_id, title)
+        for i in range(messages):
+            store.add_message(chat_id, "user" if i % 2 == 0 else "assistant", f"message {i}")
+        return chat_id
+    return make
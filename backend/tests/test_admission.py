@@ -0,0 +1,185 @@
+# backend/tests/test_admission.py - Per-user token buckets and the FIFO LLM limiter
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+from admission import ConcurrencyLimiter, Overloaded, RateLimited, TokenBuckets
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # Only the buckets' view of time; the limiter tests need real threads and waits
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+# ===== TOKEN BUCKETS =====
+
+def test_burst_then_rate_limited(clock):
+    buckets = TokenBuckets(rate=1.0, burst=3)
+    for _ in range(3):
+        buckets.take("alice")
+    with pytest.raises(RateLimited) as excinfo:
+        buckets.take("alice")
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == pytest.approx(1.0)
+    assert excinfo.value.retry_after_header == "1"
+    # Other users have buckets of their own
+    buckets.take("bob")
+
+
+def test_tokens_refill_over_time_up_to_the_burst(clock):
+    buckets = TokenBuckets(rate=0.5, burst=2)
+    buckets.take("alice", 2)
+    clock.now += 1.0  # half a token
+    with pytest.raises(RateLimited) as excinfo:
+        buckets.take("alice")
+    assert excinfo.value.retry_after == pytest.approx(1.0)
+    clock.now += 1.0
+    buckets.take("alice")
+
+    clock.now += 3600
+    buckets.take("alice", 2)
+    with pytest.raises(RateLimited):
+        buckets.take("alice")
+
+
+def test_refund_gives_back_a_token(clock):
+    buckets = TokenBuckets(rate=0.01, burst=1)
+    buckets.take("alice")
+    buckets.refund("alice")
+    buckets.take("alice")
+    # Refunds never exceed the burst, and unknown keys are ignored
+    buckets.refund("alice", 5)
+    buckets.refund("nobody")
+    buckets.take("alice")
+    with pytest.raises(RateLimited):
+        buckets.take("alice")
+
+
+def test_least_recent_users_are_forgotten(clock):
+    buckets = TokenBuckets(rate=0.01, burst=1, max_keys=2)
+    for user in ("alice", "bob", "carol"):
+        buckets.take(user)
+    # alice's empty bucket was dropped, so she starts again with a full one
+    buckets.take("alice")
+    with pytest.raises(RateLimited):
+        buckets.take("carol")
+
+
+def test_zero_rate_disables_the_limit():
+    buckets = TokenBuckets(rate=0, burst=1)
+    for _ in range(10):
+        buckets.take("alice")
+
+
+# ===== CONCURRENCY LIMITER =====
+
+def _queue_up(limiter, name, order, patient=False):
+    """Start a thread that takes a slot, records ``name`` and releases it when told"""
+    release = threading.Event()
+
+    def run():
+        try:
+            limiter.acquire(patient)
+        except Overloaded as e:
+            order.append((name, e.reason))
+            return
+        order.append(name)
+        release.wait(5)
+        limiter.release()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, release
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_slots_pass_to_waiters_in_arrival_order():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=3, max_wait=5)
+    order = []
+    threads = []
+    for name in ("first", "second", "third", "fourth"):
+        threads.append(_queue_up(limiter, name, order))
+        _wait_for(lambda: len(order) == 1 and limiter.queue_depth() == len(threads) - 1)
+    for expected in ("first", "second", "third", "fourth"):
+        _wait_for(lambda: order and order[-1] == expected)
+        assert limiter.in_flight == 1
+        threads[len(order) - 1][1].set()
+    for thread, _ in threads:
+        thread.join()
+    assert limiter.in_flight == 0 and limiter.queue_depth() == 0
+
+
+def test_full_queue_is_shed_at_once():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=1, max_wait=5)
+    limiter.acquire()
+    order = []
+    waiter, release = _queue_up(limiter, "waiter", order)
+    _wait_for(lambda: limiter.queue_depth() == 1)
+
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.check()
+    assert excinfo.value.reason == "queue_full" and excinfo.value.status == 503
+    start = time.monotonic()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.5
+
+    limiter.release()
+    _wait_for(lambda: order == ["waiter"])
+    release.set()
+    waiter.join()
+    assert limiter.in_flight == 0
+
+
+def test_waiting_too_long_is_shed():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=5, max_wait=0.05)
+    limiter.acquire()
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.reason == "queue_timeout"
+    assert limiter.queue_depth() == 0
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+def test_patient_callers_wait_past_a_full_queue():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=0, max_wait=0.01)
+    limiter.acquire()
+    order = []
+    patient, release = _queue_up(limiter, "patient", order, patient=True)
+    _wait_for(lambda: limiter.queue_depth() == 1)
+    time.sleep(0.05)  # longer than max_wait
+    assert order == []
+    limiter.release()
+    _wait_for(lambda: order == ["patient"])
+    release.set()
+    patient.join()
+
+
+def test_slot_is_released_on_error():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=0, max_wait=1)
+    with pytest.raises(RuntimeError):
+        with limiter.slot():
+            assert limiter.in_flight == 1
+            raise RuntimeError("completion failed")
+    assert limiter.in_flight == 0
@@ -0,0 +1,21 @@
+# backend/tests/test_app.py - Request validation in the API routes
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def client():
+    return create_app({'TESTING': True}).test_client()
+
+
+@pytest.mark.parametrize("concurrency", ["x", None, [2], {}])
+def test_batch_rejects_bad_concurrency(client, concurrency):
+    response = client.post('/chat/batch', json={'questions': ['What is mitosis?'], 'concurrency': concurrency})
+    assert response.status_code == 400
+    assert 'Concurrency' in response.get_json()['error']
+
+
+def test_batch_rejects_empty_questions(client):
+    assert client.post('/chat/batch', json={'questions': []}).status_code == 400
+    assert client.post('/chat/batch', json={'questions': ['  ']}).status_code == 400
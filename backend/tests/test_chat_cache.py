@@ -0,0 +1,136 @@
+# backend/tests/test_chat_cache.py - Response cache invalidation and ETag revalidation
+import pytest
+
+from chat_cache import ChatCache, TagVersions, make_etag
+from chat_storage import ChatStorage
+
+
+@pytest.fixture
+def cache():
+    return ChatCache(max_bytes=1024 * 1024, versions=TagVersions(slots=1024))
+
+
+def _put_transcript(cache, chat_id, user_id, body=b'{"chat":1}'):
+    return cache.put(('chat', chat_id), body, cache.token(), chat_id=chat_id, user_id=user_id)
+
+
+def _put_list(cache, user_id, chat_ids, body=b'{"chats":[]}'):
+    return cache.put(('chats', user_id), body, cache.token(), user_id=user_id, chat_ids=chat_ids)
+
+
+def test_hit_returns_body_and_etag(cache):
+    etag = _put_transcript(cache, 'c1', 'alice')
+    assert etag == make_etag(b'{"chat":1}')
+    assert cache.get('chat_transcripts', ('chat', 'c1')) == (b'{"chat":1}', etag)
+
+
+def test_chat_change_drops_its_transcript_and_owners_lists(cache):
+    _put_transcript(cache, 'c1', 'alice')
+    _put_transcript(cache, 'c2', 'alice')
+    _put_list(cache, 'alice', ['c1', 'c2'])
+    _put_list(cache, 'bob', ['c3'])
+
+    cache.invalidate('c1', 'alice')
+    assert cache.get('chat_transcripts', ('chat', 'c1')) is None
+    assert cache.get('chat_lists', ('chats', 'alice')) is None
+    assert cache.get('chat_transcripts', ('chat', 'c2')) is not None
+    assert cache.get('chat_lists', ('chats', 'bob')) is not None
+
+
+def test_owner_is_learned_from_cached_lists(cache):
+    _put_list(cache, 'alice', ['c1'])
+    _put_list(cache, 'bob', ['c2'])
+    # Storage often knows only the chat (e.g. flag_chat); the list told us its owner
+    cache.invalidate('c1')
+    assert cache.get('chat_lists', ('chats', 'alice')) is None
+    assert cache.get('chat_lists', ('chats', 'bob')) is not None
+
+
+def test_unknown_owner_drops_every_list(cache):
+    _put_list(cache, 'alice', ['c1'])
+    _put_list(cache, 'bob', ['c2'])
+    cache.invalidate('c9')
+    assert cache.get('chat_lists', ('chats', 'alice')) is None
+    assert cache.get('chat_lists', ('chats', 'bob')) is None
+
+
+def test_load_overlapping_an_invalidation_is_not_stored(cache):
+    token = cache.token()
+    cache.invalidate('c1', 'alice')  # a write lands while the read is loading
+    cache.put(('chat', 'c1'), b'stale', token, chat_id='c1', user_id='alice')
+    assert cache.get('chat_transcripts', ('chat', 'c1')) is None
+
+
+def test_other_processes_invalidations_are_seen(cache):
+    # Another worker shares the versions but not the entries
+    other = ChatCache(max_bytes=cache.max_bytes, versions=cache.versions)
+    _put_transcript(cache, 'c1', 'alice')
+    other.invalidate('c1', 'alice')
+    assert cache.get('chat_transcripts', ('chat', 'c1')) is None
+
+
+def test_size_is_bounded(cache):
+    for i in range(100):
+        cache.put(('chat', f'c{i}'), b'x' * 60000, cache.token(), chat_id=f'c{i}', user_id='alice')
+    assert cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.get('chat_transcripts', ('chat', 'c99')) is not None
+    assert cache.get('chat_transcripts', ('chat', 'c0')) is None
+
+
+# ===== HTTP =====
+
+@pytest.fixture
+def client():
+    from app import create_app, chat_storage, chat_cache
+    chat_cache.invalidate()
+    chat_storage.create_or_update_user('alice', 'Alice', 'alice@example.edu')
+    client = create_app({'TESTING': True}).test_client()
+    client.chat_id = chat_storage.create_chat('alice', 'Cached chat')
+    return client
+
+
+def test_unchanged_chat_is_answered_with_304(client):
+    first = client.get(f'/api/chats/{client.chat_id}?userId=alice')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = client.get(f'/api/chats/{client.chat_id}?userId=alice',
+                       headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert again.data == b''
+
+
+def test_new_message_changes_the_etag(client):
+    url = f'/api/chats/{client.chat_id}?userId=alice'
+    first = client.get(url)
+    lists = client.get('/api/chats?userId=alice')
+    posted = client.post(f'/api/chats/{client.chat_id}/messages',
+                         json={'role': 'user', 'content': 'hello', 'userId': 'alice'})
+    assert posted.status_code == 200
+
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert changed.get_json()['chat']['messages'][-1]['content'] == 'hello'
+    relisted = client.get('/api/chats?userId=alice', headers={'If-None-Match': lists.headers['ETag']})
+    assert relisted.status_code == 200
+
+
+def test_list_read_while_messages_are_queued_is_not_kept(tmp_path, cache, make_chat):
+    storage = ChatStorage(str(tmp_path / "queued.db"), write_behind=True)
+    storage.add_change_listener(cache.invalidate)
+    chat_id = make_chat(storage, 'alice')
+    key = ('chats', 'alice')
+
+    # Hold the writer off so the list is read while the message is still queued
+    with storage._write_lock:
+        storage.add_message(chat_id, 'user', 'hello')
+        token = cache.token()
+        chats = storage.get_user_chats('alice')
+        assert chats[0]['message_count'] == 0
+        cache.put(key, repr(chats).encode(), token, user_id='alice', chat_ids=[chat_id])
+        assert cache.get('chat_lists', key) is not None
+    assert storage.flush(5)
+
+    assert cache.get('chat_lists', key) is None
+    assert storage.get_user_chats('alice')[0]['message_count'] == 1
+    storage.close()
@@ -0,0 +1,36 @@
+# backend/tests/test_chat_export.py - NDJSON export and import files
+import builtins
+
+import pytest
+
+import chat_export
+from chat_storage import ChatStorage
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Every file chat_export opens itself, to check they all get closed"""
+    files = []
+
+    def tracking_open(*args, **kwargs):
+        f = builtins.open(*args, **kwargs)
+        files.append(f)
+        return f
+
+    monkeypatch.setattr(chat_export, "open", tracking_open, raising=False)
+    return files
+
+
+@pytest.mark.parametrize("name", ["chats.ndjson", "chats.ndjson.gz"])
+def test_export_import_round_trip_closes_its_files(tmp_path, storage, make_chat, opened, name):
+    chat_id = make_chat(storage, "alice", messages=3)
+    path = str(tmp_path / name)
+    assert chat_export.export_to_file(storage, path) == 2  # the user and the chat
+
+    copy = ChatStorage(str(tmp_path / "copy.db"), write_behind=False)
+    try:
+        assert chat_export.import_from_file(copy, path) == {"users": 1, "chats": 1, "messages": 3}
+        assert len(copy.get_chat_with_messages(chat_id)["messages"]) == 3
+    finally:
+        copy.close()
+    assert opened and all(f.closed for f in opened)
@@ -0,0 +1,473 @@
+# backend/tests/test_chat_storage.py - ChatStorage behaviour against a real SQLite file
+import threading
+
+import pytest
+
+from chat_storage import ChatStorage
+
+
+# ===== CONNECTION POOL =====
+
+def test_database_uses_wal(storage):
+    with storage._connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_connections_are_reused(storage):
+    with storage._connection() as conn:
+        first = conn
+    with storage._connection() as conn:
+        assert conn is first
+    assert storage._open_connections == 1
+
+
+def test_failed_transaction_rolls_back(storage, make_chat):
+    chat_id = make_chat(storage, 'alice')
+    with pytest.raises(RuntimeError):
+        with storage._connection(write=True) as conn:
+            conn.execute('UPDATE chats SET title = ? WHERE id = ?', ('Changed', chat_id))
+            raise RuntimeError('abort')
+    assert storage.get_chat_with_messages(chat_id)['title'] == 'Chat'
+
+
+def test_concurrent_writers_all_commit(storage, make_chat):
+    chat_id = make_chat(storage, 'alice')
+
+    def write(n):
+        for i in range(20):
+            storage.add_message(chat_id, 'user', f'thread {n} message {i}')
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(storage.get_chat_with_messages(chat_id)['messages']) == 160
+    assert storage._open_connections <= storage.pool_size
+
+
+# ===== CHAT COUNTERS =====
+
+def _chat_row(storage, chat_id):
+    with storage._connection() as conn:
+        return dict(conn.execute(
+            'SELECT message_count, flagged_message_count, last_message_at FROM chats WHERE id = ?',
+            (chat_id,)).fetchone())
+
+
+def _recounted(storage, chat_id):
+    with storage._connection() as conn:
+        return dict(conn.execute('''
+            SELECT COUNT(*) AS message_count,
+                   COALESCE(SUM(is_flagged = TRUE), 0) AS flagged_message_count,
+                   MAX(timestamp) AS last_message_at
+            FROM messages WHERE chat_id = ?
+        ''', (chat_id,)).fetchone())
+
+
+def test_counters_follow_added_messages(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=3)
+    storage.add_message(chat_id, 'user', 'flagged', is_flagged=True, flag_reason='test')
+    assert _chat_row(storage, chat_id) == _recounted(storage, chat_id)
+    assert _chat_row(storage, chat_id)['message_count'] == 4
+    assert _chat_row(storage, chat_id)['flagged_message_count'] == 1
+    assert storage.get_user_chats('alice')[0]['message_count'] == 4
+
+
+def test_counters_follow_flagging(storage, make_chat):
+    chat_id = make_chat(storage, 'alice')
+    message_id = storage.add_message(chat_id, 'user', 'hello')
+    assert storage.flag_message(message_id, 'review')
+    assert _chat_row(storage, chat_id)['flagged_message_count'] == 1
+    # Flagging twice counts once
+    assert storage.flag_message(message_id, 'review again')
+    assert _chat_row(storage, chat_id)['flagged_message_count'] == 1
+    with storage._connection(write=True) as conn:
+        conn.execute('UPDATE messages SET is_flagged = FALSE WHERE id = ?', (message_id,))
+    assert _chat_row(storage, chat_id) == _recounted(storage, chat_id)
+
+
+def test_counters_follow_deleted_messages(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=3)
+    storage.add_message(chat_id, 'user', 'flagged', is_flagged=True, flag_reason='test')
+    with storage._connection(write=True) as conn:
+        conn.execute('DELETE FROM messages WHERE chat_id = ? AND is_flagged', (chat_id,))
+        conn.execute("DELETE FROM messages WHERE chat_id = ? AND content = 'message 0'", (chat_id,))
+    assert _chat_row(storage, chat_id) == _recounted(storage, chat_id)
+    assert _chat_row(storage, chat_id)['message_count'] == 2
+
+
+# ===== KEYSET PAGING =====
+
+def _all_pages(fetch, limit):
+    seen, cursor = [], None
+    while True:
+        page = fetch(limit, cursor)
+        seen.extend(chat['id'] for chat in page['chats'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return seen
+
+
+def _spread_updated_at(storage, chat_ids):
+    # Half the chats share a second, so the id has to break ties
+    with storage._connection(write=True) as conn:
+        for i, chat_id in enumerate(chat_ids):
+            conn.execute("UPDATE chats SET updated_at = datetime('2026-01-01', ?) WHERE id = ?",
+                         (f'+{i // 2} seconds', chat_id))
+
+
+def test_user_chat_pages_have_no_gaps_or_duplicates(storage, make_chat):
+    chat_ids = [make_chat(storage, 'alice') for _ in range(23)]
+    make_chat(storage, 'bob')
+    _spread_updated_at(storage, chat_ids)
+
+    paged = _all_pages(lambda limit, cursor: storage.get_user_chats_page('alice', limit, cursor), 5)
+    assert paged == [chat['id'] for chat in storage.get_user_chats('alice', limit=100)]
+    assert sorted(paged) == sorted(chat_ids)
+
+
+def test_admin_chat_pages_have_no_gaps_or_duplicates(storage, make_chat):
+    chat_ids = [make_chat(storage, user) for user in ('alice', 'bob', 'carol') * 6]
+    _spread_updated_at(storage, chat_ids)
+
+    paged = _all_pages(storage.get_admin_chats_page, 4)
+    assert paged == [chat['id'] for chat in storage.get_all_chats_for_admin(limit=100)]
+    assert sorted(paged) == sorted(chat_ids)
+
+
+def test_pages_are_stable_while_chats_are_added(storage, make_chat):
+    chat_ids = [make_chat(storage, 'alice') for _ in range(10)]
+    _spread_updated_at(storage, chat_ids)
+
+    before = [chat['id'] for chat in storage.get_user_chats('alice')]
+    first = storage.get_user_chats_page('alice', 4)
+    make_chat(storage, 'alice')  # newest, so it belongs before the first page
+    rest = _all_pages(lambda limit, cursor: storage.get_user_chats_page('alice', limit, cursor or first['next_cursor']), 4)
+    assert [chat['id'] for chat in first['chats']] + rest == before
+
+
+def test_invalid_cursor_is_rejected(storage):
+    with pytest.raises(ValueError):
+        storage.get_user_chats_page('alice', 10, 'not-a-cursor')
+
+
+# ===== MESSAGE PAGING =====
+
+def _older_pages(storage, chat_id, limit):
+    """Every message, newest page first, each page oldest first"""
+    pages, cursor = [], None
+    while True:
+        page = storage.get_chat_messages_page(chat_id, limit=limit, before=cursor)
+        pages.append([m['content'] for m in page['messages']])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_message_pages_walk_back_without_gaps_or_duplicates(storage, make_chat):
+    # Written within a second or two, so the rowid breaks timestamp ties
+    chat_id = make_chat(storage, 'alice', messages=23)
+    pages = _older_pages(storage, chat_id, 5)
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [content for page in reversed(pages) for content in page] == [f'message {i}' for i in range(23)]
+
+
+def test_newest_messages_come_with_a_cursor_for_older_ones(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=8)
+    chat = storage.get_chat_with_messages(chat_id, message_limit=3)
+    assert [m['content'] for m in chat['messages']] == ['message 5', 'message 6', 'message 7']
+    older = storage.get_chat_messages_page(chat_id, limit=10, before=chat['messages_cursor'])
+    assert [m['content'] for m in older['messages']] == [f'message {i}' for i in range(5)]
+    assert older['next_cursor'] is None
+
+
+def test_messages_since_returns_only_newer_ones(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=4)
+    last_seen = storage.get_chat_with_messages(chat_id)['messages'][-1]['id']
+    storage.add_message(chat_id, 'user', 'new 1')
+    storage.add_message(chat_id, 'assistant', 'new 2')
+
+    since = storage.get_chat_messages_since(chat_id, since_id=last_seen, limit=1)
+    assert [m['content'] for m in since['messages']] == ['new 1']
+    assert since['has_more']
+    since = storage.get_chat_messages_since(chat_id, since_id=since['messages'][-1]['id'])
+    assert [m['content'] for m in since['messages']] == ['new 2']
+    assert not since['has_more']
+
+
+def test_messages_since_unknown_id_is_rejected(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=1)
+    with pytest.raises(ValueError):
+        storage.get_chat_messages_since(chat_id, since_id='nope')
+    assert storage.get_chat_messages_page('missing') is None
+
+
+# ===== WRITE-BEHIND =====
+
+@pytest.fixture
+def queued_storage(tmp_path):
+    store = ChatStorage(str(tmp_path / "queued.db"), write_behind=True)
+    yield store
+    store.flush(5)
+    store.close()
+
+
+def _stored_count(storage, chat_id):
+    with storage._connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM messages WHERE chat_id = ?', (chat_id,)).fetchone()[0]
+
+
+def test_flush_commits_queued_messages(queued_storage, make_chat):
+    chat_id = make_chat(queued_storage, 'alice')
+    ids = [queued_storage.add_message(chat_id, 'user', f'queued {i}') for i in range(50)]
+    assert len(set(ids)) == 50
+    assert queued_storage.flush(5)
+    assert _stored_count(queued_storage, chat_id) == 50
+    assert queued_storage.writer.committed == 50
+    assert queued_storage.writer.failed == 0
+
+
+def test_reads_see_their_own_queued_writes(queued_storage, make_chat):
+    chat_id = make_chat(queued_storage, 'alice')
+    for i in range(5):
+        message_id = queued_storage.add_message(chat_id, 'user', f'queued {i}')
+        chat = queued_storage.get_chat_with_messages(chat_id)
+        assert chat['messages'][-1]['id'] == message_id
+        assert len(chat['messages']) == i + 1
+    page = queued_storage.get_chat_messages_page(chat_id, limit=2)
+    assert [m['content'] for m in page['messages']] == ['queued 3', 'queued 4']
+
+
+def test_queued_message_can_be_flagged_at_once(queued_storage, make_chat):
+    chat_id = make_chat(queued_storage, 'alice')
+    message_id = queued_storage.add_message(chat_id, 'user', 'hello')
+    assert queued_storage.flag_message(message_id, 'review')
+
+
+def test_invalid_role_fails_before_queueing(queued_storage, make_chat):
+    chat_id = make_chat(queued_storage, 'alice')
+    with pytest.raises(ValueError):
+        queued_storage.add_message(chat_id, 'robot', 'hello')
+    assert queued_storage.flush(5)
+    assert _stored_count(queued_storage, chat_id) == 0
+
+
+# ===== STATISTICS =====
+
+def _counted_statistics(storage):
+    """What the counters should say, counted the slow way"""
+    with storage._connection() as conn:
+        return {
+            'total_chats': conn.execute('SELECT COUNT(*) FROM chats').fetchone()[0],
+            'flagged_chats': conn.execute('SELECT COUNT(*) FROM chats WHERE is_flagged').fetchone()[0],
+            'total_messages': conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+                + conn.execute('SELECT COALESCE(SUM(message_count), 0) FROM chat_archive').fetchone()[0],
+            'flagged_messages': conn.execute('SELECT COUNT(*) FROM messages WHERE is_flagged').fetchone()[0],
+        }
+
+
+def _statistics(storage):
+    stats = storage.get_chat_statistics()
+    stats.pop('active_users')
+    return stats
+
+
+def test_statistics_follow_added_messages(storage, make_chat):
+    make_chat(storage, 'alice', messages=3)
+    chat_id = make_chat(storage, 'bob', messages=2)
+    storage.add_message(chat_id, 'user', 'flagged', is_flagged=True, flag_reason='test')
+    assert _statistics(storage) == _counted_statistics(storage) == {
+        'total_chats': 2, 'flagged_chats': 0, 'total_messages': 6, 'flagged_messages': 1}
+
+
+def test_statistics_follow_flagging(storage, make_chat):
+    chat_id = make_chat(storage, 'alice')
+    message_id = storage.add_message(chat_id, 'user', 'hello')
+    storage.flag_message(message_id, 'review')
+    storage.flag_chat(chat_id, 'review')
+    storage.flag_chat(chat_id, 'review again')
+    assert _statistics(storage) == _counted_statistics(storage)
+    assert _statistics(storage)['flagged_chats'] == 1
+    assert _statistics(storage)['flagged_messages'] == 1
+
+
+def test_statistics_follow_deleted_chats(storage, make_chat):
+    kept = make_chat(storage, 'alice', messages=2)
+    deleted = make_chat(storage, 'alice', messages=3)
+    storage.add_message(deleted, 'user', 'flagged', is_flagged=True, flag_reason='test')
+    storage.flag_chat(deleted, 'review')
+    assert storage.delete_chat(deleted, 'alice')
+    assert _statistics(storage) == _counted_statistics(storage) == {
+        'total_chats': 1, 'flagged_chats': 0, 'total_messages': 2, 'flagged_messages': 0}
+    assert storage.get_chat_with_messages(kept) is not None
+
+
+def test_deleting_someone_elses_chat_changes_nothing(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=2)
+    stats = _statistics(storage)
+    assert not storage.delete_chat(chat_id, 'bob')
+    assert _statistics(storage) == stats
+    assert len(storage.get_chat_with_messages(chat_id)['messages']) == 2
+
+
+def test_recount_agrees_with_the_triggers(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=4)
+    storage.flag_chat(chat_id, 'review')
+    before = _statistics(storage)
+    storage.recount_statistics()
+    assert _statistics(storage) == before
+
+
+# ===== SEARCH =====
+
+def test_search_finds_messages_by_words_and_prefix(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', title='Biology')
+    storage.add_message(chat_id, 'user', 'How does photosynthesis work in leaves?')
+    storage.add_message(chat_id, 'assistant', 'Chlorophyll absorbs light.')
+
+    results = storage.search_messages('photosynth')['results']
+    assert [r['snippet'] for r in results] == ['How does [photosynthesis] work in leaves?']
+    assert results[0]['chat_id'] == chat_id and results[0]['chat_title'] == 'Biology'
+    assert storage.search_messages('light chlorophyll')['results'][0]['role'] == 'assistant'
+    assert storage.search_messages('photosynthesis chlorophyll')['results'] == []
+
+
+def test_search_is_limited_to_the_users_chats(storage, make_chat):
+    for user in ('alice', 'bob'):
+        chat_id = make_chat(storage, user)
+        storage.add_message(chat_id, 'user', f'mitosis question from {user}')
+    assert len(storage.search_messages('mitosis')['results']) == 2
+    assert [r['user_id'] for r in storage.search_messages('mitosis', user_id='bob')['results']] == ['bob']
+
+
+def test_search_pages_and_follows_edits(storage, make_chat):
+    chat_id = make_chat(storage, 'alice')
+    for i in range(5):
+        storage.add_message(chat_id, 'user', f'entropy note {i}')
+    first = storage.search_messages('entropy', limit=3)
+    second = storage.search_messages('entropy', limit=3, cursor=first['next_cursor'])
+    ids = [r['message_id'] for r in first['results'] + second['results']]
+    assert len(ids) == len(set(ids)) == 5
+    assert second['next_cursor'] is None
+
+    storage.delete_chat(chat_id)
+    assert storage.search_messages('entropy')['results'] == []
+
+
+def test_search_syntax_in_queries_is_inert(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', title='Recursion and the call stack')
+    storage.add_message(chat_id, 'user', 'what is a base case')
+    assert len(storage.search_messages('base^ "case" (')['results']) == 1
+    assert [c['id'] for c in storage.search_chats('recurs')] == [chat_id]
+    with pytest.raises(ValueError):
+        storage.search_messages('  *** ')
+
+
+# ===== ARCHIVE =====
+
+def _age(storage, chat_id, days=400):
+    with storage._connection(write=True) as conn:
+        conn.execute("UPDATE chats SET updated_at = datetime('now', ?) WHERE id = ?", (f'-{days} days', chat_id))
+
+
+def _rowids(storage, chat_id):
+    with storage._connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT rowid, id FROM messages WHERE chat_id = ? ORDER BY rowid', (chat_id,)).fetchall()]
+
+
+def test_archive_keeps_reads_and_statistics(storage, make_chat):
+    cold = make_chat(storage, 'alice', messages=6)
+    make_chat(storage, 'alice', messages=2)
+    before = storage.get_chat_with_messages(cold)
+    stats = _statistics(storage)
+    _age(storage, cold)
+
+    result = storage.archive_chats(older_than_days=30)
+    assert (result['chats'], result['messages']) == (1, 6)
+    assert 0 < result['compressed_bytes'] < result['raw_bytes']
+    assert _rowids(storage, cold) == []
+    assert storage.get_chat_with_messages(cold)['messages'] == before['messages']
+    assert _statistics(storage) == stats == _counted_statistics(storage)
+    assert storage.get_archive_stats()['messages'] == 6
+
+
+def test_archived_chat_pages_like_a_hot_one(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=7)
+    hot = _older_pages(storage, chat_id, 3)
+    cursor = storage.get_chat_messages_page(chat_id, limit=3)['next_cursor']
+    _age(storage, chat_id)
+    storage.archive_chats(older_than_days=30)
+
+    assert _older_pages(storage, chat_id, 3) == hot
+    # A cursor handed out before archiving still continues where it left off
+    page = storage.get_chat_messages_page(chat_id, limit=3, before=cursor)
+    assert [m['content'] for m in page['messages']] == hot[1]
+
+
+def test_restore_keeps_rowids_and_counters(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=5)
+    rowids = _rowids(storage, chat_id)
+    stats = _statistics(storage)
+    _age(storage, chat_id)
+    storage.archive_chats(older_than_days=30)
+    assert storage.search_messages('message')['results'] == []
+
+    assert storage.restore_chat(chat_id)
+    assert not storage.restore_chat(chat_id)
+    assert _rowids(storage, chat_id) == rowids
+    assert _statistics(storage) == stats
+    assert _chat_row(storage, chat_id) == _recounted(storage, chat_id)
+    assert len(storage.search_messages('message')['results']) == 5
+
+
+def test_writing_to_an_archived_chat_restores_it(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=3)
+    _age(storage, chat_id)
+    storage.archive_chats(older_than_days=30)
+    storage.add_message(chat_id, 'user', 'back again')
+
+    assert storage.get_archive_stats()['chats'] == 0
+    assert [m['content'] for m in storage.get_chat_with_messages(chat_id)['messages']][-2:] == ['message 2', 'back again']
+    assert _statistics(storage) == _counted_statistics(storage)
+
+
+def test_deleting_an_archived_chat_updates_statistics(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=4)
+    make_chat(storage, 'bob', messages=1)
+    _age(storage, chat_id)
+    storage.archive_chats(older_than_days=30)
+
+    assert storage.delete_chat(chat_id)
+    assert storage.get_archive_stats()['chats'] == 0
+    assert _statistics(storage) == _counted_statistics(storage) == {
+        'total_chats': 1, 'flagged_chats': 0, 'total_messages': 1, 'flagged_messages': 0}
+
+
+def test_flagged_chats_stay_hot(storage, make_chat):
+    chat_id = make_chat(storage, 'alice', messages=2)
+    storage.flag_chat(chat_id, 'review')
+    _age(storage, chat_id)
+    assert storage.archive_chats(older_than_days=30)['chats'] == 0
+
+
+def test_failed_group_commit_keeps_the_good_rows(queued_storage, make_chat, monkeypatch):
+    chat_id = make_chat(queued_storage, 'alice')
+    insert = queued_storage._insert_messages
+
+    def insert_rejecting_bad(rows):
+        if any(row[3] == 'bad' for row in rows):
+            raise RuntimeError('constraint failed')
+        insert(rows)
+
+    monkeypatch.setattr(queued_storage, '_insert_messages', insert_rejecting_bad)
+    # Hold the writer off so all three land in one batch
+    with queued_storage._write_lock:
+        for content in ('before', 'bad', 'after'):
+            queued_storage.add_message(chat_id, 'user', content)
+    assert queued_storage.flush(5)
+
+    messages = queued_storage.get_chat_with_messages(chat_id)['messages']
+    assert [m['content'] for m in messages] == ['before', 'after']
+    assert queued_storage.writer.failed == 1
@@ -0,0 +1,99 @@
+# backend/tests/test_moderation.py - Compiled moderation rules
+import json
+
+import pytest
+
+import moderation
+from moderation import ModerationEngine, is_automatic_reason
+
+RULES = {
+    "keywords": [
+        {"term": "hack", "mode": "word", "forms": ["hacked", "hacking"]},
+        {"term": "cheat", "mode": "prefix"},
+        {"term": "xxx", "mode": "substring"},
+        "violence",
+    ]
+}
+
+
+@pytest.fixture
+def engine():
+    return ModerationEngine(RULES)
+
+
+@pytest.mark.parametrize("text", [
+    "Join our hackathon this weekend",
+    "The hacker news front page",       # not a listed form
+    "shack and whack",                  # inside other words
+    "Nonviolence is a principle",
+    "teacher's cheap tea",
+    "A plain question about cells",
+])
+def test_clean_text_passes(engine, text):
+    assert engine.check(text) == (False, None)
+
+
+@pytest.mark.parametrize("text, keyword", [
+    ("how do I hack the grader", "hack"),
+    ("HACK!", "hack"),
+    ("my account was hacked.", "hack"),   # a listed form reports its term
+    ("is it cheating to collaborate", "cheat"),
+    ("Cheaters never prosper", "cheat"),
+    ("file_xxx_final.pdf", "xxx"),
+    ("glorifying violence", "violence"),
+])
+def test_keywords_are_flagged(engine, text, keyword):
+    assert engine.check(text) == (True, f"Contains inappropriate keyword: {keyword}")
+
+
+def test_shouting_and_repetition(engine):
+    flagged, reason = engine.check("WHY IS THIS HOMEWORK SO HARD")
+    assert flagged and reason == "Excessive use of capital letters"
+    flagged, reason = engine.check("help help help help help help me")
+    assert flagged and reason == "Excessive repetition of word: help"
+    assert engine.check("Short SHOUT") == (False, None)
+
+
+def test_caps_counts_every_uppercase_character(engine):
+    # Mixed-case words count too, as in the original check
+    assert engine.check("HELLo WORLDS, WHAt IS GOINg ONNN") == (True, "Excessive use of capital letters")
+    assert engine.check("Photosynthesis In Green Plants") == (False, None)
+
+
+def test_repetition_is_case_sensitive_on_whitespace_words(engine):
+    assert engine.check("Spam spam SPAM! Eggs eggs EGGS bacon Bacon") == (False, None)
+    assert engine.check("no, no, no, no, no, no, stop") == (True, "Excessive repetition of word: no,")
+    # The first word to pass the limit is reported, not the most frequent one
+    flagged = engine.check("a b a b a b a b a b b a b")
+    assert flagged == (True, "Excessive repetition of word: b")
+
+
+def test_automatic_reasons_are_recognised(engine):
+    assert is_automatic_reason(engine.check("hack")[1])
+    assert not is_automatic_reason("Flagged by an admin")
+    assert not is_automatic_reason(None)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        ModerationEngine({"keywords": [{"term": "x", "mode": "fuzzy"}]})
+
+
+def test_shipped_rules_compile():
+    engine = ModerationEngine(moderation.load_rules())
+    assert engine.rule_count > 0
+    assert engine.check("Sign up for the hackathon")[0] is False
+    assert engine.check("I got hacked")[0] is True
+
+
+def test_rules_file_is_reloaded(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"keywords": ["plagiarism"]}))
+    reloader = moderation._Reloader(str(path))
+    assert reloader.engine().check("plagiarism")[0] is True
+
+    path.write_text(json.dumps({"keywords": ["copying"]}))
+    assert reloader.reload().check("plagiarism")[0] is False
+    # A broken file keeps the last good rules
+    path.write_text("{not json")
+    assert reloader.reload().check("copying")[0] is True
@@ -0,0 +1,94 @@
+# backend/tests/test_sharded_storage.py - ShardedChatStorage routing and fan-out merges
+import pytest
+
+from chat_storage import shard_index
+
+USERS = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank']
+
+
+def _spread_updated_at(sharded_storage, chat_ids):
+    # Pairs of chats share a second, so the id has to break ties across shards
+    order = {chat_id: i for i, chat_id in enumerate(chat_ids)}
+    for shard in sharded_storage.shards:
+        with shard._connection(write=True) as conn:
+            for chat_id in [row[0] for row in conn.execute('SELECT id FROM chats').fetchall()]:
+                conn.execute("UPDATE chats SET updated_at = datetime('2026-01-01', ?) WHERE id = ?",
+                             (f'+{order[chat_id] // 2} seconds', chat_id))
+
+
+def _newest_first(chats):
+    return [c['id'] for c in sorted(chats, key=lambda c: (c['updated_at'], c['id']), reverse=True)]
+
+
+def test_users_and_their_chats_live_on_one_shard(sharded_storage, make_chat):
+    for user in USERS:
+        chat_id = make_chat(sharded_storage, user, messages=2)
+        home = sharded_storage.shards[shard_index(user, 3)]
+        assert home.get_chat_with_messages(chat_id, user) is not None
+        others = [shard for shard in sharded_storage.shards if shard is not home]
+        assert all(shard.get_chat_with_messages(chat_id) is None for shard in others)
+    assert len({shard_index(user, 3) for user in USERS}) > 1
+
+
+def test_admin_pages_merge_newest_first_without_gaps(sharded_storage, make_chat):
+    chat_ids = [make_chat(sharded_storage, user) for user in USERS * 3]
+    _spread_updated_at(sharded_storage, chat_ids)
+    expected = _newest_first(sharded_storage.get_all_chats_for_admin(limit=100))
+    assert sorted(expected) == sorted(chat_ids)
+
+    paged, cursor = [], None
+    while True:
+        page = sharded_storage.get_admin_chats_page(4, cursor)
+        paged.extend(c['id'] for c in page['chats'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert paged == expected
+
+    offset_paged = [c['id'] for offset in range(0, 18, 5)
+                    for c in sharded_storage.get_all_chats_for_admin(limit=5, offset=offset)]
+    assert offset_paged == expected
+
+
+def test_search_merges_by_score(sharded_storage, make_chat):
+    for i, user in enumerate(USERS):
+        chat_id = make_chat(sharded_storage, user)
+        # More repetitions of the word score higher under BM25
+        sharded_storage.add_message(chat_id, 'user', ' '.join(['gravity'] * (i + 1) + ['filler'] * 10))
+
+    results = sharded_storage.search_messages('gravity', limit=4)
+    scores = [r['score'] for r in results['results']]
+    assert scores == sorted(scores, reverse=True)
+    rest = sharded_storage.search_messages('gravity', limit=4, cursor=results['next_cursor'])
+    assert rest['next_cursor'] is None
+    assert {r['user_id'] for r in results['results'] + rest['results']} == set(USERS)
+    assert [r['user_id'] for r in sharded_storage.search_messages('gravity', user_id='bob')['results']] == ['bob']
+
+
+def test_statistics_and_flags_add_up_across_shards(sharded_storage, make_chat):
+    for user in USERS:
+        chat_id = make_chat(sharded_storage, user, messages=2)
+        sharded_storage.flag_chat(chat_id, f'review {user}')
+    stats = sharded_storage.get_chat_statistics()
+    assert (stats['total_chats'], stats['total_messages'], stats['flagged_chats']) == (6, 12, 6)
+
+    flagged = sharded_storage.get_flagged_content(limit=4)['flagged_chats']
+    assert len(flagged) == 4
+    assert [c['updated_at'] for c in flagged] == sorted((c['updated_at'] for c in flagged), reverse=True)
+
+
+def test_chat_calls_find_the_owners_shard(sharded_storage, make_chat):
+    chat_id = make_chat(sharded_storage, 'carol')
+    sharded_storage._chat_shards.clear()  # as in a fresh worker
+    message_id = sharded_storage.add_message(chat_id, 'user', 'hello')
+    assert sharded_storage.flag_message(message_id, 'review')
+    assert sharded_storage.update_chat_title(chat_id, 'Renamed')
+    assert sharded_storage.get_chat_with_messages(chat_id)['title'] == 'Renamed'
+    assert sharded_storage.delete_chat(chat_id, 'carol')
+    assert sharded_storage.get_chat_with_messages(chat_id) is None
+
+
+def test_messages_for_unknown_chats_are_rejected(sharded_storage):
+    with pytest.raises(ValueError):
+        sharded_storage.add_message('chat_missing', 'user', 'hello')
+    assert sharded_storage.get_chat_statistics()['total_messages'] == 0
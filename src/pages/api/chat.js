@@ -1,4 +1,6 @@
 // src/pages/api/chat.js - CORRECTED VERSION
+import { randomUUID } from 'crypto';
+
 export default async function handler(req, res) {
   if (req.method !== 'POST') {
     res.setHeader('Allow', ['POST']);
@@ -15,13 +17,17 @@ export default async function handler(req, res) {
 
     // Forward the request to the Python Flask backend
     const backendUrl = process.env.RAG_BACKEND_URL || 'http://localhost:5001';
+    // Correlates this request's log lines here and in the backend
+    const requestId = req.headers['x-request-id'] || randomUUID();
+    res.setHeader('X-Request-ID', requestId);
     
-    console.log(`Forwarding chat request to: ${backendUrl}/chat`);
+    console.log(`Forwarding chat request ${requestId} to: ${backendUrl}/chat`);
     
     const response = await fetch(`${backendUrl}/chat`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-Request-ID': requestId,
       },
       body: JSON.stringify({
         message: message.trim(),
@@ -39,7 +45,13 @@ export default async function handler(req, res) {
 
     if (!response.ok) {
       const errorData = await response.json().catch(() => ({}));
-      console.error('Backend error:', errorData);
+      console.error(`Backend error (request ${requestId}):`, errorData);
+      
+      // Rate-limited (429) or overloaded (503): tell the client when to retry
+      const retryAfter = response.headers.get('retry-after');
+      if (retryAfter) {
+        res.setHeader('Retry-After', retryAfter);
+      }
       
       return res.status(response.status).json({
         error: errorData.error || 'Failed to get response from AI tutor',
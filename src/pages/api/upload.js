@@ -3,6 +3,7 @@ import formidable from 'formidable';
 import fs from 'fs';
 import fetch from 'node-fetch';
 import FormData from 'form-data';
+import { randomUUID } from 'crypto';
 
 export const config = {
   api: {
@@ -102,14 +103,17 @@ export default async function handler(req, res) {
 
     // Forward to Python backend
     const backendUrl = process.env.RAG_BACKEND_URL || 'http://localhost:5001';
-    console.log(`Forwarding to backend: ${backendUrl}/upload`);
+    // Correlates this request's log lines here and in the backend
+    const requestId = req.headers['x-request-id'] || randomUUID();
+    res.setHeader('X-Request-ID', requestId);
+    console.log(`Forwarding upload ${requestId} to backend: ${backendUrl}/upload`);
 
     let backendResponse;
     try {
       backendResponse = await fetch(`${backendUrl}/upload`, {
         method: 'POST',
         body: formData,
-        headers: formData.getHeaders(),
+        headers: { ...formData.getHeaders(), 'X-Request-ID': requestId },
       });
     } catch (fetchError) {
       console.error('Backend connection error:', fetchError);
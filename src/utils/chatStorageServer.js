@@ -52,6 +52,50 @@ export const loadChatWithMessages = async (chatId, userId, isAdmin = false) => {
   }
 };
 
+/**
+ * Load a page of a chat's messages: the newest `limit` before `cursor`
+ * (pass the returned nextCursor to load older messages)
+ */
+export const loadChatMessagesPage = async (chatId, userId, { limit = 50, cursor = null, isAdmin = false } = {}) => {
+  try {
+    const backendUrl = getBackendUrl();
+    const params = new URLSearchParams({ userId, limit: String(limit) });
+    if (cursor) params.append('before', cursor);
+    if (isAdmin) params.append('isAdmin', 'true');
+    
+    const response = await fetch(`${backendUrl}/api/chats/${chatId}/messages?${params}`);
+    if (!response.ok) {
+      throw new Error('Failed to load messages');
+    }
+    const data = await response.json();
+    return { messages: data.messages || [], nextCursor: data.nextCursor || null };
+  } catch (error) {
+    console.error('Error loading messages from server:', error);
+    return { messages: [], nextCursor: null };
+  }
+};
+
+/**
+ * Load only the messages newer than the last one the client already has
+ */
+export const loadNewChatMessages = async (chatId, userId, lastMessageId, isAdmin = false) => {
+  try {
+    const backendUrl = getBackendUrl();
+    const params = new URLSearchParams({ userId, since: lastMessageId });
+    if (isAdmin) params.append('isAdmin', 'true');
+    
+    const response = await fetch(`${backendUrl}/api/chats/${chatId}/messages?${params}`);
+    if (!response.ok) {
+      throw new Error('Failed to load new messages');
+    }
+    const data = await response.json();
+    return data.messages || [];
+  } catch (error) {
+    console.error('Error loading new messages from server:', error);
+    return [];
+  }
+};
+
 /**
  * Create a new chat on server
  */